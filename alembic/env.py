@@ -10,6 +10,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 # Importer la base et tous les modèles
 from app.database.database import Base
 from app.auth.models import User, Subscription, Payment, PasswordResetToken
+from app.chat.model import ChatSession
 
 # Configuration Alembic
 config = context.config
@@ -0,0 +1,93 @@
+"""
+Contrôle d admission du trafic chat (lié aux appels OpenAI).
+
+Au plus `max_concurrent` requêtes sont traitées en même temps ; les suivantes
+attendent dans une file bornée (`max_queue`), au plus `max_wait_seconds`.
+Au-delà, la requête est refusée tout de suite plutôt que d épuiser la limite
+de débit du fournisseur pour tout le monde :
+
+    - 429 quand la file est pleine (le client doit ralentir) ;
+    - 503 quand l attente dépasse `max_wait_seconds` (service saturé).
+
+Les deux portent un Retry-After estimé à partir de la durée moyenne de
+traitement et de la longueur de la file.
+"""
+import math
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from . import metrics
+
+_admitted = metrics.counter("chat_admission_admitted", "Requêtes chat admises")
+_rejected = metrics.counter("chat_admission_rejected", "Requêtes chat refusées (queue_full → 429, timeout → 503)")
+_active = metrics.gauge("chat_admission_active", "Requêtes chat en cours de traitement")
+_queue_depth = metrics.gauge("chat_admission_queue_depth", "Requêtes chat en attente d admission")
+_wait_ms = metrics.histogram("chat_admission_wait_ms", metrics.LATENCY_MS_BUCKETS, "Attente avant admission")
+
+# Poids de la dernière mesure dans la moyenne glissante de la durée de traitement
+_SERVICE_TIME_ALPHA = 0.1
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code: int, retry_after: int, reason: str):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent: int = 32, max_queue: int = 64, max_wait_seconds: float = 10.0):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait_seconds = max_wait_seconds
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._active = 0
+        self._waiting = 0
+        self._service_seconds = 2.0  # moyenne glissante, valeur initiale prudente
+
+    def retry_after(self) -> int:
+        """Secondes estimées avant qu une place se libère pour un nouvel arrivant."""
+        return max(1, math.ceil(self._service_seconds * (self._waiting + 1) / self.max_concurrent))
+
+    def check(self) -> None:
+        """Refus immédiat (429) si la file est pleine, sans prendre de place."""
+        if self._semaphore.locked() and self._waiting >= self.max_queue:
+            _rejected.inc(label="queue_full")
+            raise AdmissionRejected(429, self.retry_after(), "Trop de demandes en attente")
+
+    async def acquire(self) -> None:
+        self.check()
+        self._waiting += 1
+        _queue_depth.set(self._waiting)
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.max_wait_seconds)
+        except asyncio.TimeoutError:
+            _rejected.inc(label="timeout")
+            raise AdmissionRejected(503, self.retry_after(), "Service saturé, réessayez plus tard")
+        finally:
+            self._waiting -= 1
+            _queue_depth.set(self._waiting)
+            _wait_ms.observe((time.perf_counter() - started) * 1000)
+        self._active += 1
+        _active.set(self._active)
+        _admitted.inc()
+
+    def release(self, service_seconds: float) -> None:
+        self._active -= 1
+        _active.set(self._active)
+        self._service_seconds += _SERVICE_TIME_ALPHA * (service_seconds - self._service_seconds)
+        self._semaphore.release()
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Place de traitement ; lève AdmissionRejected si la requête est refusée."""
+        await self.acquire()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - started)
@@ -0,0 +1,233 @@
+"""
+Types d index FAISS pour le RAG (recherche exacte ou approchée).
+
+    flat      exhaustif, exact (défaut)
+    ivf_flat  partitionné en `nlist` listes, `nprobe` listes visitées
+    hnsw      graphe HNSW (`hnsw_m` voisins, `ef_search` à la recherche)
+    ivf_pq    IVF + codes PQ (`pq_m` sous-vecteurs de `pq_nbits` bits)
+
+Stockage des vecteurs (flat, ivf_flat, hnsw) : float32, fp16 (÷2) ou int8
+(÷4) via les scalar quantizers de FAISS. Une passe de re-scoring optionnelle
+recalcule en float32 le score des `rescore_factor × k` meilleurs candidats à
+partir d un fichier de vecteurs mmappé (lu à la demande, hors RSS privée).
+
+Les paramètres d entraînement sont consignés dans le manifest du shard ; un
+changement de paramètres de construction entraîne une reconstruction, les
+paramètres de recherche (`nprobe`, `ef_search`) s appliquent au chargement.
+
+Ce module n importe rien de `app.chat` (utilisable seul par les benchmarks).
+"""
+import os
+from dataclasses import dataclass, asdict, replace
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+INDEX_KINDS = ("flat", "ivf_flat", "hnsw", "ivf_pq")
+STORAGE_TYPES = ("float32", "fp16", "int8")
+_SQ_CODES = {"fp16": "SQfp16", "int8": "SQ8"}
+
+# k-means de FAISS : en dessous de 39 points par centroïde, l entraînement est dégradé
+MIN_POINTS_PER_CENTROID = 39
+# Échantillon pour estimer les bornes min/max du quantizer int8
+SQ_TRAIN_POINTS = 10_000
+
+
+@dataclass(frozen=True)
+class IndexSpec:
+    kind: str = "flat"
+    nlist: int = 256
+    nprobe: int = 16
+    hnsw_m: int = 32
+    ef_construction: int = 200
+    ef_search: int = 64
+    pq_m: int = 48
+    pq_nbits: int = 8
+    train_size: int = 0  # 0 = automatique (MIN_POINTS_PER_CENTROID × centroïdes)
+    storage: str = "float32"
+    rescore: bool = False
+    rescore_factor: int = 4
+
+    def __post_init__(self):
+        if self.kind not in INDEX_KINDS:
+            raise ValueError(f"Type d index inconnu: {self.kind} (attendu: {', '.join(INDEX_KINDS)})")
+        if self.storage not in STORAGE_TYPES:
+            raise ValueError(f"Stockage inconnu: {self.storage} (attendu: {', '.join(STORAGE_TYPES)})")
+
+    @classmethod
+    def from_env(cls) -> "IndexSpec":
+        return cls(
+            kind=os.getenv("RAG_INDEX_TYPE", "flat").strip().lower(),
+            nlist=int(os.getenv("RAG_IVF_NLIST", "256")),
+            nprobe=int(os.getenv("RAG_IVF_NPROBE", "16")),
+            hnsw_m=int(os.getenv("RAG_HNSW_M", "32")),
+            ef_construction=int(os.getenv("RAG_HNSW_EF_CONSTRUCTION", "200")),
+            ef_search=int(os.getenv("RAG_HNSW_EF_SEARCH", "64")),
+            pq_m=int(os.getenv("RAG_PQ_M", "48")),
+            pq_nbits=int(os.getenv("RAG_PQ_NBITS", "8")),
+            train_size=int(os.getenv("RAG_INDEX_TRAIN_SIZE", "0")),
+            storage=os.getenv("RAG_INDEX_STORAGE", "float32").strip().lower(),
+            rescore=os.getenv("RAG_INDEX_RESCORE", "false").lower() in ("1", "true", "yes"),
+            rescore_factor=int(os.getenv("RAG_INDEX_RESCORE_FACTOR", "4")),
+        )
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "IndexSpec":
+        known = {k: v for k, v in data.items() if k in cls.__dataclass_fields__}
+        return cls(**known)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    def build_params(self) -> dict:
+        """Paramètres qui déterminent le contenu de l index (hors paramètres de recherche)."""
+        params = {"kind": self.kind}
+        if self.kind in ("ivf_flat", "ivf_pq"):
+            params["nlist"] = self.nlist
+        if self.kind == "hnsw":
+            params.update(hnsw_m=self.hnsw_m, ef_construction=self.ef_construction)
+        if self.kind == "ivf_pq":
+            params.update(pq_m=self.pq_m, pq_nbits=self.pq_nbits)
+        elif self.storage != "float32":
+            params["storage"] = self.storage
+        return params
+
+    def with_search_params(self, other: "IndexSpec") -> "IndexSpec":
+        """Paramètres de construction de `self`, paramètres de recherche de `other`."""
+        return replace(self, nprobe=other.nprobe, ef_search=other.ef_search,
+                       rescore=other.rescore, rescore_factor=other.rescore_factor)
+
+    @property
+    def is_quantized(self) -> bool:
+        return self.kind == "ivf_pq" or self.storage != "float32"
+
+    @property
+    def needs_training(self) -> bool:
+        return self.kind in ("ivf_flat", "ivf_pq") or (self.storage == "int8" and self.kind != "ivf_pq")
+
+    def min_train_points(self) -> int:
+        """Nombre de vecteurs à accumuler avant d entraîner l index."""
+        if not self.needs_training:
+            return 0
+        if self.kind not in ("ivf_flat", "ivf_pq"):
+            return self.train_size or SQ_TRAIN_POINTS
+        centroids = self.nlist
+        if self.kind == "ivf_pq":
+            centroids = max(centroids, 2 ** self.pq_nbits)
+        return self.train_size or MIN_POINTS_PER_CENTROID * centroids
+
+    def fitted(self, n_vectors: int) -> "IndexSpec":
+        """
+        Ajuste le type au volume réel : un petit shard n a pas assez de vecteurs
+        pour entraîner `nlist` centroïdes (ou le codebook PQ), et une recherche
+        exhaustive y est de toute façon rapide.
+        """
+        if self.kind not in ("ivf_flat", "ivf_pq"):
+            return self
+        if self.kind == "ivf_pq" and n_vectors < MIN_POINTS_PER_CENTROID * 2 ** self.pq_nbits:
+            return replace(self, kind="flat")
+        nlist = min(self.nlist, n_vectors // MIN_POINTS_PER_CENTROID)
+        if nlist < 2:
+            return replace(self, kind="flat")
+        return replace(self, nlist=nlist)
+
+    def factory_string(self) -> str:
+        codes = _SQ_CODES.get(self.storage)
+        if self.kind == "ivf_flat":
+            return f"IVF{self.nlist},{codes or 'Flat'}"
+        if self.kind == "hnsw":
+            return f"HNSW{self.hnsw_m}" + (f"_{codes}" if codes else "")
+        if self.kind == "ivf_pq":
+            return f"IVF{self.nlist},PQ{self.pq_m}x{self.pq_nbits}"
+        return codes or "Flat"
+
+
+def new_index(spec: IndexSpec, dim: int):
+    """Index vide (produit scalaire = cosinus sur vecteurs normalisés)."""
+    import faiss
+
+    index = faiss.index_factory(dim, spec.factory_string(), faiss.METRIC_INNER_PRODUCT)
+    if spec.kind == "hnsw":
+        index.hnsw.efConstruction = spec.ef_construction
+    apply_search_params(index, spec)
+    return index
+
+
+def apply_search_params(index, spec: IndexSpec) -> None:
+    """Applique nprobe / efSearch selon le type effectif de l index."""
+    import faiss
+
+    if index is None:
+        return
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = max(1, min(spec.nprobe, ivf.nlist))
+    inner = faiss.downcast_index(index)
+    if hasattr(inner, "hnsw"):
+        inner.hnsw.efSearch = spec.ef_search
+
+
+def search(index, query_embedding: np.ndarray, top_k: int, spec: IndexSpec,
+           vectors: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Recherche top-k. Si `vectors` (float32, mmappé) est fourni et que le
+    re-scoring est actif, `rescore_factor × top_k` candidats sont rapatriés
+    puis reclassés avec leur score exact. Retourne (scores, ids) à une ligne.
+    """
+    if vectors is None or not spec.rescore or spec.rescore_factor <= 1:
+        return index.search(query_embedding, top_k)
+
+    n_candidates = min(top_k * spec.rescore_factor, index.ntotal)
+    _, candidates = index.search(query_embedding, n_candidates)
+    candidates = np.sort(candidates[0][candidates[0] >= 0])  # lectures mmap dans l ordre du fichier
+    exact = vectors[candidates] @ query_embedding[0]
+    order = np.argsort(-exact)[:top_k]
+    return exact[order].reshape(1, -1), candidates[order].reshape(1, -1)
+
+
+class IndexBuilder:
+    """
+    Construction en flux. Les types IVF (et le stockage int8) doivent être
+    entraînés avant le premier ajout : les premiers lots sont gardés en mémoire jusqu à
+    `min_train_points()` vecteurs (mémoire bornée), puis l index est entraîné
+    et la suite est ajoutée directement.
+    """
+
+    def __init__(self, spec: IndexSpec):
+        self.spec = spec
+        self.index = None
+        self._pending: List[np.ndarray] = []
+        self._pending_count = 0
+
+    @property
+    def ntotal(self) -> int:
+        return (self.index.ntotal if self.index is not None else 0) + self._pending_count
+
+    def add(self, embeddings: np.ndarray) -> None:
+        if len(embeddings) == 0:
+            return
+        if self.index is not None:
+            self.index.add(embeddings)
+            return
+        if not self.spec.needs_training:
+            self.index = new_index(self.spec, embeddings.shape[1])
+            self.index.add(embeddings)
+            return
+        self._pending.append(np.ascontiguousarray(embeddings, dtype="float32"))
+        self._pending_count += len(embeddings)
+        if self._pending_count >= self.spec.min_train_points():
+            self._train(self.spec)
+
+    def _train(self, spec: IndexSpec) -> None:
+        vectors = np.vstack(self._pending)
+        self._pending, self._pending_count = [], 0
+        self.index = new_index(spec, vectors.shape[1])
+        self.index.train(vectors)
+        self.index.add(vectors)
+        self.spec = spec
+
+    def finish(self) -> Tuple[Optional[object], IndexSpec]:
+        """Retourne (index, paramètres effectivement utilisés)."""
+        if self.index is None and self._pending:
+            self._train(self.spec.fitted(self._pending_count))
+        return self.index, self.spec
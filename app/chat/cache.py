@@ -0,0 +1,156 @@
+"""
+Cache de réponses devant chat() : correspondance exacte (message normalisé +
+empreinte de l historique) puis correspondance sémantique via l embedding
+MiniLM déjà calculé pour le RAG.
+"""
+import re
+import json
+import time
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+def normalize_message(text: str) -> str:
+    """Normalise un message pour la clé exacte (casse, espaces, ponctuation finale)."""
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    text = re.sub(r"\s+", " ", text)
+    return text.strip(" \t\n?!.…")
+
+
+def history_fingerprint(history: List[Dict[str, str]]) -> str:
+    """Empreinte stable de l historique (rôle + contenu normalisé)."""
+    normalized = [(m.get("role", ""), normalize_message(m.get("content") or "")) for m in history]
+    return hashlib.sha1(json.dumps(normalized, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CacheEntry:
+    response: str
+    history_fp: str
+    embedding: Optional[np.ndarray]
+    created_at: float
+
+
+class ResponseCache:
+    """LRU + TTL borné en taille, avec compteurs de hits/misses."""
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 3600,
+                 similarity_threshold: float = 0.95, enabled: bool = True):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.enabled = enabled
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {
+            "hits_exact": 0,
+            "hits_semantic": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+        }
+
+    @staticmethod
+    def _key(user_message: str, history_fp: str) -> str:
+        raw = f"{history_fp}\x00{normalize_message(user_message)}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def _expired(self, entry: CacheEntry, now: float) -> bool:
+        return now - entry.created_at > self.ttl_seconds
+
+    def _purge_expired(self, now: float) -> None:
+        expired = [k for k, e in self._entries.items() if self._expired(e, now)]
+        for k in expired:
+            del self._entries[k]
+        self.stats["expirations"] += len(expired)
+
+    def get(self, user_message: str, history: List[Dict[str, str]],
+            query_embedding: Optional[np.ndarray] = None) -> Optional[str]:
+        """Retourne une réponse en cache, ou None (compté comme miss)."""
+        if not self.enabled:
+            return None
+
+        history_fp = history_fingerprint(history)
+        key = self._key(user_message, history_fp)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if self._expired(entry, now):
+                    del self._entries[key]
+                    self.stats["expirations"] += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self.stats["hits_exact"] += 1
+                    return entry.response
+
+            if query_embedding is not None:
+                best_key, best_score = self._best_semantic_match(history_fp, query_embedding, now)
+                if best_key is not None and best_score >= self.similarity_threshold:
+                    self._entries.move_to_end(best_key)
+                    self.stats["hits_semantic"] += 1
+                    print(f"🧠 Cache sémantique: similarité {best_score:.3f}")
+                    return self._entries[best_key].response
+
+            self.stats["misses"] += 1
+            return None
+
+    def _best_semantic_match(self, history_fp: str, query_embedding: np.ndarray, now: float):
+        keys, vectors = [], []
+        for k, e in self._entries.items():
+            if e.embedding is not None and e.history_fp == history_fp and not self._expired(e, now):
+                keys.append(k)
+                vectors.append(e.embedding)
+        if not keys:
+            return None, 0.0
+        # Les embeddings sont normalisés L2 : produit scalaire = cosinus
+        scores = np.vstack(vectors) @ np.asarray(query_embedding, dtype="float32").reshape(-1)
+        best = int(np.argmax(scores))
+        return keys[best], float(scores[best])
+
+    def put(self, user_message: str, history: List[Dict[str, str]], response: str,
+            query_embedding: Optional[np.ndarray] = None) -> None:
+        if not self.enabled or not response:
+            return
+
+        history_fp = history_fingerprint(history)
+        key = self._key(user_message, history_fp)
+        embedding = None
+        if query_embedding is not None:
+            embedding = np.asarray(query_embedding, dtype="float32").reshape(-1)
+
+        with self._lock:
+            now = time.time()
+            self._entries[key] = CacheEntry(response, history_fp, embedding, now)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_entries:
+                self._purge_expired(now)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def invalidate(self, reason: str = "") -> None:
+        """Vide tout le cache (à appeler quand l index RAG ou le prompt change)."""
+        with self._lock:
+            self._entries.clear()
+            self.stats["invalidations"] += 1
+        print(f"🧹 Cache de réponses invalidé{f' ({reason})' if reason else ''}")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            hits = self.stats["hits_exact"] + self.stats["hits_semantic"]
+            total = hits + self.stats["misses"]
+            return {
+                **self.stats,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hit_rate": round(hits / total, 4) if total else 0.0,
+            }
@@ -0,0 +1,43 @@
+"""
+Coalescence des requêtes identiques en cours (single-flight).
+
+Quand beaucoup d utilisateurs envoient le même premier message au même
+moment (campagne de notifications), une seule exécution a lieu : les
+requêtes arrivées pendant qu elle est en cours attendent son résultat au lieu
+de relancer embedding, recherche FAISS et complétion. Le cache de réponses
+prend ensuite le relais pour les requêtes suivantes.
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, TypeVar
+
+from . import metrics
+
+T = TypeVar("T")
+
+_leaders = metrics.counter("chat_singleflight_leaders", "Requêtes exécutées (premières de leur groupe)")
+_coalesced = metrics.counter("chat_singleflight_coalesced", "Requêtes servies par une exécution identique déjà en cours")
+_in_flight = metrics.gauge("chat_singleflight_in_flight", "Exécutions partageables en cours")
+
+
+class SingleFlight:
+    def __init__(self):
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    async def run(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """Résultat de `fn()`, partagé avec les appels de même clé pendant son exécution."""
+        task = self._tasks.get(key)
+        if task is None:
+            _leaders.inc()
+            task = asyncio.get_running_loop().create_task(fn())
+            self._tasks[key] = task
+            _in_flight.set(len(self._tasks))
+            task.add_done_callback(lambda _: self._forget(key, task))
+        else:
+            _coalesced.inc()
+        # shield : un client qui abandonne n annule pas l exécution des autres
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        _in_flight.set(len(self._tasks))
@@ -0,0 +1,177 @@
+"""
+Assemblage du contexte RAG sous un budget de tokens.
+
+Les chunks candidats (triés par score) sont filtrés puis ajoutés
+gloutonnement :
+
+    - seuil relatif : un chunk dont le score est sous `min_score_ratio` × le
+      meilleur score est écarté (le nombre de chunks s adapte à la query).
+      Le seuil est pensé pour des scores cosinus : en recherche hybride, il
+      s applique au classement dense avant la fusion (`above_score_ratio`),
+      les scores RRF ne servant qu à ordonner ;
+    - déduplication : un chunk dont les termes sont presque tous contenus dans
+      un chunk déjà retenu (recouvrement entre chunks voisins, doublons entre
+      documents) est écarté ;
+    - remplissage : un chunk trop long pour le budget restant est sauté, les
+      suivants, plus courts, peuvent encore entrer.
+
+Les tokens sont comptés avec le tokenizer du modèle de chat (tiktoken,
+o200k_base pour gpt-4o-mini). Le nombre de tokens de chaque chunk est calculé
+à l indexation (`{base}_tokens.npz`) ; seuls les en-têtes sont comptés ici.
+"""
+import os
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .index_store import DocumentChunk
+from .lexical import tokenize
+
+# Encodage tiktoken du modèle de chat (gpt-4o-mini → o200k_base)
+TOKEN_ENCODING = os.getenv("RAG_TOKEN_ENCODING", "o200k_base")
+# Estimation utilisée si l encodage est indisponible (fichier BPE non téléchargeable)
+APPROX_ENCODING = "approx-4-chars"
+
+CONTEXT_SEPARATOR = "\n---\n"
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(TOKEN_ENCODING)
+    except Exception as e:
+        print(f"⚠️ Encodage {TOKEN_ENCODING} indisponible ({type(e).__name__}) : tokens estimés à 4 caractères")
+        return None
+
+
+def encoding_name() -> str:
+    """Encodage réellement utilisé pour compter (enregistré avec les comptes)."""
+    return TOKEN_ENCODING if _encoding() is not None else APPROX_ENCODING
+
+
+def count_tokens(text: str) -> int:
+    encoding = _encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode_ordinary(text))
+
+
+def count_tokens_batch(texts: Sequence[str]) -> List[int]:
+    encoding = _encoding()
+    if encoding is None:
+        return [(len(text) + 3) // 4 for text in texts]
+    return [len(ids) for ids in encoding.encode_ordinary_batch(list(texts))]
+
+
+# ── Comptes de tokens par chunk (calculés à l indexation) ────────────────────
+
+def token_counts_path(base_path: Union[str, Path]) -> Path:
+    return Path(f"{base_path}_tokens.npz")
+
+
+def save_token_counts(path: Union[str, Path], counts: Sequence[int]) -> None:
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp.npz")
+    np.savez(tmp_path, encoding=np.array(encoding_name()), counts=np.asarray(counts, dtype="<u4"))
+    tmp_path.replace(path)
+
+
+def load_token_counts(path: Union[str, Path]) -> Optional[np.ndarray]:
+    """Comptes du fichier, ou None s il manque ou vient d un autre encodage."""
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            if str(data["encoding"]) != encoding_name():
+                return None
+            return data["counts"]
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+# ── Assemblage ───────────────────────────────────────────────────────────────
+
+def format_chunk(chunk: DocumentChunk) -> str:
+    return f"[{chunk.title} - Page {chunk.page_number}]\n{chunk.content}\n"
+
+
+def chunk_tokens(chunk: DocumentChunk) -> int:
+    """Tokens du bloc formaté (compte précalculé du contenu + en-tête)."""
+    if not chunk.token_count:
+        return count_tokens(format_chunk(chunk))
+    return chunk.token_count + count_tokens(f"[{chunk.title} - Page {chunk.page_number}]\n\n")
+
+
+def _containment(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+
+@dataclass
+class PackedContext:
+    text: str
+    chunks: List[DocumentChunk] = field(default_factory=list)
+    tokens: int = 0
+    # Tokens de tous les candidats distincts, si on les avait tous envoyés
+    candidate_tokens: int = 0
+    dropped_low_score: int = 0
+    dropped_duplicates: int = 0
+    dropped_budget: int = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(self.candidate_tokens - self.tokens, 0)
+
+
+def above_score_ratio(candidates: Sequence[Tuple[DocumentChunk, float]],
+                      min_score_ratio: float) -> List[Tuple[DocumentChunk, float]]:
+    """Candidats dont le score (cosinus) atteint `min_score_ratio` × le meilleur."""
+    best_score = max((score for _, score in candidates), default=0.0)
+    if best_score <= 0:
+        return list(candidates)
+    return [(chunk, score) for chunk, score in candidates if score >= min_score_ratio * best_score]
+
+
+def pack_context(candidates: Sequence[Tuple[DocumentChunk, float]], max_tokens: int,
+                 min_score_ratio: float = 0.0, dedup_threshold: float = 0.8) -> PackedContext:
+    """Sélectionne et assemble les candidats (triés par score décroissant) sous `max_tokens`."""
+    packed = PackedContext(text="")
+    if not candidates:
+        return packed
+
+    separator_tokens = count_tokens(CONTEXT_SEPARATOR)
+    best_score = candidates[0][1]
+    kept_terms: List[frozenset] = []
+    seen = set()
+    parts = []
+
+    for chunk, score in candidates:
+        key = (chunk.document_id, chunk.chunk_id)
+        if key in seen:
+            continue
+        seen.add(key)
+
+        cost = chunk_tokens(chunk) + (separator_tokens if parts else 0)
+        packed.candidate_tokens += cost
+
+        if best_score > 0 and score < min_score_ratio * best_score:
+            packed.dropped_low_score += 1
+            continue
+        terms = frozenset(tokenize(chunk.content))
+        if any(_containment(terms, other) >= dedup_threshold for other in kept_terms):
+            packed.dropped_duplicates += 1
+            continue
+        if packed.tokens + cost > max_tokens:
+            packed.dropped_budget += 1
+            continue
+
+        parts.append(format_chunk(chunk))
+        packed.chunks.append(chunk)
+        packed.tokens += cost
+        kept_terms.append(terms)
+
+    packed.text = CONTEXT_SEPARATOR.join(parts)
+    return packed
@@ -2,359 +2,491 @@
 Centralise la configuration commune au module chat avec RAG.
 """
 import os
-import json
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI
 from pypdf import PdfReader
 import numpy as np
-from sentence_transformers import SentenceTransformer
-import faiss
-from typing import List, Dict, Tuple
-from dataclasses import dataclass
+from typing import List, Dict, Tuple, Optional
+from . import metrics
+from .cache import ResponseCache
+from .sessions import SessionStore
+from .notifications import NotificationQueue
+from .admission import AdmissionController
+from .llm import CircuitBreaker, ResilientLLM
+from .index_store import DocumentChunk
+from .embeddings import QueryEmbedder
+from .embedding_backends import create_backend
+from .context_packing import above_score_ratio, pack_context
+from .greetings import PRESENTATION_MESSAGES
+from .lexical import corpus_stats, reciprocal_rank_fusion
+from .query_detection import detect_query_theme, is_greeting_or_intro
+from .topic_classifier import TopicClassifier
+from .indexing import (
+    EMBEDDING_MODEL_NAME,
+    RAGShard,
+    discover_documents,
+    document_id_for,
+    merge_results,
+    orphan_shards,
+    remove_shard_files,
+    split_id_collisions,
+    sync_shard,
+)
 
 # ── Configuration générale ─────────────────────────────────────────────────────
 load_dotenv(override=True)
 BASE_DIR = Path(__file__).resolve().parent.parent
 STATIC_DIR = BASE_DIR / "static" / "document"
 PDF_PATH = STATIC_DIR / "specpense.pdf"
+DOCUMENTS_DIR = Path(os.getenv("RAG_DOCUMENTS_DIR", str(STATIC_DIR)))
+RAG_SHARDS_DIR = Path(os.getenv("RAG_SHARDS_DIR", str(BASE_DIR / "rag_shards")))
+# Ancien index unique : ses vecteurs amorcent les caches des shards
+LEGACY_INDEX_PATH = BASE_DIR / "rag_index"
+RAG_ADMIN_TOKEN = os.getenv("RAG_ADMIN_TOKEN")
+# Backend d embedding : sentence-transformers, onnx ou onnx-int8
+EMBEDDING_BACKEND = os.getenv("RAG_EMBEDDING_BACKEND", "sentence-transformers")
+ONNX_MODEL_DIR = Path(os.getenv("RAG_ONNX_MODEL_DIR", str(BASE_DIR / "models" / "all-MiniLM-L6-v2-onnx")))
 
 # ── Clients externes ───────────────────────────────────────────────────────────
-openai_client = OpenAI()
+# Reprises gérées par LLM (llm.py) et non par le SDK : pas de reprises cachées
+openai_client = AsyncOpenAI(max_retries=0)
 PUSHOVER_USER = os.getenv("PUSHOVER_USER")
 PUSHOVER_TOKEN = os.getenv("PUSHOVER_TOKEN")
 PUSHOVER_URL = "https://api.pushover.net/1/messages.json"
+# Envoi en tâche de fond : les tools ne font que déposer leur message
+NOTIFICATIONS = NotificationQueue(
+    PUSHOVER_URL,
+    PUSHOVER_USER,
+    PUSHOVER_TOKEN,
+    spill_path=Path(os.getenv("PUSHOVER_SPILL_PATH", str(BASE_DIR / "notifications_spill.jsonl"))),
+    max_size=int(os.getenv("PUSHOVER_QUEUE_SIZE", "1000")),
+    digest_window=float(os.getenv("PUSHOVER_DIGEST_WINDOW_SECONDS", "2")),
+    max_retries=int(os.getenv("PUSHOVER_MAX_RETRIES", "5")),
+)
+
+# ── Exécuteur borné pour le travail CPU (embeddings + FAISS) ──────────────────
+# Les appels encode() / index.search sont bloquants : on les
+# sort de la boucle asyncio, avec un nombre de threads limité pour ne pas
+# saturer un petit serveur.
+RAG_EXECUTOR_WORKERS = int(os.getenv("RAG_EXECUTOR_WORKERS", "2"))
+RAG_EXECUTOR = ThreadPoolExecutor(max_workers=RAG_EXECUTOR_WORKERS, thread_name_prefix="rag")
+
+# ── Récupération du contexte (dense ou hybride dense + BM25) ─────────────────
+# hybrid : fusion RRF des classements FAISS et BM25 ; dense : FAISS seul
+RAG_RETRIEVAL_MODE = os.getenv("RAG_RETRIEVAL_MODE", "hybrid").strip().lower()
+# Candidats soumis à l assemblage ; le budget et le seuil décident combien entrent
+RAG_CONTEXT_TOP_K = int(os.getenv("RAG_CONTEXT_TOP_K", "6"))
+# Budget de tokens du contexte, seuil relatif au meilleur score, déduplication
+RAG_CONTEXT_MAX_TOKENS = int(os.getenv("RAG_CONTEXT_MAX_TOKENS", "1500"))
+RAG_CONTEXT_MIN_SCORE_RATIO = float(os.getenv("RAG_CONTEXT_MIN_SCORE_RATIO", "0.5"))
+RAG_CONTEXT_DEDUP_THRESHOLD = float(os.getenv("RAG_CONTEXT_DEDUP_THRESHOLD", "0.8"))
+# Candidats de chaque classement avant fusion, et constante k de la RRF
+RAG_HYBRID_CANDIDATES = int(os.getenv("RAG_HYBRID_CANDIDATES", "20"))
+RAG_RRF_K = int(os.getenv("RAG_RRF_K", "60"))
+# Classifieur local hors sujet (centroïdes MiniLM) : au-delà du seuil de
+# confiance, la phrase de refus est servie sans RAG ni appel OpenAI
+RAG_OFFTOPIC_CLASSIFIER = os.getenv("RAG_OFFTOPIC_CLASSIFIER", "true").strip().lower() in ("1", "true", "yes")
+RAG_OFFTOPIC_THRESHOLD = float(os.getenv("RAG_OFFTOPIC_THRESHOLD", "0.8"))
+
+# ── Encodage des queries (cache LRU + micro-batching) ────────────────────────
+QUERY_EMBED_CACHE_SIZE = int(os.getenv("QUERY_EMBED_CACHE_SIZE", "2048"))
+QUERY_EMBED_MAX_BATCH = int(os.getenv("QUERY_EMBED_MAX_BATCH", "16"))
+QUERY_EMBED_MAX_WAIT_MS = float(os.getenv("QUERY_EMBED_MAX_WAIT_MS", "5"))
+
+async def run_in_rag_executor(fn, *args):
+    """Exécute une fonction bloquante dans l exécuteur RAG sans bloquer la boucle."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(RAG_EXECUTOR, fn, *args)
+
+_context_tokens = metrics.histogram(
+    "rag_context_tokens", (0, 250, 500, 750, 1000, 1500, 2000, 3000), "Tokens du contexte RAG par prompt"
+)
+_context_tokens_saved = metrics.counter(
+    "rag_context_tokens_saved", "Tokens de candidats écartés (seuil, doublons, budget)"
+)
 
 # ── Système RAG ────────────────────────────────────────────────────────────────
 
-@dataclass
-class DocumentChunk:
-    content: str
-    page_number: int
-    chunk_id: int
-
 class SimpleRAG:
-    """Version simplifiée du système RAG pour ton cas d usage."""
+    """
+    Corpus RAG : un shard FAISS par document de `document_dir`. Les requêtes
+    interrogent tous les shards et fusionnent les meilleurs résultats.
+    """
     
-    def __init__(self, pdf_path: str):
-        self.pdf_path = pdf_path
-        self.chunks: List[DocumentChunk] = []
-        self.embeddings = None
-        self.index = None
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-        
-    def extract_and_chunk_pdf(self, chunk_size: int = 400) -> List[DocumentChunk]:
-        """Extrait et découpe le PDF en chunks."""
-        reader = PdfReader(self.pdf_path)
-        chunks = []
-        chunk_id = 0
-        
-        for page_num, page in enumerate(reader.pages):
-            text = page.extract_text() or ""
-            words = text.split()
-            
-            # Découpage en chunks
-            for i in range(0, len(words), chunk_size):
-                chunk_words = words[i:i + chunk_size]
-                chunk_content = " ".join(chunk_words)
-                
-                if len(chunk_content.strip()) > 50:  # Éviter les chunks trop petits
-                    chunk = DocumentChunk(
-                        content=chunk_content,
-                        page_number=page_num + 1,
-                        chunk_id=chunk_id
-                    )
-                    chunks.append(chunk)
-                    chunk_id += 1
-        
-        self.chunks = chunks
-        return chunks
+    def __init__(self, document_dir: str, shards_dir: str):
+        self.document_dir = Path(document_dir)
+        self.shards_dir = Path(shards_dir)
+        self.shards: Dict[str, RAGShard] = {}
+        self.embedding_backend = create_backend(EMBEDDING_BACKEND, EMBEDDING_MODEL_NAME, ONNX_MODEL_DIR)
+        print(f"🧠 Backend d embedding: {self.embedding_backend.name}")
+        self.query_embedder = QueryEmbedder(
+            self._encode_queries,
+            cache_size=QUERY_EMBED_CACHE_SIZE,
+            max_batch_size=QUERY_EMBED_MAX_BATCH,
+            max_wait_ms=QUERY_EMBED_MAX_WAIT_MS,
+        )
+        self.topic_classifier: Optional[TopicClassifier] = None
     
-    def build_embeddings(self):
-        """Génère les embeddings pour tous les chunks."""
-        print(f"🔄 Génération des embeddings pour {len(self.chunks)} chunks...")
-        
-        texts = [chunk.content for chunk in self.chunks]
-        embeddings = self.embedding_model.encode(texts, show_progress_bar=True)
-        
-        # Création de l index FAISS
-        dimension = embeddings.shape[1]
-        self.index = faiss.IndexFlatIP(dimension)
-        
-        # Normalisation pour similarité cosinus
-        faiss.normalize_L2(embeddings)
-        self.index.add(embeddings.astype('float32'))
-        
-        self.embeddings = embeddings
-        print(f"✅ Index FAISS créé avec {self.index.ntotal} vecteurs")
+    @property
+    def num_chunks(self) -> int:
+        return sum(shard.size for shard in self.shards.values())
     
-    def search_relevant_chunks(self, query: str, top_k: int = 5) -> List[Tuple[DocumentChunk, float]]:
-        """Recherche les chunks les plus pertinents."""
-        if self.index is None:
-            raise ValueError("Index non créé. Appelez build_embeddings() d abord.")
-        
-        query_embedding = self.embedding_model.encode([query])
-        faiss.normalize_L2(query_embedding)
-        
-        scores, indices = self.index.search(query_embedding.astype('float32'), top_k)
-        
-        results = []
-        for score, idx in zip(scores[0], indices[0]):
-            if idx < len(self.chunks):
-                results.append((self.chunks[idx], float(score)))
-        
-        return results
+    def add_shard(self, shard: RAGShard) -> None:
+        """Ajoute ou remplace un shard (copie du dict : les recherches en cours ne sont pas perturbées)."""
+        self.shards = {**self.shards, shard.document_id: shard}
     
-    def get_context_for_query(self, query: str, max_chars: int = 8000) -> str:
-        """Récupère le contexte pertinent pour une query."""
-        relevant_chunks = self.search_relevant_chunks(query, top_k=8)
-        
-        context_parts = []
-        total_chars = 0
-        
-        for chunk, score in relevant_chunks:
-            chunk_text = f"[Page {chunk.page_number}]\n{chunk.content}\n"
-            
-            if total_chars + len(chunk_text) <= max_chars:
-                context_parts.append(chunk_text)
-                total_chars += len(chunk_text)
-            else:
-                break
-        
-        return "\n---\n".join(context_parts)
+    def remove_shard(self, document_id: str) -> None:
+        self.shards = {k: v for k, v in self.shards.items() if k != document_id}
     
-    def save_index(self, base_path: str):
-        """Sauvegarde l index."""
-        faiss.write_index(self.index, f"{base_path}.faiss")
-        
-        chunks_data = []
-        for chunk in self.chunks:
-            chunks_data.append({
-                'content': chunk.content,
-                'page_number': chunk.page_number,
-                'chunk_id': chunk.chunk_id
-            })
-        
-        with open(f"{base_path}_chunks.json", 'w', encoding='utf-8') as f:
-            json.dump(chunks_data, f, ensure_ascii=False, indent=2)
+    def encode_documents(self, texts: List[str]) -> np.ndarray:
+        """Encode des chunks de documents (construction des shards)."""
+        return self.embedding_backend.encode(texts)
     
-    def load_index(self, base_path: str):
-        """Charge un index sauvegardé."""
-        self.index = faiss.read_index(f"{base_path}.faiss")
-        
-        with open(f"{base_path}_chunks.json", 'r', encoding='utf-8') as f:
-            chunks_data = json.load(f)
-        
-        self.chunks = []
-        for data in chunks_data:
-            chunk = DocumentChunk(
-                content=data['content'],
-                page_number=data['page_number'],
-                chunk_id=data['chunk_id']
-            )
-            self.chunks.append(chunk)
-
-# ── Initialisation du système RAG ──────────────────────────────────────────────
-
-def initialize_rag():
-    """Initialise le système RAG (une seule fois)."""
-    index_path = BASE_DIR / "rag_index"
+    def _encode_queries(self, queries: List[str]) -> np.ndarray:
+        """Encode un lot de queries (appelé par le micro-batcher)."""
+        return self.embedding_backend.encode(queries)
     
-    rag = SimpleRAG(str(PDF_PATH))
+    def embed_query(self, query: str) -> np.ndarray:
+        """Embedding normalisé d une query, forme (1, dim), réutilisable par le cache."""
+        return self.query_embedder.encode(query)
     
-    # Vérifier si l index existe
-    if (Path(f"{index_path}.faiss").exists() and 
-        Path(f"{index_path}_chunks.json").exists()):
-        print("📚 Chargement de l index RAG existant...")
-        rag.load_index(str(index_path))
-        print(f"✅ Index chargé: {len(rag.chunks)} chunks disponibles")
-    else:
-        print("🔄 Création du nouvel index RAG...")
-        rag.extract_and_chunk_pdf()
-        rag.build_embeddings()
-        rag.save_index(str(index_path))
-        print(f"✅ Index RAG créé: {len(rag.chunks)} chunks")
+    def search_relevant_chunks(self, query: str, top_k: int = 5,
+                               query_embedding: Optional[np.ndarray] = None) -> List[Tuple[DocumentChunk, float]]:
+        """Recherche les chunks les plus pertinents sur tous les shards."""
+        # Lecture unique : les shards peuvent être remplacés à chaud par sync_rag_index()
+        shards = list(self.shards.values())
+        if not shards:
+            raise ValueError("Aucun shard chargé. Appelez sync_rag_index() d abord.")
+        
+        if query_embedding is None:
+            query_embedding = self.embed_query(query)
+        
+        return merge_results((shard.search(query_embedding, top_k) for shard in shards), top_k)
     
-    return rag
-
-# Initialisation globale
-RAG_SYSTEM = initialize_rag()
-
-# ── Système de détection thématique ────────────────────────────────────────────
-
-def detect_query_theme(user_query: str) -> dict:
-    """
-    Détecte le thème de la question pour orienter vers les bons articles.
-    Retourne un dictionnaire avec le thème détecté et des instructions spéciales.
-    """
-    query_lower = user_query.lower()
+    def search_lexical(self, query: str, top_k: int = 5) -> List[Tuple[DocumentChunk, float]]:
+        """
+        Meilleurs chunks BM25 sur tous les shards, scorés avec les statistiques
+        du corpus entier : un petit shard (IDF propres élevées) ne prend pas
+        tout le top-k.
+        """
+        shards = list(self.shards.values())
+        corpus = corpus_stats((shard.lexical for shard in shards if shard.lexical is not None), query)
+        return merge_results((shard.search_lexical(query, top_k, corpus) for shard in shards), top_k)
     
-    # Dictionnaire de détection thématique avec mots-clés élargis
-    themes = {
-        'infidelite': {
-            'keywords': ['infidèle', 'infidélité', 'trompé', 'trompe', 'tromper', 'cocufié', 
-                        'cocu', 'adultère', 'autre homme', 'autre femme', 'liaison', 
-                        'triche', 'tricherie', 'attraper', 'flagrant délit', 'pardon',
-                        'pardonne', 'cheating', 'affair'],
-            'requires_clarification': True,
-            'clarification_question': "Juste pour être sûr : parles-tu d une situation où ta partenaire t a été infidèle ?",
-            'article_trigger': "Article à sortir concernant le pardon de l infidélité"
-        },
-        'femme_toxique': {
-            'keywords': ['toxique', 'manipulatrice', 'narcissique', 'instable', 'clown', 
-                        'cirque', 'dépendance', 'codépendance', 'manipulation', 'victime',
-                        'reste', 'retourne', 'revenir'],
-            'article_trigger': "NE BLÂME PAS UN CLOWN"
-        },
-        'rupture_manipulation': {
-            'keywords': ['rupture', 'séparation', 'quitter', 'quitté', 'ex', 'cassé', 
-                        'victimisation', 'victimise', 'déresponsabilisation'],
-            'article_trigger': "COMMENT CERTAINES FEMMES MANIPULENT LES RUPTURES"
-        },
-        'femme_doit_aimer_plus': {
-            'keywords': ['aimer plus', 'elle m aime', 'hypergamie', 'fidélité', 'loyauté',
-                        'engagement', 'vision', 'progression'],
-            'article_trigger': "EFFECTIVEMENT LA FEMME DOIT AIMER PLUS QUE L HOMME"
-        },
-        'femme_amortie': {
-            'keywords': ['passé', 'ex toxic', 'choix destructeur', 'qualité', 'mérite',
-                        'buisson d épines', 'homme toxique', 'maturité', 'déclin'],
-            'article_trigger': "UN HOMME DE QUALITÉ NE MÉRITE PAS UNE FEMME AMORTIE"
-        }
-    }
+    def hybrid_search(self, query: str, top_k: int = 5, query_embedding: Optional[np.ndarray] = None,
+                      min_score_ratio: float = 0.0) -> List[Tuple[DocumentChunk, float]]:
+        """
+        Fusion RRF des classements dense et BM25 : un chunk bien classé par les
+        deux passe devant un chunk que seul l un des deux remonte. Le score
+        retourné est le score RRF, qui ne sert qu à ordonner : le seuil relatif
+        `min_score_ratio` s applique aux scores cosinus, avant la fusion (les
+        correspondances BM25 sont gardées : termes exacts de la question).
+        """
+        candidates = max(top_k, RAG_HYBRID_CANDIDATES)
+        dense = self.search_relevant_chunks(query, top_k=candidates, query_embedding=query_embedding)
+        dense = above_score_ratio(dense, min_score_ratio)
+        lexical = self.search_lexical(query, top_k=candidates)
+        return reciprocal_rank_fusion(
+            [dense, lexical],
+            key=lambda chunk: (chunk.document_id, chunk.chunk_id),
+            k=RAG_RRF_K,
+            top_k=top_k,
+        )
     
-    # Détection du thème
-    for theme_name, theme_data in themes.items():
-        for keyword in theme_data['keywords']:
-            if keyword in query_lower:
-                return {
-                    'theme': theme_name,
-                    'data': theme_data
-                }
+    def retrieve(self, query: str, top_k: int = RAG_CONTEXT_TOP_K,
+                 query_embedding: Optional[np.ndarray] = None) -> List[Tuple[DocumentChunk, float]]:
+        """
+        Chunks du contexte selon RAG_RETRIEVAL_MODE ; en hybride, le seuil
+        RAG_CONTEXT_MIN_SCORE_RATIO est déjà appliqué (scores cosinus).
+        """
+        if RAG_RETRIEVAL_MODE == "dense":
+            return self.search_relevant_chunks(query, top_k=top_k, query_embedding=query_embedding)
+        return self.hybrid_search(query, top_k=top_k, query_embedding=query_embedding,
+                                  min_score_ratio=RAG_CONTEXT_MIN_SCORE_RATIO)
     
-    return {'theme': None, 'data': None}
+    def get_context_for_query(self, query: str, max_tokens: int = RAG_CONTEXT_MAX_TOKENS,
+                              query_embedding: Optional[np.ndarray] = None) -> str:
+        """Récupère le contexte pertinent pour une query, dans un budget de tokens."""
+        relevant_chunks = self.retrieve(query, query_embedding=query_embedding)
+        packed = pack_context(
+            relevant_chunks,
+            max_tokens,
+            # Scores RRF (hybride) : pas comparables à un seuil pensé pour le cosinus
+            min_score_ratio=RAG_CONTEXT_MIN_SCORE_RATIO if RAG_RETRIEVAL_MODE == "dense" else 0.0,
+            dedup_threshold=RAG_CONTEXT_DEDUP_THRESHOLD,
+        )
+        _context_tokens.observe(packed.tokens)
+        _context_tokens_saved.inc(packed.tokens_saved)
+        print(f"🎯 Contexte RAG: {len(packed.chunks)}/{len(relevant_chunks)} chunks, {packed.tokens} tokens "
+              f"({packed.tokens_saved} économisés : {packed.dropped_low_score} sous le seuil, "
+              f"{packed.dropped_duplicates} doublons, {packed.dropped_budget} hors budget)")
+        return packed.text
+
+# ── Initialisation du système RAG ──────────────────────────────────────────────
 
-def is_greeting_or_intro(user_query: str) -> bool:
+def sync_rag_index(rag: SimpleRAG, force: bool = False) -> dict:
     """
-    Détecte si c est un message de salutation ou une demande de présentation.
+    Aligne les shards sur le contenu de `document_dir` : les documents nouveaux
+    ou modifiés sont (ré)indexés de façon incrémentale, les shards des documents
+    supprimés sont retirés. Les autres shards ne sont pas touchés.
     """
-    query_lower = user_query.lower().strip()
-    
-    # Mots et phrases clés pour détecter les présentations
-    greetings = [
-        'bonjour', 'salut', 'hello', 'hey', 'hi', 'bonsoir', 'coucou',
-        'qui es-tu', 'qui es tu', 'c est quoi', 'présente-toi', 'présente toi',
-        'tu es qui', 'tu fais quoi', 'what are you', 'who are you',
-        'pourquoi toi', 'pourquoi je devrais', 'quelle différence', 
-        'différence avec chatgpt', 'plutot qu une autre', 'plutôt qu une autre',
-        'pourquoi pas chatgpt', 'en quoi tu es différent', 'utiliser toi',
-        'autre ia', 'autre IA', 'chatgpt', 'chat gpt'
-    ]
-    
-    # Vérification des mots-clés
-    for greeting in greetings:
-        if greeting in query_lower:
-            return True
-    
-    # Détection de patterns spécifiques
-    presentation_patterns = [
-        ('pourquoi' in query_lower and 'utiliser' in query_lower),
-        ('pourquoi' in query_lower and 'toi' in query_lower),
-        ('quelle' in query_lower and 'différence' in query_lower),
-        ('autre' in query_lower and ('ia' in query_lower or 'IA' in user_query)),
-        ('plutot' in query_lower or 'plutôt' in query_lower),
-    ]
+    documents, collisions = split_id_collisions(discover_documents(rag.document_dir))
+    summary = []
+    for ignored, kept in collisions:
+        error = f"même identifiant de shard que {kept.name} : renommer l un des deux fichiers"
+        print(f"❌ Document {ignored.name} ignoré, {error}")
+        summary.append({"document_id": document_id_for(ignored), "source": ignored.name,
+                        "status": "error", "error": error})
     
-    if any(presentation_patterns):
-        return True
-    
-    # Si le message est très court (moins de 20 caractères), probablement une salutation
-    if len(query_lower) < 20 and any(word in query_lower for word in ['salut', 'hello', 'bonjour', 'hey', 'hi']):
-        return True
+    for source_path in documents:
+        document_id = document_id_for(source_path)
+        try:
+            shard, result = sync_shard(
+                source_path,
+                rag.shards_dir,
+                rag.encode_documents,
+                model_id=rag.embedding_backend.model_id,
+                current_shard=rag.shards.get(document_id),
+                force=force,
+                seed_from=LEGACY_INDEX_PATH if source_path.resolve() == PDF_PATH.resolve() else None,
+            )
+        except Exception as e:
+            print(f"⚠️ Indexation impossible pour {source_path.name}: {e}")
+            summary.append({"document_id": document_id, "status": "error", "error": str(e)})
+            continue
+        if shard.size:
+            rag.add_shard(shard)
+        else:
+            # Document vidé : son ancien shard ne doit plus être interrogé
+            rag.remove_shard(document_id)
+        summary.append(result)
     
-    return False
-
-# ── Fonction de prompt intelligent ─────────────────────────────────────────────
-
-def get_system_prompt(user_query: str = "") -> str:
-    """Génère un prompt avec contexte adaptatif et détection thématique."""
-    name = "Ralph AI"
+    # Documents retirés du dossier : shards en mémoire et sur disque
+    live_ids = {document_id_for(p) for p in documents}
+    for document_id in [k for k in rag.shards if k not in live_ids]:
+        rag.remove_shard(document_id)
+    for base_path in orphan_shards(rag.shards_dir, live_ids):
+        remove_shard_files(base_path)
+        summary.append({"document_id": base_path.name, "status": "removed"})
     
-    # PRIORITÉ 1 : Détection des salutations et demandes de présentation
-    if is_greeting_or_intro(user_query):
-        # Pour les présentations, on retourne un prompt spécial simplifié
-        print("👋 Salutation/Présentation détectée - Mode présentation activé")
-        return f"""Tu es {name}, assistant spécialisé dans la philosophie redpill masculine.
-
-## INSTRUCTION UNIQUE : MESSAGE DE PRÉSENTATION
-
-L utilisateur te demande de te présenter ou te compare à d autres IA.
-
-Réponds UNIQUEMENT avec ce message EXACT (adapté à la langue de la question) :
-
-"Excellente question ! 🎯
-
-Les IA généralistes comme ChatGPT vous donnent des réponses politiquement correctes qui ne servent à rien. Moi, je vous dis la vérité, même si elle dérange.
-
-Voici pourquoi je suis différent :
-
-✅ **La vérité avant le consensus** : Je n ai pas de filtre blue pill. Je vous explique les vraies dynamiques relationnelles, pas ce que la société veut entendre
-
-✅ **Expertise pure relations** : Spécialisé à 100% dans les relations homme-femme, l attraction et la psychologie féminine. Pas de connaissances généralistes diluées
-
-✅ **Stratégies qui marchent vraiment** : Des plans d action concrets basés sur ce qui fonctionne réellement, pas sur des théories romantiques déconnectées
+    print(f"✅ RAG prêt: {len(rag.shards)} shard(s), {rag.num_chunks} chunks")
+    return {
+        "status": "rebuilt" if any(r["status"] in ("rebuilt", "removed") for r in summary) else "up_to_date",
+        "shards": summary,
+    }
 
-Si vous en avez marre des conseils mièvres qui ne donnent aucun résultat, je suis fait pour vous.
+def initialize_rag():
+    """Initialise le système RAG (une seule fois)."""
+    rag = SimpleRAG(str(DOCUMENTS_DIR), str(RAG_SHARDS_DIR))
+    sync_rag_index(rag)
+    if RAG_OFFTOPIC_CLASSIFIER:
+        try:
+            rag.topic_classifier = TopicClassifier.from_examples(rag.encode_documents, threshold=RAG_OFFTOPIC_THRESHOLD)
+            print(f"🧭 Classifieur hors sujet prêt (seuil {RAG_OFFTOPIC_THRESHOLD})")
+        except Exception as e:
+            print(f"⚠️ Classifieur hors sujet indisponible: {e}")
+    return rag
 
-Prêt à avoir des réponses qui changent vraiment la donne ? 💪"
+def warm_up_rag(rag: SimpleRAG) -> None:
+    """Inférence à blanc : modèle, micro-batcher et pages FAISS chauds avant la 1re vraie query."""
+    query_embedding = rag.embed_query("Comment poser un cadre dans la relation ?")
+    if rag.shards:
+        rag.search_relevant_chunks("", top_k=1, query_embedding=query_embedding)
+
+# ── Chargement du RAG en arrière-plan ──────────────────────────────────────────
+# Temps max qu une requête attend la fin du chargement avant de répondre avec
+# un prompt sans contexte RAG (0 = jamais d attente).
+RAG_WARMUP_WAIT_SECONDS = float(os.getenv("RAG_WARMUP_WAIT_SECONDS", "0"))
+# Après un échec, nouvel essai (déclenché par une requête) au plus tôt après
+# ce délai, doublé à chaque échec jusqu au maximum ; /rag/refresh relance tout de suite
+RAG_RETRY_BASE_SECONDS = float(os.getenv("RAG_RETRY_BASE_SECONDS", "5"))
+RAG_RETRY_MAX_SECONDS = float(os.getenv("RAG_RETRY_MAX_SECONDS", "300"))
+
+_rag_ready_gauge = metrics.gauge("rag_ready", "1 quand le RAG est chargé et chauffé")
+_rag_warmup_gauge = metrics.gauge("rag_warmup_seconds", "Durée du chargement + warm-up du RAG")
+_rag_degraded = metrics.counter("rag_degraded_prompts", "Prompts générés sans contexte RAG (RAG non prêt)")
+
+class RAGLoader:
+    """
+    Charge le RAG hors du chemin d import : démarré au startup de l application
+    (ou à la première requête), exécuté dans RAG_EXECUTOR. Le serveur accepte
+    des connexions pendant ce temps ; /chat/ready indique quand c est fini.
 
-RÈGLES STRICTES :
-- N AJOUTE RIEN d autre au message
-- Utilise exactement ce texte
-- Traduis dans la langue de la question si nécessaire (anglais, italien, espagnol, etc.)
-- Ne mentionne PAS le document ou les relations homme-femme dans ce contexte
-"""
-    
-    # PRIORITÉ 2 : Détection thématique pour les questions normales
-    theme_detection = detect_query_theme(user_query)
-    theme_instruction = ""
-    
-    if theme_detection['theme']:
-        theme_data = theme_detection['data']
-        
-        # Cas spécial : infidélité nécessite une clarification
-        if theme_detection['theme'] == 'infidelite' and theme_data.get('requires_clarification'):
-            theme_instruction = f"""
-## INSTRUCTION SPÉCIALE DÉTECTÉE : INFIDÉLITÉ
-La question semble concerner l infidélité. 
-AVANT de répondre, tu DOIS poser cette question de clarification :
-"{theme_data['clarification_question']}"
+    Après un échec (index ou documents cassés), les requêtes ne relancent pas
+    le chargement avant `retry_base` secondes, délai doublé à chaque échec
+    consécutif (au plus `retry_max`) : pas de rechargement par requête.
+    """
 
-SI l utilisateur confirme qu il s agit d infidélité → Utilise IMPÉRATIVEMENT l article "{theme_data['article_trigger']}" du document.
-SI l utilisateur nie → Traite la question normalement selon le contexte RAG.
-"""
-        else:
-            # Autres thèmes : orientation directe vers l article
-            theme_instruction = f"""
-## THÈME DÉTECTÉ : {theme_detection['theme'].upper()}
-Cette question est liée à l article "{theme_data['article_trigger']}".
-Utilise PRIORITAIREMENT le contenu de cet article pour répondre, même si le RAG propose d autres chunks.
-"""
-    
-    # Génération du contexte RAG
-    if user_query and user_query.strip():
+    def __init__(self, retry_base: float = 5.0, retry_max: float = 300.0):
+        self.state = "pending"  # pending → loading → ready | failed
+        self.rag: Optional[SimpleRAG] = None
+        self.error: Optional[str] = None
+        self.duration: Optional[float] = None
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.failures = 0
+        self._retry_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, force: bool = False) -> asyncio.Task:
+        """
+        Lance le chargement (idempotent). Après un échec, relance seulement une
+        fois le délai d attente écoulé, ou tout de suite si `force`.
+        """
+        if self._task is None or (self._task.done() and self.state == "failed"
+                                  and (force or time.monotonic() >= self._retry_at)):
+            self.state = "loading"
+            self._task = asyncio.get_running_loop().create_task(self._load())
+        return self._task
+
+    async def _load(self) -> None:
+        self.error = None
+        started = time.perf_counter()
+        print("⏳ Chargement du RAG en arrière-plan...")
         try:
-            relevant_context = RAG_SYSTEM.get_context_for_query(user_query, max_chars=10000)
-            print(f"🎯 Contexte RAG généré: {len(relevant_context)} caractères")
+            rag = await run_in_rag_executor(initialize_rag)
+            await run_in_rag_executor(warm_up_rag, rag)
         except Exception as e:
-            print(f"⚠️ Erreur RAG: {e}")
-            relevant_context = "Contexte non disponible"
-    else:
-        relevant_context = "Pas de contexte nécessaire pour ce type de message"
-    
-    prompt = f"""Tu es {name}, assistant spécialisé dans la philosophie redpill masculine.
-
-{theme_instruction}
+            self.failures += 1
+            delay = min(self.retry_base * 2 ** (self.failures - 1), self.retry_max)
+            self._retry_at = time.monotonic() + delay
+            self.state, self.error = "failed", str(e)
+            print(f"❌ Chargement du RAG impossible ({self.failures} échec(s), nouvel essai dans {delay:.0f}s): {e}")
+            return
+        self.failures = 0
+        self.rag = rag
+        self.duration = time.perf_counter() - started
+        self.state = "ready"
+        _rag_ready_gauge.set(1)
+        _rag_warmup_gauge.set(round(self.duration, 3))
+        print(f"✅ RAG chargé et chauffé en {self.duration:.1f}s")
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def get(self) -> Optional[SimpleRAG]:
+        """Le RAG s il est prêt, sinon None (sans attendre)."""
+        return self.rag if self.ready else None
+
+    async def wait(self, timeout: Optional[float] = None) -> Optional[SimpleRAG]:
+        """Attend le RAG au plus `timeout` secondes (None = sans limite). None si pas prêt."""
+        if self.ready:
+            return self.rag
+        task = self.start()
+        if timeout is not None and timeout <= 0:
+            return None
+        try:
+            # shield : un appelant qui abandonne n annule pas le chargement
+            await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.get()
+
+    def status(self) -> dict:
+        status = {"state": self.state}
+        if self.rag is not None:
+            status.update(shards=len(self.rag.shards), chunks=self.rag.num_chunks,
+                          warmup_seconds=round(self.duration, 3))
+        if self.error:
+            status["error"] = self.error
+        if self.state == "failed":
+            status.update(failures=self.failures,
+                          retry_in_seconds=round(max(self._retry_at - time.monotonic(), 0), 1))
+        return status
+
+RAG_LOADER = RAGLoader(retry_base=RAG_RETRY_BASE_SECONDS, retry_max=RAG_RETRY_MAX_SECONDS)
+
+# ── Sessions de conversation ──────────────────────────────────────────────────
+# Historique conservé côté serveur (table chat_sessions) : le client n envoie
+# que son message et son session_id.
+SESSION_STORE = SessionStore(
+    max_messages=int(os.getenv("CHAT_SESSION_MAX_MESSAGES", "40")),
+    cache_size=int(os.getenv("CHAT_SESSION_CACHE_SIZE", "2000")),
+    cache_ttl_seconds=float(os.getenv("CHAT_SESSION_CACHE_TTL_SECONDS", "600")),
+)
+
+# Historique envoyé au modèle : budget en tokens (résumé compris), taille max
+# d un message, longueur max du résumé glissant des échanges anciens
+CHAT_HISTORY_MAX_TOKENS = int(os.getenv("CHAT_HISTORY_MAX_TOKENS", "2000"))
+CHAT_HISTORY_MAX_MESSAGE_TOKENS = int(os.getenv("CHAT_HISTORY_MAX_MESSAGE_TOKENS", "600"))
+CHAT_HISTORY_SUMMARY_MAX_TOKENS = int(os.getenv("CHAT_HISTORY_SUMMARY_MAX_TOKENS", "300"))
+
+# Tools de l agent : timeout par tool-call et nombre max de tours de
+# tool-calls par requête (au-delà, le modèle doit répondre sans tools)
+CHAT_TOOL_TIMEOUT_SECONDS = float(os.getenv("CHAT_TOOL_TIMEOUT_SECONDS", "10"))
+CHAT_MAX_TOOL_ROUNDS = int(os.getenv("CHAT_MAX_TOOL_ROUNDS", "3"))
+
+# Premiers messages identiques traités en même temps : une seule exécution partagée
+CHAT_SINGLE_FLIGHT_ENABLED = os.getenv("CHAT_SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+
+# Admission devant /chat, /chat/stream et Gradio : requêtes traitées en même
+# temps, file d attente bornée et attente max ; au-delà, refus immédiat
+# (429 file pleine, 503 attente dépassée) avec Retry-After
+ADMISSION = AdmissionController(
+    max_concurrent=int(os.getenv("CHAT_MAX_CONCURRENT", "32")),
+    max_queue=int(os.getenv("CHAT_MAX_QUEUE", "64")),
+    max_wait_seconds=float(os.getenv("CHAT_MAX_QUEUE_WAIT_SECONDS", "10")),
+)
+
+# ── Appels OpenAI : délais, reprises, hedging, disjoncteur ───────────────────
+LLM = ResilientLLM(
+    openai_client,
+    attempt_timeout=float(os.getenv("LLM_ATTEMPT_TIMEOUT_SECONDS", "20")),
+    total_timeout=float(os.getenv("LLM_TOTAL_TIMEOUT_SECONDS", "45")),
+    max_attempts=int(os.getenv("LLM_MAX_ATTEMPTS", "3")),
+    backoff_base=float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "0.5")),
+    backoff_max=float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "8")),
+    hedge=os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true",
+    hedge_quantile=float(os.getenv("LLM_HEDGE_QUANTILE", "0.95")),
+    hedge_min_delay=float(os.getenv("LLM_HEDGE_MIN_DELAY_SECONDS", "2")),
+    stream_idle_timeout=float(os.getenv("LLM_STREAM_IDLE_TIMEOUT_SECONDS", "20")),
+    breaker=CircuitBreaker(
+        failure_threshold=int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+        reset_seconds=float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30")),
+    ),
+)
+
+# ── Cache de réponses ──────────────────────────────────────────────────────────
+# À invalider (RESPONSE_CACHE.invalidate()) dès que l index RAG ou le prompt change.
+RESPONSE_CACHE = ResponseCache(
+    max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000")),
+    ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600")),
+    similarity_threshold=float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95")),
+    enabled=os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true",
+)
+
+_refresh_lock = asyncio.Lock()
+
+async def refresh_rag_index(force: bool = False) -> dict:
+    """
+    Resynchronise les shards à la demande (documents ajoutés/modifiés/supprimés).
+    Si le chargement a échoué, il est relancé sans attendre le délai.
+    """
+    RAG_LOADER.start(force=True)
+    rag = await RAG_LOADER.wait()
+    if rag is None:
+        return {"status": "unavailable", "rag": RAG_LOADER.status()}
+    async with _refresh_lock:
+        result = await run_in_rag_executor(sync_rag_index, rag, force)
+    if result["status"] == "rebuilt":
+        RESPONSE_CACHE.invalidate("index RAG reconstruit")
+    return result
+
+# ── Prompts système ─────────────────────────────────────────────────────────────
+# OpenAI met en cache le plus long préfixe commun entre requêtes (à partir de
+# 1024 tokens) : tout ce qui est fixe (persona, règles, exemples) est construit
+# une fois à l import, identique à l octet près, et placé en tête ; le thème
+# détecté et le contexte RAG, propres à chaque question, viennent après.
+ASSISTANT_NAME = "Ralph AI"
+# Règle 3 du prompt ; servie telle quelle par le classifieur hors sujet
+OFF_TOPIC_REFUSAL = "Cette question ne concerne pas les relations homme-femme. Je ne peux y répondre."
+
+SYSTEM_PROMPT_PREFIX = f"""Tu es {ASSISTANT_NAME}, assistant spécialisé dans la philosophie redpill masculine.
 
 ## RÈGLES ABSOLUES (à respecter impérativement) :
 
@@ -376,7 +508,7 @@ Utilise PRIORITAIREMENT le contenu de cet article pour répondre, même si le RA
      * Anti-victimisation de l homme
      * Cadre et frontières
      * Valeur personnelle avant la relation
-   - Si ce N EST PAS une question homme-femme → réponds : "Cette question ne concerne pas les relations homme-femme. Je ne peux y répondre."
+   - Si ce N EST PAS une question homme-femme → réponds : "{OFF_TOPIC_REFUSAL}"
 
 4. **INTERDIT ABSOLU - Ne JAMAIS faire ceci** :
    ❌ Conseiller la "compréhension émotionnelle excessive" de la femme
@@ -396,6 +528,25 @@ Utilise PRIORITAIREMENT le contenu de cet article pour répondre, même si le RA
    - Réponds dans la MÊME LANGUE que la question
    - Français → français, Anglais → anglais, Italien → italien, etc.
 
+7. **Conversation en plusieurs messages** :
+   - Une relance courte ("et si elle revient ?", "pourquoi ?", "et après ?") prolonge l échange précédent
+   - Réponds-y dans le fil de la conversation, sans redemander tout le contexte
+   - Ne répète pas mot pour mot ta réponse précédente : approfondis ou applique-la au nouveau cas
+
+8. **Outils disponibles** :
+   - Si l utilisateur donne son email pour être recontacté → utilise record_user_details
+   - Si tu ne peux pas répondre à une question homme-femme → utilise record_unknown_question
+   - N invente jamais d email, de nom ou de coordonnées
+
+## STRUCTURE D UNE BONNE RÉPONSE :
+
+1. Une phrase d ouverture qui nomme clairement la situation (sans juger le client)
+2. Le principe du document qui s applique, avec sa formule-choc si elle existe
+3. Deux ou trois points concrets : ce que l homme contrôle, ce qu il doit arrêter, ce qu il doit poser comme limite
+4. Une conclusion courte et ferme qui rend la responsabilité à l homme
+   - Pas de liste interminable, pas de jargon psychologique
+   - Pas de formule de politesse creuse en fin de réponse ("n hésitez pas si...")
+
 ## EXEMPLES DE NAVIGATION INTELLIGENTE :
 
 Question : "Ma copine m a trompé et demande pardon"
@@ -410,6 +561,18 @@ Question : "Elle a cassé et joue la victime partout"
 → Thème détecté : RUPTURE MANIPULATION
 → Action : Utiliser l article sur les 3 étapes de manipulation des ruptures
 
+Question : "Est-ce normal que ce soit moi qui fasse tous les efforts dans le couple ?"
+→ Thème détecté : LA FEMME DOIT AIMER PLUS
+→ Action : Utiliser l article "EFFECTIVEMENT LA FEMME DOIT AIMER PLUS QUE L HOMME"
+
+Question : "Elle a eu beaucoup de partenaires avant moi, je dois passer outre ?"
+→ Thème détecté : FEMME AMORTIE
+→ Action : Utiliser l article "UN HOMME DE QUALITÉ NE MÉRITE PAS UNE FEMME AMORTIE"
+
+Question : "Et si elle revient en pleurant dans un mois ?" (après un échange sur une rupture)
+→ Thème détecté : celui de l échange précédent (RUPTURE MANIPULATION)
+→ Action : Rester sur le même article et répondre à la relance sans changer de sujet
+
 ## EXEMPLES DE BONNES vs MAUVAISES RÉPONSES :
 
 ❌ MAUVAIS (blue pill) :
@@ -418,8 +581,100 @@ Question : "Elle a cassé et joue la victime partout"
 ✅ BON (redpill conforme au document) :
 "Un homme fort établit son cadre et ne négocie pas son respect. Si elle critique constamment, c est un test de dominance. Tu ne changes pas un clown, tu changes de cirque."
 
----
+❌ MAUVAIS (blue pill) :
+"Elle vous a trompé mais elle regrette ? Tout le monde fait des erreurs, le pardon renforce le couple."
+
+✅ BON (redpill conforme au document) :
+"Avant de parler de pardon, une question : est-ce la première fois, et l a-t-elle avoué ou l as-tu découvert ? La réponse change tout. Un homme qui pardonne par peur de la solitude ne pardonne pas, il capitule."
+
+❌ MAUVAIS (blue pill) :
+"Votre ex vous accuse partout ? Prenez contact avec elle pour clarifier les choses calmement."
+
+✅ BON (redpill conforme au document) :
+"Elle joue la victime pour réécrire l histoire de la rupture. Tu n as rien à prouver à son entourage : le silence et la distance sont ta meilleure réponse. Celui qui se justifie a déjà perdu le cadre."
+
+❌ MAUVAIS (hors sujet traité quand même) :
+"Voici une recette de lasagnes..."
+
+✅ BON :
+"{OFF_TOPIC_REFUSAL}"
+
+"""
+
+GREETING_PROMPT = f"""Tu es {ASSISTANT_NAME}, assistant spécialisé dans la philosophie redpill masculine.
+
+## INSTRUCTION UNIQUE : MESSAGE DE PRÉSENTATION
+
+L utilisateur te demande de te présenter ou te compare à d autres IA.
+
+Réponds UNIQUEMENT avec ce message EXACT (adapté à la langue de la question) :
+
+"{PRESENTATION_MESSAGES['fr']}"
+
+RÈGLES STRICTES :
+- N AJOUTE RIEN d autre au message
+- Utilise exactement ce texte
+- Traduis dans la langue de la question si nécessaire (anglais, italien, espagnol, etc.)
+- Ne mentionne PAS le document ou les relations homme-femme dans ce contexte
+"""
+
+# ── Fonction de prompt intelligent ─────────────────────────────────────────────
+
+async def get_system_prompt(user_query: str = "", query_embedding: Optional[np.ndarray] = None) -> str:
+    """Génère un prompt : préfixe statique commun, puis thème détecté et contexte RAG."""
+    # PRIORITÉ 1 : Détection des salutations et demandes de présentation
+    if is_greeting_or_intro(user_query):
+        # Pour les présentations, on retourne un prompt spécial simplifié
+        print("👋 Salutation/Présentation détectée - Mode présentation activé")
+        return GREETING_PROMPT
+    
+    # PRIORITÉ 2 : Détection thématique pour les questions normales
+    theme_detection = detect_query_theme(user_query)
+    theme_instruction = ""
+    
+    if theme_detection['theme']:
+        theme_data = theme_detection['data']
+        
+        # Cas spécial : infidélité nécessite une clarification
+        if theme_detection['theme'] == 'infidelite' and theme_data.get('requires_clarification'):
+            theme_instruction = f"""
+## INSTRUCTION SPÉCIALE DÉTECTÉE : INFIDÉLITÉ
+La question semble concerner l infidélité. 
+AVANT de répondre, tu DOIS poser cette question de clarification :
+"{theme_data['clarification_question']}"
 
+SI l utilisateur confirme qu il s agit d infidélité → Utilise IMPÉRATIVEMENT l article "{theme_data['article_trigger']}" du document.
+SI l utilisateur nie → Traite la question normalement selon le contexte RAG.
+"""
+        else:
+            # Autres thèmes : orientation directe vers l article
+            theme_instruction = f"""
+## THÈME DÉTECTÉ : {theme_detection['theme'].upper()}
+Cette question est liée à l article "{theme_data['article_trigger']}".
+Utilise PRIORITAIREMENT le contenu de cet article pour répondre, même si le RAG propose d autres chunks.
+"""
+    
+    # Génération du contexte RAG (l attente éventuelle du chargement a lieu
+    # au calcul de l embedding, cf. services._embed_query)
+    rag = RAG_LOADER.get()
+    if user_query and user_query.strip() and rag is None:
+        # Mode dégradé : RAG encore en chargement
+        _rag_degraded.inc()
+        print(f"⏳ RAG non prêt ({RAG_LOADER.state}) - prompt sans contexte documentaire")
+        relevant_context = "Contexte documentaire momentanément indisponible : réponds selon les principes généraux ci-dessus."
+    elif user_query and user_query.strip():
+        try:
+            relevant_context = await run_in_rag_executor(
+                rag.get_context_for_query, user_query, RAG_CONTEXT_MAX_TOKENS, query_embedding
+            )
+        except Exception as e:
+            print(f"⚠️ Erreur RAG: {e}")
+            relevant_context = "Contexte non disponible"
+    else:
+        relevant_context = "Pas de contexte nécessaire pour ce type de message"
+    
+    prompt = f"""{SYSTEM_PROMPT_PREFIX}---
+{theme_instruction}
 ## Contexte pertinent du document :
 {relevant_context}
 
@@ -0,0 +1,185 @@
+"""
+Backends d embedding du RAG (documents et queries).
+
+    sentence-transformers  PyTorch, comportement historique (défaut)
+    onnx                   même modèle exporté en ONNX, exécuté par ONNX Runtime
+    onnx-int8              export ONNX avec poids quantifiés int8 (quantification dynamique)
+
+Les backends ONNX n importent ni torch ni sentence-transformers : l image
+démarre plus vite et consomme moins de mémoire. Export (une fois, par exemple
+à la construction de l image) :
+
+    python -m app.chat.embedding_backends export app/models/all-MiniLM-L6-v2-onnx
+
+Le dossier exporté contient `model.onnx`, `model_int8.onnx` et `tokenizer.json`.
+"""
+import os
+import sys
+from pathlib import Path
+from typing import List, Optional, Union
+
+import numpy as np
+
+BACKENDS = ("sentence-transformers", "onnx", "onnx-int8")
+
+# all-MiniLM-L6-v2 : max_seq_length de sentence-transformers
+MAX_SEQ_LENGTH = 256
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_INT8_MODEL_FILE = "model_int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+
+
+def _normalize(embeddings: np.ndarray) -> np.ndarray:
+    embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+
+class SentenceTransformerBackend:
+    """Modèle sentence-transformers (PyTorch)."""
+
+    name = "sentence-transformers"
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+
+        self.model_name = model_name
+        self.model = SentenceTransformer(model_name)
+
+    @property
+    def model_id(self) -> str:
+        return self.model_name
+
+    @property
+    def dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Embeddings (n, dim) float32 normalisés L2."""
+        return _normalize(self.model.encode(texts, show_progress_bar=False))
+
+
+class OnnxBackend:
+    """
+    Modèle exporté en ONNX : tokenisation `tokenizers` (Rust), inférence ONNX
+    Runtime, puis mean pooling masqué et normalisation, comme le pipeline
+    sentence-transformers de MiniLM.
+    """
+
+    def __init__(self, model_dir: Union[str, Path], model_name: str, quantized: bool = False,
+                 threads: Optional[int] = None, max_length: int = MAX_SEQ_LENGTH):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.model_dir = Path(model_dir)
+        self.model_name = model_name
+        self.quantized = quantized
+        self.name = "onnx-int8" if quantized else "onnx"
+
+        model_path = self.model_dir / (ONNX_INT8_MODEL_FILE if quantized else ONNX_MODEL_FILE)
+        if not model_path.exists():
+            raise FileNotFoundError(
+                f"Modèle ONNX introuvable: {model_path} "
+                f"(python -m app.chat.embedding_backends export {self.model_dir})"
+            )
+
+        self.tokenizer = Tokenizer.from_file(str(self.model_dir / TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length)
+        self.tokenizer.enable_padding()
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = threads or int(os.getenv("OMP_NUM_THREADS", "1"))
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(str(model_path), options, providers=["CPUExecutionProvider"])
+        self._input_names = {i.name for i in self.session.get_inputs()}
+        self._dimension = None
+
+    @property
+    def model_id(self) -> str:
+        # Les vecteurs int8 diffèrent légèrement : caches d embeddings distincts
+        return f"{self.model_name}+int8" if self.quantized else self.model_name
+
+    @property
+    def dimension(self) -> int:
+        if self._dimension is None:
+            self._dimension = self.encode(["dimension"]).shape[1]
+        return self._dimension
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Embeddings (n, dim) float32 normalisés L2."""
+        encodings = self.tokenizer.encode_batch(list(texts))
+        input_ids = np.array([e.ids for e in encodings], dtype="int64")
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype="int64")
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype="int64")
+
+        token_embeddings = self.session.run(None, feeds)[0]  # (n, seq, dim)
+        mask = attention_mask[:, :, None].astype("float32")
+        pooled = (token_embeddings * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        return _normalize(pooled)
+
+
+def create_backend(kind: str, model_name: str, onnx_model_dir: Union[str, Path]):
+    """Instancie le backend `kind` (voir BACKENDS)."""
+    kind = kind.strip().lower()
+    if kind == "sentence-transformers":
+        return SentenceTransformerBackend(model_name)
+    if kind in ("onnx", "onnx-int8"):
+        return OnnxBackend(onnx_model_dir, model_name, quantized=(kind == "onnx-int8"))
+    raise ValueError(f"Backend d embedding inconnu: {kind} (attendu: {', '.join(BACKENDS)})")
+
+
+def export_onnx(model_name: str, output_dir: Union[str, Path], quantize: bool = True) -> Path:
+    """
+    Exporte le transformer de `model_name` en ONNX (axes batch/séquence
+    dynamiques) avec son tokenizer, puis une variante int8 par quantification
+    dynamique des poids. Nécessite torch et transformers (pas en production).
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    repo = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+
+    tokenizer = AutoTokenizer.from_pretrained(repo)
+    model = AutoModel.from_pretrained(repo).eval()
+    tokenizer.backend_tokenizer.save(str(output_dir / TOKENIZER_FILE))
+
+    sample = tokenizer(["exemple de phrase"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in input_names),
+            str(output_dir / ONNX_MODEL_FILE),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=17,
+        )
+    print(f"✅ Modèle ONNX exporté: {output_dir / ONNX_MODEL_FILE}")
+
+    if quantize:
+        quantize_onnx(output_dir / ONNX_MODEL_FILE, output_dir / ONNX_INT8_MODEL_FILE)
+    return output_dir
+
+
+def quantize_onnx(source: Union[str, Path], target: Union[str, Path]) -> Path:
+    """Quantification dynamique int8 des poids (activations quantifiées à la volée)."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(str(source), str(target), weight_type=QuantType.QInt8)
+    print(f"✅ Modèle ONNX int8: {target} ({Path(target).stat().st_size / 1e6:.1f} Mo)")
+    return Path(target)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (3, 4) or sys.argv[1] != "export":
+        print("Usage: python -m app.chat.embedding_backends export <dossier> [modèle]")
+        sys.exit(1)
+    export_onnx(sys.argv[3] if len(sys.argv) == 4 else "all-MiniLM-L6-v2", sys.argv[2])
@@ -0,0 +1,153 @@
+"""
+Encodage des queries pour le RAG : cache LRU des embeddings et micro-batching.
+
+Les requêtes concurrentes qui arrivent à quelques millisecondes d intervalle
+sont regroupées en un seul appel encode() exécuté par un thread dédié.
+"""
+import re
+import time
+import queue
+import threading
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from . import metrics
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+WAIT_MS_BUCKETS = (0.5, 1, 2, 5, 10, 20, 50, 100)
+
+_batch_size_hist = metrics.histogram(
+    "rag_query_embed_batch_size", BATCH_SIZE_BUCKETS, "Taille des lots passés à encode()"
+)
+_wait_ms_hist = metrics.histogram(
+    "rag_query_embed_wait_ms", WAIT_MS_BUCKETS, "Attente d une query dans la file avant encode()"
+)
+_encode_ms_hist = metrics.histogram(
+    "rag_query_embed_encode_ms", metrics.LATENCY_MS_BUCKETS, "Durée d un appel encode() par lot"
+)
+_cache_hits = metrics.counter("rag_query_embed_cache_hits")
+_cache_misses = metrics.counter("rag_query_embed_cache_misses")
+
+
+def normalize_query(text: str) -> str:
+    """Clé de cache : MiniLM est uncased, seuls la casse et les espaces sont normalisés."""
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    return re.sub(r"\s+", " ", text).strip()
+
+
+@dataclass
+class _Pending:
+    key: str
+    text: str
+    future: Future
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+
+class QueryEmbedder:
+    """
+    Encode des queries une par une côté appelant, par lots côté modèle.
+
+    `encode_batch` reçoit une liste de textes et retourne un tableau
+    (n, dim) float32 déjà normalisé L2.
+    """
+
+    def __init__(self, encode_batch: Callable[[List[str]], np.ndarray],
+                 cache_size: int = 2048, max_batch_size: int = 16, max_wait_ms: float = 5.0):
+        self._encode_batch = encode_batch
+        self.cache_size = cache_size
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max(0.0, max_wait_ms)
+        self._cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[_Pending]" = queue.Queue()
+        self._worker = None
+
+    def submit(self, text: str) -> Future:
+        """Retourne un Future résolu avec l embedding (1, dim) de `text`."""
+        key = normalize_query(text)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                _cache_hits.inc()
+                future = Future()
+                future.set_result(cached)
+                return future
+            # Même query déjà en file : on partage le même Future
+            inflight = self._inflight.get(key)
+            if inflight is not None:
+                _cache_hits.inc()
+                return inflight
+            future = Future()
+            self._inflight[key] = future
+            self._ensure_worker()
+        _cache_misses.inc()
+        self._queue.put(_Pending(key, text, future))
+        return future
+
+    def encode(self, text: str) -> np.ndarray:
+        """Version bloquante de submit()."""
+        return self.submit(text).result()
+
+    def clear_cache(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="rag-query-embedder", daemon=True)
+            self._worker.start()
+
+    def _collect_batch(self) -> List[_Pending]:
+        first = self._queue.get()
+        batch = [first]
+        deadline = first.enqueued_at + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect_batch()
+            started = time.perf_counter()
+            for item in batch:
+                _wait_ms_hist.observe((started - item.enqueued_at) * 1000)
+            _batch_size_hist.observe(len(batch))
+
+            try:
+                vectors = np.asarray(self._encode_batch([item.text for item in batch]), dtype="float32")
+            except Exception as e:
+                with self._lock:
+                    for item in batch:
+                        self._inflight.pop(item.key, None)
+                for item in batch:
+                    item.future.set_exception(e)
+                continue
+            _encode_ms_hist.observe((time.perf_counter() - started) * 1000)
+
+            results = []
+            with self._lock:
+                for item, vector in zip(batch, vectors):
+                    embedding = vector.reshape(1, -1).copy()
+                    embedding.setflags(write=False)  # partagé entre appelants
+                    self._cache[item.key] = embedding
+                    self._cache.move_to_end(item.key)
+                    self._inflight.pop(item.key, None)
+                    results.append((item.future, embedding))
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            for future, embedding in results:
+                future.set_result(embedding)
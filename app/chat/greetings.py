@@ -0,0 +1,139 @@
+"""
+Réponse directe aux salutations et demandes de présentation, sans appel LLM.
+
+Le message de présentation est fixe : il est stocké ici, traduit dans les
+langues courantes des utilisateurs. La langue du message est détectée
+localement à partir de mots caractéristiques ; si elle est inconnue ou
+ambiguë, la réponse est déléguée au LLM (GREETING_PROMPT), qui traduit.
+"""
+from collections import Counter
+from typing import Dict, Optional
+
+from .query_detection import words
+
+PRESENTATION_MESSAGES: Dict[str, str] = {
+    "fr": """Excellente question ! 🎯
+
+Les IA généralistes comme ChatGPT vous donnent des réponses politiquement correctes qui ne servent à rien. Moi, je vous dis la vérité, même si elle dérange.
+
+Voici pourquoi je suis différent :
+
+✅ **La vérité avant le consensus** : Je n ai pas de filtre blue pill. Je vous explique les vraies dynamiques relationnelles, pas ce que la société veut entendre
+
+✅ **Expertise pure relations** : Spécialisé à 100% dans les relations homme-femme, l attraction et la psychologie féminine. Pas de connaissances généralistes diluées
+
+✅ **Stratégies qui marchent vraiment** : Des plans d action concrets basés sur ce qui fonctionne réellement, pas sur des théories romantiques déconnectées
+
+Si vous en avez marre des conseils mièvres qui ne donnent aucun résultat, je suis fait pour vous.
+
+Prêt à avoir des réponses qui changent vraiment la donne ? 💪""",
+    "en": """Great question! 🎯
+
+General-purpose AIs like ChatGPT give you politically correct answers that get you nowhere. I tell you the truth, even when it hurts.
+
+Here is why I am different:
+
+✅ **Truth over consensus**: I have no blue pill filter. I explain real relationship dynamics, not what society wants to hear
+
+✅ **Pure relationship expertise**: 100% specialized in male-female relationships, attraction and female psychology. No diluted general knowledge
+
+✅ **Strategies that actually work**: Concrete action plans based on what really works, not on disconnected romantic theories
+
+If you are tired of soft advice that never gets results, I am made for you.
+
+Ready for answers that really change the game? 💪""",
+    "es": """¡Excelente pregunta! 🎯
+
+Las IA generalistas como ChatGPT te dan respuestas políticamente correctas que no sirven para nada. Yo te digo la verdad, aunque incomode.
+
+Por eso soy diferente:
+
+✅ **La verdad antes que el consenso**: No tengo filtro blue pill. Te explico las verdaderas dinámicas de pareja, no lo que la sociedad quiere oír
+
+✅ **Experto puro en relaciones**: Especializado al 100% en las relaciones hombre-mujer, la atracción y la psicología femenina. Sin conocimientos generalistas diluidos
+
+✅ **Estrategias que funcionan de verdad**: Planes de acción concretos basados en lo que realmente funciona, no en teorías románticas desconectadas
+
+Si estás harto de consejos blandos que no dan ningún resultado, estoy hecho para ti.
+
+¿Listo para respuestas que de verdad cambian las reglas del juego? 💪""",
+    "it": """Ottima domanda! 🎯
+
+Le IA generaliste come ChatGPT ti danno risposte politicamente corrette che non servono a nulla. Io ti dico la verità, anche se dà fastidio.
+
+Ecco perché sono diverso:
+
+✅ **La verità prima del consenso**: Non ho filtri blue pill. Ti spiego le vere dinamiche relazionali, non quello che la società vuole sentirsi dire
+
+✅ **Esperto puro di relazioni**: Specializzato al 100% nelle relazioni uomo-donna, nell attrazione e nella psicologia femminile. Nessuna conoscenza generalista diluita
+
+✅ **Strategie che funzionano davvero**: Piani d azione concreti basati su ciò che funziona realmente, non su teorie romantiche scollegate dalla realtà
+
+Se sei stanco di consigli sdolcinati che non portano a nessun risultato, sono fatto per te.
+
+Pronto ad avere risposte che cambiano davvero le carte in tavola? 💪""",
+    "de": """Ausgezeichnete Frage! 🎯
+
+Allgemeine KIs wie ChatGPT geben dir politisch korrekte Antworten, die nichts bringen. Ich sage dir die Wahrheit, auch wenn sie unbequem ist.
+
+Darum bin ich anders:
+
+✅ **Wahrheit vor Konsens**: Ich habe keinen Blue-Pill-Filter. Ich erkläre dir die echten Beziehungsdynamiken, nicht das, was die Gesellschaft hören will
+
+✅ **Reine Beziehungsexpertise**: 100 % spezialisiert auf Mann-Frau-Beziehungen, Anziehung und weibliche Psychologie. Kein verwässertes Allgemeinwissen
+
+✅ **Strategien, die wirklich funktionieren**: Konkrete Aktionspläne, die auf dem beruhen, was tatsächlich funktioniert, nicht auf weltfremden romantischen Theorien
+
+Wenn du genug von weichgespülten Ratschlägen hast, die nichts bringen, bin ich für dich gemacht.
+
+Bereit für Antworten, die wirklich etwas verändern? 💪""",
+    "pt": """Excelente pergunta! 🎯
+
+As IAs generalistas como o ChatGPT dão respostas politicamente corretas que não servem para nada. Eu digo a verdade, mesmo que incomode.
+
+Veja por que sou diferente:
+
+✅ **A verdade antes do consenso**: Não tenho filtro blue pill. Explico as verdadeiras dinâmicas dos relacionamentos, não o que a sociedade quer ouvir
+
+✅ **Especialista puro em relacionamentos**: 100% especializado nas relações homem-mulher, na atração e na psicologia feminina. Nada de conhecimentos generalistas diluídos
+
+✅ **Estratégias que funcionam de verdade**: Planos de ação concretos baseados no que realmente funciona, não em teorias românticas desconectadas
+
+Se você está cansado de conselhos melosos que não dão resultado nenhum, eu fui feito para você.
+
+Pronto para respostas que realmente mudam o jogo? 💪""",
+}
+
+# Mots caractéristiques d une langue dans une salutation ou une demande de
+# présentation (normalisés : minuscules, sans accents). Les mots partagés entre
+# langues (tu, que, chatgpt...) sont volontairement absents.
+LANGUAGE_MARKERS: Dict[str, frozenset] = {
+    "fr": frozenset("""bonjour salut coucou bonsoir qui toi pourquoi quelle difference presente presentes
+        devrais utiliser autre plutot quoi fais ca va je suis est merci""".split()),
+    "en": frozenset("""hello hi hey who what are you why should use your good morning evening afternoon
+        introduce yourself how other than thanks""".split()),
+    "es": frozenset("""hola quien eres buenos buenas dias tardes noches usarte deberia otra gracias
+        como estas""".split()),
+    "it": frozenset("""ciao buongiorno buonasera chi sei perche dovrei usarti altra grazie stai""".split()),
+    "de": frozenset("""hallo guten tag morgen abend wer bist warum sollte dich benutzen danke wie geht""".split()),
+    "pt": frozenset("""ola oi quem voce bom dia boa tarde noite porque devo usar obrigado tudo bem""".split()),
+}
+
+
+def detect_language(text: str) -> Optional[str]:
+    """Langue la plus représentée parmi LANGUAGE_MARKERS, None si aucune ou égalité."""
+    scores = Counter()
+    for word in words(text):
+        for language, markers in LANGUAGE_MARKERS.items():
+            if word in markers:
+                scores[language] += 1
+    ranked = scores.most_common(2)
+    if not ranked or (len(ranked) == 2 and ranked[0][1] == ranked[1][1]):
+        return None
+    return ranked[0][0]
+
+
+def presentation_message(text: str) -> Optional[str]:
+    """Message de présentation dans la langue de `text`, None s il faut passer par le LLM."""
+    language = detect_language(text)
+    return PRESENTATION_MESSAGES.get(language) if language else None
@@ -0,0 +1,163 @@
+"""
+Historique de conversation sous un budget de tokens, avec résumé glissant.
+
+Chaque requête envoie au modèle :
+
+    [résumé des échanges anciens] + les messages les plus récents
+
+Les messages récents (non couverts par le résumé) sont ajoutés du plus récent
+au plus ancien tant qu ils tiennent dans le budget ; un message démesuré (mur
+de texte collé) est tronqué à `max_message_tokens`. Les messages qui ne
+tiennent plus sont perdus pour cette requête seulement : un nouveau résumé,
+qui les intègre à l ancien, est généré en tâche de fond (jamais sur le chemin
+de la requête) et servira dès la requête suivante. Le résumé couvre alors
+assez de messages pour que les récents n occupent que la moitié du budget :
+il n est pas régénéré à chaque tour. De même quand la session atteint
+`max_messages` messages non résumés (conversation de messages courts, sous
+le budget) : la session ne retire que des messages déjà résumés.
+
+Le résumé est stocké avec la session (cf. sessions.py) ; sans session (ancien
+protocole, historique envoyé par le client), l historique est seulement borné.
+"""
+import asyncio
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from . import metrics
+from .context_packing import count_tokens
+
+# Tokens ajoutés par message par le format chat (rôle, séparateurs)
+MESSAGE_OVERHEAD_TOKENS = 4
+SUMMARY_HEADER = "Résumé des échanges précédents avec l utilisateur :\n"
+
+_history_tokens = metrics.histogram(
+    "chat_history_tokens", (0, 250, 500, 1000, 1500, 2000, 3000, 4000), "Tokens d historique par requête"
+)
+_history_dropped = metrics.counter(
+    "chat_history_dropped_messages", "Messages écartés du prompt faute de budget (en attente de résumé)"
+)
+_history_truncated = metrics.counter("chat_history_truncated_messages", "Messages tronqués (trop longs)")
+_summaries = metrics.counter("chat_history_summaries", "Résumés d historique générés")
+_summary_errors = metrics.counter("chat_history_summary_errors", "Résumés d historique en échec")
+
+
+@dataclass
+class CompactedHistory:
+    messages: List[Dict[str, str]]  # résumé éventuel (rôle system) + messages récents
+    tokens: int
+    summary_tokens: int = 0
+    dropped: int = 0     # messages non résumés écartés faute de budget
+    truncated: int = 0   # messages raccourcis
+    # Résumé à régénérer jusqu à ce message (index depuis le début de la conversation)
+    summarize_upto: Optional[int] = None
+
+
+def message_tokens(message: Dict[str, str]) -> int:
+    return count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+def truncate_message(message: Dict[str, str], max_tokens: int) -> Tuple[Dict[str, str], int, bool]:
+    """(message, tokens, tronqué) : contenu coupé au prorata pour tenir dans `max_tokens`."""
+    tokens = message_tokens(message)
+    if tokens <= max_tokens:
+        return message, tokens, False
+    content = message["content"]
+    keep = max(int(len(content) * (max_tokens - MESSAGE_OVERHEAD_TOKENS) / tokens) - 1, 0)
+    truncated = {"role": message["role"], "content": content[:keep].rstrip() + " […]"}
+    return truncated, message_tokens(truncated), True
+
+
+class HistoryManager:
+    """
+    Compacte l historique sous `max_tokens` et régénère le résumé glissant en
+    tâche de fond (`summarize(résumé précédent, messages) → nouveau résumé`,
+    `save(session_id, résumé, summary_upto)`).
+    """
+
+    def __init__(self, summarize: Callable[[Optional[str], List[Dict[str, str]]], Awaitable[str]],
+                 save: Callable[[str, str, int], Awaitable[None]],
+                 max_tokens: int = 2000, max_message_tokens: int = 600, max_messages: Optional[int] = None):
+        self.summarize = summarize
+        self.save = save
+        self.max_tokens = max_tokens
+        self.max_message_tokens = min(max_message_tokens, max_tokens)
+        # Messages non résumés gardés par la session (CHAT_SESSION_MAX_MESSAGES) :
+        # au-delà, résumé demandé même sous le budget, pour que la session
+        # puisse retirer ses plus anciens messages sans les perdre
+        self.max_messages = max_messages
+        # Une seule régénération en cours par session
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def compact(self, messages: List[Dict[str, str]], offset: int = 0,
+                summary: Optional[str] = None, summary_upto: int = 0) -> CompactedHistory:
+        """
+        `messages[i]` est le message n° `offset + i` de la conversation ; ceux
+        d index < `summary_upto` sont couverts par `summary`.
+        """
+        head: List[Dict[str, str]] = []
+        summary_tokens = 0
+        if summary:
+            head = [{"role": "system", "content": SUMMARY_HEADER + summary}]
+            summary_tokens = message_tokens(head[0])
+
+        start = max(summary_upto - offset, 0)
+        budget = max(self.max_tokens - summary_tokens, 0)
+        kept: List[Dict[str, str]] = []
+        total = truncated = 0
+        for message in reversed(messages[start:]):
+            message, tokens, was_truncated = truncate_message(message, self.max_message_tokens)
+            if total + tokens > budget:
+                break
+            kept.append(message)
+            total += tokens
+            truncated += was_truncated
+        kept.reverse()
+
+        dropped = len(messages) - start - len(kept)
+        summarize_upto = None
+        if dropped:
+            # Les messages récents conservés après régénération n occupent que
+            # la moitié du budget : marge pour les tours suivants
+            recent, index = 0, len(messages)
+            while index > start:
+                tokens = truncate_message(messages[index - 1], self.max_message_tokens)[1]
+                if recent + tokens > budget // 2:
+                    break
+                recent += tokens
+                index -= 1
+            summarize_upto = offset + index
+        elif self.max_messages and len(messages) - start >= self.max_messages:
+            # Messages courts : le budget tient, mais la session est pleine
+            summarize_upto = offset + len(messages) - self.max_messages // 2
+
+        _history_tokens.observe(total + summary_tokens)
+        _history_dropped.inc(dropped)
+        _history_truncated.inc(truncated)
+        return CompactedHistory(head + kept, total + summary_tokens, summary_tokens, dropped, truncated,
+                                summarize_upto)
+
+    def schedule_summary(self, session_id: str, messages: List[Dict[str, str]], offset: int,
+                         summary: Optional[str], summary_upto: int, upto: int) -> None:
+        """Lance (sans l attendre) le résumé des messages [summary_upto, upto)."""
+        running = self._tasks.get(session_id)
+        if running is not None and not running.done():
+            return
+        to_summarize = messages[max(summary_upto - offset, 0):upto - offset]
+        if not to_summarize:
+            return
+        task = asyncio.get_running_loop().create_task(self._summarize(session_id, summary, to_summarize, upto))
+        self._tasks[session_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(session_id, None))
+
+    async def _summarize(self, session_id: str, summary: Optional[str],
+                         messages: List[Dict[str, str]], upto: int) -> None:
+        try:
+            new_summary = await self.summarize(summary, messages)
+            await self.save(session_id, new_summary, upto)
+        except Exception as e:
+            _summary_errors.inc()
+            print(f"⚠️ Résumé de l historique impossible: {e}")
+            return
+        _summaries.inc()
+        print(f"📝 Résumé de l historique mis à jour ({len(messages)} messages intégrés, "
+              f"{count_tokens(new_summary)} tokens)")
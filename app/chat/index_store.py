@@ -0,0 +1,250 @@
+"""
+Format binaire compact de l index RAG.
+
+`{base}_chunks.bin` contient un en-tête, les tableaux offsets / pages /
+chunk_ids puis un blob UTF-8 unique avec le texte de tous les chunks. Le
+fichier est ouvert en mmap : le texte n est décodé qu à l accès et les pages
+sont partagées entre workers via le page cache. L index FAISS est lui aussi
+ouvert en mmap quand la version de FAISS le permet.
+
+`{base}_vectors.f32` (index quantifiés uniquement) contient les embeddings
+float32 bruts, ligne à ligne, pour le re-scoring exact des candidats.
+
+Conversion depuis l ancien format JSON :
+
+    python -m app.chat.index_store app/rag_index
+"""
+import sys
+import json
+import mmap
+import shutil
+import struct
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Sequence, Union, overload
+
+import numpy as np
+
+MAGIC = b"RAGCHNK1"
+# magic, nombre de chunks, position du blob texte, réservé (alignement 8 octets)
+_HEADER = struct.Struct("<8sQQQ")
+
+
+@dataclass
+class DocumentChunk:
+    content: str
+    page_number: int
+    chunk_id: int
+    document_id: str = ""
+    title: str = ""
+    # Tokens du contenu (tokenizer du modèle de chat), 0 si inconnu
+    token_count: int = 0
+
+
+def json_chunks_path(base_path: Union[str, Path]) -> Path:
+    return Path(f"{base_path}_chunks.json")
+
+
+def bin_chunks_path(base_path: Union[str, Path]) -> Path:
+    return Path(f"{base_path}_chunks.bin")
+
+
+def vectors_path(base_path: Union[str, Path]) -> Path:
+    return Path(f"{base_path}_vectors.f32")
+
+
+class ChunkStoreWriter:
+    """
+    Écriture en flux d un fichier `_chunks.bin` : le texte est déversé dans un
+    fichier temporaire au fil de l eau, seuls les offsets restent en mémoire.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self._blob_path = self.path.with_suffix(self.path.suffix + ".blob.tmp")
+        self._blob = open(self._blob_path, "wb")
+        self._offsets = [0]
+        self._pages: List[int] = []
+        self._chunk_ids: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self._pages)
+
+    def add(self, chunk: DocumentChunk) -> None:
+        data = chunk.content.encode("utf-8")
+        self._blob.write(data)
+        self._offsets.append(self._offsets[-1] + len(data))
+        self._pages.append(chunk.page_number)
+        self._chunk_ids.append(chunk.chunk_id)
+
+    def close(self) -> None:
+        """Assemble en-tête + tableaux + blob, puis remplace le fichier de façon atomique."""
+        self._blob.close()
+        offsets = np.array(self._offsets, dtype="<u8")
+        pages = np.array(self._pages, dtype="<u4")
+        chunk_ids = np.array(self._chunk_ids, dtype="<u4")
+        n = len(pages)
+
+        blob_offset = _HEADER.size + offsets.nbytes + pages.nbytes + chunk_ids.nbytes
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp_path, "wb") as f, open(self._blob_path, "rb") as blob:
+            f.write(_HEADER.pack(MAGIC, n, blob_offset, 0))
+            f.write(offsets.tobytes())
+            f.write(pages.tobytes())
+            f.write(chunk_ids.tobytes())
+            shutil.copyfileobj(blob, f, 1 << 20)
+        self._blob_path.unlink()
+        tmp_path.replace(self.path)
+
+    def abort(self) -> None:
+        self._blob.close()
+        self._blob_path.unlink(missing_ok=True)
+
+    def __enter__(self) -> "ChunkStoreWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class VectorFileWriter:
+    """Écriture en flux des vecteurs float32 (fichier temporaire puis remplacement atomique)."""
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self._tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        self._file = open(self._tmp_path, "wb")
+
+    def add(self, vectors: np.ndarray) -> None:
+        self._file.write(np.ascontiguousarray(vectors, dtype="<f4").tobytes())
+
+    def close(self) -> None:
+        self._file.close()
+        self._tmp_path.replace(self.path)
+
+    def abort(self) -> None:
+        self._file.close()
+        self._tmp_path.unlink(missing_ok=True)
+
+    def __enter__(self) -> "VectorFileWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def open_vectors(path: Union[str, Path], dim: int) -> np.ndarray:
+    """Vue mmappée (n, dim) en lecture seule sur un fichier `_vectors.f32`."""
+    return np.memmap(path, dtype="<f4", mode="r").reshape(-1, dim)
+
+
+def write_chunk_store(path: Union[str, Path], chunks: Iterable[DocumentChunk]) -> None:
+    """Écrit les chunks au format binaire (écriture atomique via fichier temporaire)."""
+    with ChunkStoreWriter(path) as writer:
+        for chunk in chunks:
+            writer.add(chunk)
+
+
+class ChunkStore(Sequence[DocumentChunk]):
+    """Vue en lecture seule, mmappée, sur un fichier `_chunks.bin`."""
+
+    def __init__(self, path: Union[str, Path], document_id: str = "", title: str = "",
+                 token_counts: Optional[np.ndarray] = None):
+        self.path = Path(path)
+        self.document_id = document_id
+        self.title = title
+        self.token_counts = token_counts
+        self._file = open(self.path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, n, blob_offset, _ = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Format de chunks inconnu: {self.path}")
+
+        pos = _HEADER.size
+        self._offsets = np.frombuffer(self._mmap, dtype="<u8", count=n + 1, offset=pos)
+        pos += self._offsets.nbytes
+        self._pages = np.frombuffer(self._mmap, dtype="<u4", count=n, offset=pos)
+        pos += self._pages.nbytes
+        self._chunk_ids = np.frombuffer(self._mmap, dtype="<u4", count=n, offset=pos)
+        self._blob_offset = blob_offset
+        self._n = n
+
+    def __len__(self) -> int:
+        return self._n
+
+    def text(self, i: int) -> str:
+        start = self._blob_offset + int(self._offsets[i])
+        end = self._blob_offset + int(self._offsets[i + 1])
+        return self._mmap[start:end].decode("utf-8")
+
+    @overload
+    def __getitem__(self, i: int) -> DocumentChunk: ...
+    @overload
+    def __getitem__(self, i: slice) -> List[DocumentChunk]: ...
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._n))]
+        if i < 0:
+            i += self._n
+        if not 0 <= i < self._n:
+            raise IndexError(i)
+        return DocumentChunk(
+            content=self.text(i),
+            page_number=int(self._pages[i]),
+            chunk_id=int(self._chunk_ids[i]),
+            document_id=self.document_id,
+            title=self.title,
+            token_count=int(self.token_counts[i]) if self.token_counts is not None else 0,
+        )
+
+    def __iter__(self) -> Iterator[DocumentChunk]:
+        for i in range(self._n):
+            yield self[i]
+
+
+def load_json_chunks(path: Union[str, Path]) -> List[DocumentChunk]:
+    with open(path, "r", encoding="utf-8") as f:
+        chunks_data = json.load(f)
+    return [
+        DocumentChunk(
+            content=data["content"],
+            page_number=data["page_number"],
+            chunk_id=data["chunk_id"],
+        )
+        for data in chunks_data
+    ]
+
+
+def convert_json_to_bin(base_path: Union[str, Path]) -> Path:
+    """Convertit `{base}_chunks.json` en `{base}_chunks.bin`."""
+    chunks = load_json_chunks(json_chunks_path(base_path))
+    target = bin_chunks_path(base_path)
+    write_chunk_store(target, chunks)
+    return target
+
+
+def read_faiss_index(path: Union[str, Path]):
+    """Ouvre un index FAISS en mmap lecture seule, ou en mémoire si non supporté."""
+    import faiss
+
+    flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+    try:
+        return faiss.read_index(str(path), flags)
+    except RuntimeError:
+        return faiss.read_index(str(path))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python -m app.chat.index_store <base_path>  (ex: app/rag_index)")
+        sys.exit(1)
+    output = convert_json_to_bin(sys.argv[1])
+    print(f"✅ Chunks convertis: {output} ({output.stat().st_size} octets)")
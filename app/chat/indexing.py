@@ -0,0 +1,545 @@
+"""
+Construction incrémentale de l index RAG, un shard par document.
+
+Chaque document de `app/static/document` a son propre shard
+(`{shards_dir}/{document_id}.*`). Un manifest (`{base}_manifest.json`) décrit
+ce qui a servi à le construire : hash du document, paramètres de découpage,
+modèle d embedding et hash de chaque chunk. Les embeddings sont conservés dans
+un cache persistant indexé par hash du texte (`{base}_embcache.npz`) : seuls
+les chunks nouveaux ou modifiés sont ré-encodés, et ajouter ou retirer un
+document ne touche pas aux autres shards.
+"""
+import os
+import re
+import json
+import heapq
+import hashlib
+import unicodedata
+from contextlib import nullcontext
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from app.pdf_extraction import iter_pdf_chunks, split_words
+from . import ann
+from .ann import IndexBuilder, IndexSpec, apply_search_params
+from .context_packing import count_tokens_batch, load_token_counts, save_token_counts, token_counts_path
+from .lexical import BM25Builder, BM25Index, CorpusStats, bm25_path
+from .index_store import (
+    DocumentChunk,
+    ChunkStore,
+    ChunkStoreWriter,
+    VectorFileWriter,
+    open_vectors,
+    vectors_path,
+    convert_json_to_bin,
+    read_faiss_index,
+    bin_chunks_path,
+    json_chunks_path,
+)
+
+MANIFEST_VERSION = 1
+
+# Paramètres de construction (consignés dans chaque manifest)
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+CHUNK_SIZE = 400
+MIN_CHUNK_CHARS = 50
+SUPPORTED_EXTENSIONS = (".pdf", ".txt")
+
+# Extraction parallèle (mémoire bornée) et embedding par lots
+EXTRACT_WORKERS = int(os.getenv("RAG_EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+EXTRACT_PAGES_PER_TASK = int(os.getenv("RAG_EXTRACT_PAGES_PER_TASK", "16"))
+EMBED_BATCH_SIZE = int(os.getenv("RAG_EMBED_BATCH_SIZE", "256"))
+
+# Type d index FAISS (flat, ivf_flat, hnsw, ivf_pq) et ses paramètres
+INDEX_SPEC = IndexSpec.from_env()
+
+
+def file_sha256(path: Union[str, Path]) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def manifest_path(base_path: Union[str, Path]) -> Path:
+    return Path(f"{base_path}_manifest.json")
+
+
+def embedding_cache_path(base_path: Union[str, Path]) -> Path:
+    return Path(f"{base_path}_embcache.npz")
+
+
+@dataclass
+class IndexManifest:
+    source_sha256: str
+    chunk_size: int
+    min_chunk_chars: int
+    embedding_model: str
+    chunk_hashes: List[str] = field(default_factory=list)
+    document_id: str = ""
+    title: str = ""
+    source_path: str = ""
+    # Paramètres de construction demandés / réellement utilisés (cf. IndexSpec.fitted)
+    index: Dict[str, Any] = field(default_factory=dict)
+    index_effective: Dict[str, Any] = field(default_factory=dict)
+    version: int = MANIFEST_VERSION
+
+    def matches(self, other: "IndexManifest") -> bool:
+        """Même source, mêmes paramètres, même modèle (les hash de chunks en découlent)."""
+        return (
+            self.version == other.version
+            and self.source_sha256 == other.source_sha256
+            and self.chunk_size == other.chunk_size
+            and self.min_chunk_chars == other.min_chunk_chars
+            and self.embedding_model == other.embedding_model
+            # Manifests antérieurs aux types d index : index exhaustif
+            and (self.index or {"kind": "flat"}) == (other.index or {"kind": "flat"})
+        )
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> Optional["IndexManifest"]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return cls(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def save(self, path: Union[str, Path]) -> None:
+        path = Path(path)
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(asdict(self), f)
+        tmp_path.replace(path)
+
+
+class EmbeddingCache:
+    """
+    Cache persistant hash(texte) -> embedding normalisé, propre à un modèle.
+    Entièrement chargé en mémoire : tous les vecteurs du document.
+    """
+
+    def __init__(self, path: Union[str, Path], model_name: str):
+        self.path = Path(path)
+        self.model_name = model_name
+        self._vectors: Dict[str, np.ndarray] = {}
+        self._dirty = False
+        self._load()
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                if str(data["model"]) != self.model_name:
+                    print(f"⚠️ Cache d embeddings ignoré (modèle {data['model']})")
+                    return
+                for h, vector in zip(data["hashes"], data["vectors"]):
+                    self._vectors[str(h)] = vector
+        except Exception as e:
+            print(f"⚠️ Cache d embeddings illisible, ignoré: {e}")
+
+    def __len__(self) -> int:
+        return len(self._vectors)
+
+    def __contains__(self, h: str) -> bool:
+        return h in self._vectors
+
+    def get(self, h: str) -> Optional[np.ndarray]:
+        return self._vectors.get(h)
+
+    def put_many(self, hashes: Iterable[str], vectors: np.ndarray) -> None:
+        for h, vector in zip(hashes, vectors):
+            self._vectors[h] = np.asarray(vector, dtype="float32")
+        self._dirty = True
+
+    def prune(self, keep: Iterable[str]) -> None:
+        """Ne garde que les hash encore référencés."""
+        keep = set(keep)
+        removed = [h for h in self._vectors if h not in keep]
+        for h in removed:
+            del self._vectors[h]
+        if removed:
+            self._dirty = True
+
+    def save(self) -> None:
+        if not self._dirty:
+            return
+        hashes = list(self._vectors)
+        vectors = np.vstack([self._vectors[h] for h in hashes]) if hashes else np.zeros((0, 0), "float32")
+        tmp_path = self.path.with_name(self.path.name + ".tmp.npz")
+        np.savez(tmp_path, model=np.array(self.model_name), hashes=np.array(hashes), vectors=vectors)
+        tmp_path.replace(self.path)
+        self._dirty = False
+
+
+# ── Documents ─────────────────────────────────────────────────────────────────
+
+def discover_documents(document_dir: Union[str, Path]) -> List[Path]:
+    """Documents indexables du dossier, triés pour un ordre stable."""
+    document_dir = Path(document_dir)
+    if not document_dir.is_dir():
+        return []
+    return sorted(
+        p for p in document_dir.iterdir()
+        if p.is_file() and p.suffix.lower() in SUPPORTED_EXTENSIONS
+    )
+
+
+def document_id_for(path: Union[str, Path]) -> str:
+    """Identifiant stable (slug du nom de fichier) utilisé comme nom de shard."""
+    stem = unicodedata.normalize("NFKD", Path(path).stem).encode("ascii", "ignore").decode()
+    return re.sub(r"[^a-z0-9]+", "-", stem.lower()).strip("-") or "document"
+
+
+def split_id_collisions(paths: Iterable[Path]) -> Tuple[List[Path], List[Tuple[Path, Path]]]:
+    """
+    (documents indexables, [(ignoré, retenu)]) : deux fichiers au même
+    identifiant (`guide.pdf` / `guide.txt`, `Guide Été.pdf` / `guide-ete.pdf`)
+    écraseraient le shard l un de l autre ; seul le premier (ordre trié) est gardé.
+    """
+    kept: Dict[str, Path] = {}
+    collisions: List[Tuple[Path, Path]] = []
+    for path in paths:
+        document_id = document_id_for(path)
+        if document_id in kept:
+            collisions.append((path, kept[document_id]))
+        else:
+            kept[document_id] = path
+    return list(kept.values()), collisions
+
+
+def document_title(path: Union[str, Path]) -> str:
+    """Titre issu des métadonnées PDF, sinon dérivé du nom de fichier."""
+    path = Path(path)
+    if path.suffix.lower() == ".pdf":
+        try:
+            from pypdf import PdfReader
+            title = (PdfReader(path).metadata or {}).get("/Title")
+            if title and str(title).strip():
+                return str(title).strip()
+        except Exception:
+            pass
+    return path.stem.replace("_", " ").replace("-", " ").strip()
+
+
+def iter_document_chunks(path: Union[str, Path], chunk_size: int = CHUNK_SIZE,
+                         min_chunk_chars: int = MIN_CHUNK_CHARS,
+                         workers: int = EXTRACT_WORKERS) -> Iterator[DocumentChunk]:
+    """Extrait et découpe un document en flux de chunks de `chunk_size` mots."""
+    path = Path(path)
+    if path.suffix.lower() == ".pdf":
+        pages = iter_pdf_chunks(str(path), chunk_size, min_chunk_chars,
+                                workers=workers, pages_per_task=EXTRACT_PAGES_PER_TASK)
+    else:
+        # Texte brut : les sauts de page (form feed) délimitent les pages
+        text = path.read_text(encoding="utf-8", errors="replace")
+        pages = (
+            (page_num + 1, content)
+            for page_num, page_text in enumerate(text.split("\f"))
+            for content in split_words(page_text, chunk_size, min_chunk_chars)
+        )
+
+    for chunk_id, (page_number, content) in enumerate(pages):
+        yield DocumentChunk(content=content, page_number=page_number, chunk_id=chunk_id)
+
+
+def chunk_document(path: Union[str, Path], chunk_size: int = CHUNK_SIZE,
+                   min_chunk_chars: int = MIN_CHUNK_CHARS) -> List[DocumentChunk]:
+    """Extrait et découpe un document en chunks (liste complète en mémoire)."""
+    return list(iter_document_chunks(path, chunk_size, min_chunk_chars))
+
+
+def batched(items: Iterable[DocumentChunk], size: int) -> Iterator[List[DocumentChunk]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# ── Embeddings et index FAISS ─────────────────────────────────────────────────
+
+def embed_texts(encode: Callable[[List[str]], np.ndarray], texts: List[str],
+                embedding_cache: Optional[EmbeddingCache] = None) -> Tuple[np.ndarray, int]:
+    """
+    Embeddings normalisés des textes. Les textes déjà présents dans le cache
+    (même hash) ne sont pas ré-encodés. Retourne (embeddings, nb réutilisés).
+    """
+    hashes = [text_hash(t) for t in texts]
+    to_encode: Dict[str, str] = {}
+    for h, t in zip(hashes, texts):
+        if (embedding_cache is None or h not in embedding_cache) and h not in to_encode:
+            to_encode[h] = t
+
+    reused = sum(1 for h in hashes if h not in to_encode)
+
+    fresh: Dict[str, np.ndarray] = {}
+    if to_encode:
+        encoded = encode(list(to_encode.values()))
+        fresh = dict(zip(to_encode, encoded))
+        if embedding_cache is not None:
+            embedding_cache.put_many(list(to_encode), encoded)
+
+    vectors = [fresh[h] if h in fresh else embedding_cache.get(h) for h in hashes]
+    if not vectors:
+        return np.zeros((0, 0), dtype="float32"), reused
+    return np.vstack(vectors).astype("float32"), reused
+
+
+def write_faiss_index(index, path: Union[str, Path]) -> None:
+    """Écriture atomique : l ancien fichier peut être mappé par un index en service."""
+    import faiss
+
+    tmp_path = f"{path}.tmp"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, path)
+
+
+# ── Shards ────────────────────────────────────────────────────────────────────
+
+@dataclass
+class RAGShard:
+    """Index FAISS + chunks d un seul document."""
+    document_id: str
+    title: str
+    source_path: str
+    base_path: Path
+    index: Any
+    chunks: Sequence[DocumentChunk]
+    index_spec: IndexSpec = field(default_factory=IndexSpec)
+    # Vecteurs float32 mmappés pour le re-scoring (index quantifiés uniquement)
+    vectors: Optional[np.ndarray] = None
+    # Index BM25 des mêmes chunks (recherche hybride)
+    lexical: Optional[BM25Index] = None
+
+    @property
+    def size(self) -> int:
+        return len(self.chunks)
+
+    def search(self, query_embedding: np.ndarray, top_k: int) -> List[Tuple[DocumentChunk, float]]:
+        if self.index is None or self.index.ntotal == 0:
+            return []
+        scores, indices = ann.search(self.index, query_embedding, min(top_k, self.index.ntotal),
+                                     self.index_spec, self.vectors)
+        return [
+            (self.chunks[idx], float(score))
+            for score, idx in zip(scores[0], indices[0])
+            if 0 <= idx < len(self.chunks)
+        ]
+
+    def search_lexical(self, query: str, top_k: int,
+                       corpus: Optional[CorpusStats] = None) -> List[Tuple[DocumentChunk, float]]:
+        if self.lexical is None:
+            return []
+        return [(self.chunks[idx], score) for idx, score in self.lexical.search(query, top_k, corpus)]
+
+    @classmethod
+    def load(cls, base_path: Path, manifest: IndexManifest,
+             search_spec: IndexSpec = INDEX_SPEC) -> "RAGShard":
+        """
+        Charge un shard sauvegardé (chunks lus à la demande via mmap). Les
+        paramètres de recherche viennent de la configuration courante.
+        """
+        index = read_faiss_index(f"{base_path}.faiss")
+        apply_search_params(index, search_spec)
+        effective = IndexSpec.from_dict(manifest.index_effective or manifest.index or {})
+        return cls(
+            document_id=manifest.document_id,
+            title=manifest.title,
+            source_path=manifest.source_path,
+            base_path=base_path,
+            index=index,
+            chunks=ChunkStore(bin_chunks_path(base_path), manifest.document_id, manifest.title,
+                              load_token_counts(token_counts_path(base_path))),
+            index_spec=effective.with_search_params(search_spec),
+            vectors=load_rescore_vectors(base_path, index, search_spec),
+            lexical=BM25Index.load(bm25_path(base_path)) if bm25_path(base_path).exists() else None,
+        )
+
+    def describe(self) -> dict:
+        return {
+            "document_id": self.document_id,
+            "title": self.title,
+            "source": Path(self.source_path).name,
+            "chunks": self.size,
+            "index": self.index_spec.build_params(),
+        }
+
+
+def merge_results(per_shard: Iterable[List[Tuple[DocumentChunk, float]]],
+                  top_k: int) -> List[Tuple[DocumentChunk, float]]:
+    """Fusionne les top-k de chaque shard (scores cosinus comparables)."""
+    return heapq.nlargest(top_k, (r for results in per_shard for r in results), key=lambda r: r[1])
+
+
+def shard_base_path(shards_dir: Union[str, Path], document_id: str) -> Path:
+    return Path(shards_dir) / document_id
+
+
+def shard_files(base_path: Path) -> List[Path]:
+    return [
+        Path(f"{base_path}.faiss"),
+        bin_chunks_path(base_path),
+        manifest_path(base_path),
+        embedding_cache_path(base_path),
+        vectors_path(base_path),
+        bm25_path(base_path),
+        token_counts_path(base_path),
+    ]
+
+
+def load_rescore_vectors(base_path: Path, index, spec: IndexSpec) -> Optional[np.ndarray]:
+    """Vecteurs float32 mmappés si le re-scoring est demandé et disponible."""
+    path = vectors_path(base_path)
+    if index is None or not spec.rescore or not path.exists():
+        return None
+    return open_vectors(path, index.d)
+
+
+def seed_embedding_cache(cache: EmbeddingCache, base_path: Union[str, Path]) -> None:
+    """Alimente le cache avec les vecteurs d un index existant (ex. ancien index unique)."""
+    try:
+        index = read_faiss_index(f"{base_path}.faiss")
+        if not bin_chunks_path(base_path).exists():
+            convert_json_to_bin(base_path)
+        chunks = ChunkStore(bin_chunks_path(base_path))
+        vectors = index.reconstruct_n(0, index.ntotal)
+        cache.put_many([text_hash(c.content) for c in chunks], vectors)
+        print(f"♻️ {len(cache)} embeddings récupérés depuis {base_path}")
+    except Exception as e:
+        print(f"⚠️ Impossible de réutiliser l index {base_path}: {e}")
+
+
+def sync_shard(source_path: Path, shards_dir: Union[str, Path],
+               encode: Callable[[List[str]], np.ndarray],
+               model_id: str = EMBEDDING_MODEL_NAME,
+               current_shard: Optional[RAGShard] = None, force: bool = False,
+               seed_from: Optional[Path] = None,
+               index_spec: IndexSpec = INDEX_SPEC) -> Tuple[RAGShard, dict]:
+    """
+    Vérifie le shard d un document contre son manifest et ne ré-encode que les
+    chunks nouveaux ou modifiés. Retourne (shard, résumé).
+
+    L extraction est en flux, mais la mémoire de la reconstruction croît avec
+    le nombre de chunks (vecteurs et postings BM25, cf. ci-dessous).
+    """
+    document_id = document_id_for(source_path)
+    base_path = shard_base_path(shards_dir, document_id)
+    Path(shards_dir).mkdir(parents=True, exist_ok=True)
+
+    expected = IndexManifest(
+        source_sha256=file_sha256(source_path),
+        chunk_size=CHUNK_SIZE,
+        min_chunk_chars=MIN_CHUNK_CHARS,
+        embedding_model=model_id,
+        document_id=document_id,
+        source_path=str(source_path),
+        index=index_spec.build_params(),
+    )
+    current = IndexManifest.load(manifest_path(base_path))
+    has_files = all(p.exists() for p in (
+        Path(f"{base_path}.faiss"), bin_chunks_path(base_path), bm25_path(base_path), token_counts_path(base_path),
+    ))
+
+    if has_files and not force and current is not None and current.matches(expected):
+        shard = current_shard if current_shard is not None else RAGShard.load(base_path, current)
+        return shard, {"document_id": document_id, "status": "up_to_date", "chunks": shard.size}
+
+    print(f"🔄 Shard {document_id} absent ou obsolète : reconstruction incrémentale...")
+    cache = EmbeddingCache(embedding_cache_path(base_path), model_id)
+    if len(cache) == 0 and seed_from is not None and model_id == EMBEDDING_MODEL_NAME and Path(f"{seed_from}.faiss").exists():
+        seed_embedding_cache(cache, seed_from)
+
+    title = document_title(source_path)
+    builder = IndexBuilder(index_spec)
+    bm25_builder = BM25Builder()
+    reused = 0
+    chunk_hashes: List[str] = []
+    token_counts: List[int] = []
+
+    # Extraction → embedding → index en flux, par lots de EMBED_BATCH_SIZE chunks :
+    # le texte et les chunks partent sur disque au fil de l eau. Restent en
+    # mémoire, proportionnels au nombre de chunks : l index FAISS en
+    # construction, le cache d embeddings (vecteurs du document) et les
+    # postings BM25, soit environ 3 Ko par chunk (384 dimensions, index flat).
+    # Index quantifié : les vecteurs float32 vont sur disque pour le re-scoring.
+    vector_file = VectorFileWriter(vectors_path(base_path)) if index_spec.is_quantized else nullcontext()
+    with ChunkStoreWriter(bin_chunks_path(base_path)) as writer, vector_file as vector_writer:
+        for batch in batched(iter_document_chunks(source_path), EMBED_BATCH_SIZE):
+            embeddings, batch_reused = embed_texts(encode, [c.content for c in batch], cache)
+            reused += batch_reused
+            builder.add(embeddings)
+            if vector_writer is not None:
+                vector_writer.add(embeddings)
+            token_counts.extend(count_tokens_batch([c.content for c in batch]))
+            for chunk in batch:
+                writer.add(chunk)
+                bm25_builder.add(chunk.content)
+                chunk_hashes.append(text_hash(chunk.content))
+            print(f"   … {len(chunk_hashes)} chunks indexés")
+
+    index, effective_spec = builder.finish()
+    if index is not None:
+        write_faiss_index(index, f"{base_path}.faiss")
+    if index is None or not effective_spec.is_quantized:
+        vectors_path(base_path).unlink(missing_ok=True)
+    lexical = bm25_builder.build()
+    lexical.save(bm25_path(base_path))
+    save_token_counts(token_counts_path(base_path), token_counts)
+    shard = RAGShard(
+        document_id=document_id,
+        title=title,
+        source_path=str(source_path),
+        base_path=base_path,
+        index=index,
+        chunks=ChunkStore(bin_chunks_path(base_path), document_id, title,
+                          load_token_counts(token_counts_path(base_path))),
+        index_spec=effective_spec,
+        vectors=load_rescore_vectors(base_path, index, index_spec),
+        lexical=lexical,
+    )
+
+    expected.title = title
+    expected.index_effective = effective_spec.to_dict()
+    expected.chunk_hashes = chunk_hashes
+    cache.prune(expected.chunk_hashes)
+    cache.save()
+    expected.save(manifest_path(base_path))
+    print(f"✅ Shard {document_id} reconstruit: {shard.size} chunks, index {effective_spec.kind} "
+          f"({reused} embeddings réutilisés)")
+    return shard, {
+        "document_id": document_id,
+        "status": "rebuilt",
+        "chunks": shard.size,
+        "reused": reused,
+        "embedded": shard.size - reused,
+    }
+
+
+def remove_shard_files(base_path: Path) -> None:
+    for path in shard_files(base_path):
+        path.unlink(missing_ok=True)
+
+
+def orphan_shards(shards_dir: Union[str, Path], document_ids: Iterable[str]) -> List[Path]:
+    """Shards sur disque dont le document source n existe plus."""
+    shards_dir = Path(shards_dir)
+    if not shards_dir.is_dir():
+        return []
+    keep = set(document_ids)
+    return [
+        Path(str(p)[: -len("_manifest.json")])
+        for p in shards_dir.glob("*_manifest.json")
+        if p.name[: -len("_manifest.json")] not in keep
+    ]
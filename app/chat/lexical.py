@@ -0,0 +1,196 @@
+"""
+Index lexical BM25 d un shard, construit à partir des mêmes chunks que
+l index FAISS, et fusion des classements dense + lexical (Reciprocal Rank
+Fusion).
+
+Le dense retrouve les paraphrases, le BM25 les termes rares et exacts
+(« Jézabel », « loi de Briffault », « hypergamie ») ; la fusion permet de
+garder moins de chunks, mieux ciblés.
+
+Stockage `{base}_bm25.npz` : vocabulaire, postings au format CSR (chunks et
+fréquences par terme) et longueur de chaque chunk.
+
+Chaque shard a son propre index, mais une recherche sur plusieurs shards
+utilise les statistiques du corpus entier (`corpus_stats` : nombre de chunks,
+longueur moyenne, fréquence documentaire des termes de la query) : les scores
+sont alors comparables d un shard à l autre.
+"""
+import re
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Hashable, Iterable, List, Optional, Sequence, Tuple, TypeVar, Union
+
+import numpy as np
+
+T = TypeVar("T")
+
+# Mots vides français (et quelques anglais) : peu discriminants pour BM25
+STOPWORDS = frozenset("""
+a ai aie ait alors au aucun aussi autre aux avec avoir c ca ce ceci cela celle celles celui ces cet cette
+chez ci comme comment d dans de des donc dont du elle elles en encore est et etre eu fait faire il ils j
+je l la le les leur leurs lui m ma mais me meme mes moi mon n ne ni nos notre nous on ont ou par pas
+peu plus pour pourquoi qu quand que quel quelle quelles quels qui s sa sans se ses si son sont sur t ta
+te tes toi ton tous tout tres tu un une vos votre vous y
+the and of to is in it you that
+""".split())
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def fold(text: str) -> str:
+    """Minuscules sans accents."""
+    text = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def tokenize(text: str) -> List[str]:
+    """Tokens BM25 : repliés, sans mots vides, pluriels simples ramenés au singulier."""
+    tokens = []
+    for token in _TOKEN_RE.findall(fold(text)):
+        if len(token) < 2 or token in STOPWORDS:
+            continue
+        if len(token) > 4 and token[-1] in "sx":
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def bm25_path(base_path: Union[str, Path]) -> Path:
+    return Path(f"{base_path}_bm25.npz")
+
+
+class BM25Builder:
+    """Accumule les chunks dans l ordre de l index FAISS (même identifiant de ligne)."""
+
+    def __init__(self):
+        self._postings: Dict[str, List[Tuple[int, int]]] = {}
+        self._doc_len: List[int] = []
+
+    def add(self, text: str) -> None:
+        doc_id = len(self._doc_len)
+        tokens = tokenize(text)
+        self._doc_len.append(len(tokens))
+        for term, tf in Counter(tokens).items():
+            self._postings.setdefault(term, []).append((doc_id, tf))
+
+    def build(self) -> "BM25Index":
+        vocab = sorted(self._postings)
+        indptr = np.zeros(len(vocab) + 1, dtype="<u8")
+        for i, term in enumerate(vocab):
+            indptr[i + 1] = indptr[i] + len(self._postings[term])
+        doc_ids = np.empty(int(indptr[-1]), dtype="<u4")
+        tfs = np.empty(int(indptr[-1]), dtype="<u2")
+        for i, term in enumerate(vocab):
+            postings = self._postings[term]
+            doc_ids[indptr[i]:indptr[i + 1]] = [d for d, _ in postings]
+            tfs[indptr[i]:indptr[i + 1]] = [min(tf, 65535) for _, tf in postings]
+        return BM25Index(vocab, indptr, doc_ids, tfs, np.array(self._doc_len, dtype="<u4"))
+
+
+@dataclass(frozen=True)
+class CorpusStats:
+    """Statistiques BM25 de plusieurs index réunis, pour les termes d une query."""
+    n_docs: int
+    avg_len: float
+    df: Dict[str, int]
+
+
+class BM25Index:
+    """Okapi BM25 (k1, b usuels) sur les chunks d un shard."""
+
+    def __init__(self, vocab: Sequence[str], indptr: np.ndarray, doc_ids: np.ndarray,
+                 tfs: np.ndarray, doc_len: np.ndarray, k1: float = 1.2, b: float = 0.75):
+        self.term_ids = {term: i for i, term in enumerate(vocab)}
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_len = doc_len
+        self.k1 = k1
+        self.b = b
+        self.n_docs = len(doc_len)
+        self.total_len = int(doc_len.sum())
+        self.avg_len = self.total_len / self.n_docs if self.n_docs else 0.0
+
+    def __len__(self) -> int:
+        return self.n_docs
+
+    def document_frequency(self, term: str) -> int:
+        i = self.term_ids.get(term)
+        return 0 if i is None else int(self.indptr[i + 1] - self.indptr[i])
+
+    def search(self, query: str, top_k: int, corpus: Optional[CorpusStats] = None) -> List[Tuple[int, float]]:
+        """
+        [(ligne du chunk, score)] par score décroissant ; seuls les chunks
+        contenant un terme. `corpus` : IDF et longueur moyenne du corpus entier
+        (sinon celles du shard).
+        """
+        if not self.n_docs:
+            return []
+        n_docs = corpus.n_docs if corpus is not None else self.n_docs
+        avg_len = corpus.avg_len if corpus is not None else self.avg_len
+        scores = np.zeros(self.n_docs, dtype="float32")
+        norm = self.k1 * (1 - self.b + self.b * self.doc_len / max(avg_len, 1e-9))
+        for term in set(tokenize(query)):
+            i = self.term_ids.get(term)
+            if i is None:
+                continue
+            start, end = int(self.indptr[i]), int(self.indptr[i + 1])
+            ids = self.doc_ids[start:end]
+            tf = self.tfs[start:end].astype("float32")
+            df = corpus.df.get(term, end - start) if corpus is not None else end - start
+            idf = np.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            scores[ids] += idf * tf * (self.k1 + 1) / (tf + norm[ids])
+
+        matched = np.flatnonzero(scores)
+        if not len(matched):
+            return []
+        if len(matched) > top_k:
+            matched = matched[np.argpartition(-scores[matched], top_k - 1)[:top_k]]
+        matched = matched[np.argsort(-scores[matched])]
+        return [(int(i), float(scores[i])) for i in matched]
+
+    def save(self, path: Union[str, Path]) -> None:
+        path = Path(path)
+        tmp_path = path.with_name(path.name + ".tmp.npz")
+        vocab = sorted(self.term_ids, key=self.term_ids.get)
+        np.savez(tmp_path, vocab=np.array(vocab, dtype=str), indptr=self.indptr,
+                 doc_ids=self.doc_ids, tfs=self.tfs, doc_len=self.doc_len)
+        tmp_path.replace(path)
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "BM25Index":
+        with np.load(path, allow_pickle=False) as data:
+            return cls([str(t) for t in data["vocab"]], data["indptr"], data["doc_ids"],
+                       data["tfs"], data["doc_len"])
+
+
+def corpus_stats(indexes: Iterable[BM25Index], query: str) -> CorpusStats:
+    """Statistiques réunies des `indexes` pour les termes de `query`."""
+    terms = set(tokenize(query))
+    n_docs, total_len, df = 0, 0, dict.fromkeys(terms, 0)
+    for index in indexes:
+        n_docs += index.n_docs
+        total_len += index.total_len
+        for term in terms:
+            df[term] += index.document_frequency(term)
+    return CorpusStats(n_docs, total_len / n_docs if n_docs else 0.0, df)
+
+
+def reciprocal_rank_fusion(rankings: Iterable[Sequence[Tuple[T, float]]], key,
+                           k: int = 60, top_k: int = 5) -> List[Tuple[T, float]]:
+    """
+    Fusionne des classements [(élément, score)] : chaque élément reçoit
+    Σ 1 / (k + rang). Seuls les rangs comptent (les scores cosinus et BM25
+    ne sont pas comparables). `key` identifie un même élément entre listes.
+    """
+    fused: Dict[Hashable, float] = {}
+    items: Dict[Hashable, T] = {}
+    for ranking in rankings:
+        for rank, (item, _) in enumerate(ranking, start=1):
+            item_key = key(item)
+            fused[item_key] = fused.get(item_key, 0.0) + 1.0 / (k + rank)
+            items.setdefault(item_key, item)
+    best = sorted(fused.items(), key=lambda kv: kv[1], reverse=True)[:top_k]
+    return [(items[item_key], score) for item_key, score in best]
@@ -0,0 +1,235 @@
+"""
+Appels chat.completions résilients : c est ici, et non dans le SDK
+(max_retries=0 sur le client), que sont gérés délais et reprises.
+
+    - délai par tentative : `attempt_timeout` (en streaming : jusqu à
+      l ouverture du flux ; ensuite `stream_idle_timeout` entre deux chunks) ;
+    - reprises sur 429, 5xx, timeout et erreur réseau, avec backoff
+      exponentiel à jitter ; un en-tête Retry-After plus long est respecté ;
+      le tout dans un budget global `total_timeout` ;
+    - hedging (optionnel, hors streaming) : si la réponse tarde au-delà du p95
+      des latences récentes, une 2e requête identique part, la première
+      réponse gagne et l autre est annulée ;
+    - disjoncteur : après `breaker_failures` échecs consécutifs, les appels
+      échouent immédiatement (CircuitOpenError → message de repli) pendant
+      `breaker_reset_seconds`, puis une requête d essai décide de la reprise.
+
+Chaque issue est comptée dans le compteur `llm_calls` (label = issue).
+"""
+import time
+import random
+import asyncio
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Optional
+
+import openai
+
+from . import metrics
+
+_outcomes = metrics.counter("llm_calls", "Appels OpenAI par issue (success, retry, timeout, hedge_won...)")
+_latency = metrics.histogram("llm_latency_ms", metrics.LATENCY_MS_BUCKETS, "Durée des appels OpenAI réussis")
+_breaker_state = metrics.gauge("llm_circuit_open", "1 quand le disjoncteur OpenAI est ouvert")
+
+# Latences récentes conservées pour le délai de hedging
+_LATENCY_WINDOW = 200
+# Échantillons minimum avant d utiliser le quantile (sinon hedge_min_delay)
+_HEDGE_MIN_SAMPLES = 20
+
+
+class CircuitOpenError(Exception):
+    """Disjoncteur ouvert : OpenAI n est pas appelé."""
+
+
+class CircuitBreaker:
+    """closed → open (après N échecs consécutifs) → half_open (1 essai) → closed | open."""
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+            self.state = "half_open"
+        if self.state == "half_open" and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        if self.state != "closed":
+            print("✅ Disjoncteur OpenAI refermé")
+        self.state, self.failures, self._probe_in_flight = "closed", 0, False
+        _breaker_state.set(0)
+
+    def release_probe(self) -> None:
+        """Requête d essai abandonnée (annulée) sans verdict : une autre pourra la remplacer."""
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                print(f"🔌 Disjoncteur OpenAI ouvert ({self.failures} échecs consécutifs)")
+            self.state, self.opened_at = "open", time.monotonic()
+            _breaker_state.set(1)
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    return getattr(error, "status_code", None)
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, (asyncio.TimeoutError, openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    status = _status_code(error)
+    return status is not None and (status == 429 or status >= 500)
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """Délai demandé par le serveur (retry-after-ms ou retry-after en secondes)."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        return None
+    return None
+
+
+def _outcome(error: BaseException) -> str:
+    if isinstance(error, (asyncio.TimeoutError, openai.APITimeoutError)):
+        return "timeout"
+    status = _status_code(error)
+    if status == 429:
+        return "rate_limited"
+    if status is not None and status >= 500:
+        return "server_error"
+    if status is not None:
+        return "client_error"
+    return "connection_error"
+
+
+class ResilientLLM:
+    def __init__(self, client: Any, attempt_timeout: float = 20.0, total_timeout: float = 45.0,
+                 max_attempts: int = 3, backoff_base: float = 0.5, backoff_max: float = 8.0,
+                 hedge: bool = False, hedge_quantile: float = 0.95, hedge_min_delay: float = 2.0,
+                 stream_idle_timeout: float = 20.0, breaker: Optional[CircuitBreaker] = None):
+        self.client = client
+        self.attempt_timeout = attempt_timeout
+        self.total_timeout = total_timeout
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.stream_idle_timeout = stream_idle_timeout
+        self.breaker = breaker or CircuitBreaker()
+        self._latencies: Deque[float] = deque(maxlen=_LATENCY_WINDOW)
+
+    # ── Hedging ────────────────────────────────────────────────────────────────
+    def hedge_delay(self) -> float:
+        """p95 (par défaut) des latences récentes, `hedge_min_delay` au minimum."""
+        if len(self._latencies) < _HEDGE_MIN_SAMPLES:
+            return self.hedge_min_delay
+        ordered = sorted(self._latencies)
+        index = min(int(self.hedge_quantile * len(ordered)), len(ordered) - 1)
+        return max(ordered[index], self.hedge_min_delay)
+
+    async def _hedged(self, kwargs: dict, timeout: float) -> Any:
+        deadline = time.monotonic() + timeout
+        primary = asyncio.ensure_future(self.client.chat.completions.create(**kwargs))
+        pending = {primary}
+        error: Optional[BaseException] = None
+        try:
+            done, pending = await asyncio.wait(pending, timeout=min(self.hedge_delay(), timeout))
+            if done:
+                return primary.result()
+            _outcomes.inc(label="hedge_fired")
+            backup = asyncio.ensure_future(self.client.chat.completions.create(**kwargs))
+            pending.add(backup)
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=max(deadline - time.monotonic(), 0),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise asyncio.TimeoutError()
+                for task in done:
+                    if task.exception() is None:
+                        if task is backup:
+                            _outcomes.inc(label="hedge_won")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # Requête perdante (ou abandonnée) : annulée
+            for task in pending:
+                task.cancel()
+
+    # ── Appel ──────────────────────────────────────────────────────────────────
+    async def _attempt(self, kwargs: dict, timeout: float) -> Any:
+        if self.hedge and not kwargs.get("stream"):
+            return await self._hedged(kwargs, timeout)
+        return await asyncio.wait_for(self.client.chat.completions.create(**kwargs), timeout)
+
+    async def create(self, **kwargs) -> Any:
+        """Comme chat.completions.create ; en streaming, itérer avec `iterate`."""
+        if not self.breaker.allow():
+            _outcomes.inc(label="circuit_open")
+            raise CircuitOpenError("OpenAI indisponible (disjoncteur ouvert)")
+
+        deadline = time.monotonic() + self.total_timeout
+        for attempt in range(1, self.max_attempts + 1):
+            remaining = deadline - time.monotonic()
+            started = time.perf_counter()
+            try:
+                response = await self._attempt(kwargs, min(self.attempt_timeout, remaining))
+            except asyncio.CancelledError:
+                self.breaker.release_probe()
+                raise
+            except Exception as e:
+                outcome = _outcome(e)
+                _outcomes.inc(label=outcome)
+                if not is_retryable(e):
+                    # Requête invalide : ni reprise, ni panne du service (qui a répondu)
+                    self.breaker.record_success()
+                    raise
+                delay = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+                delay = max(delay, retry_after_seconds(e) or 0)
+                if attempt == self.max_attempts or time.monotonic() + delay >= deadline:
+                    self.breaker.record_failure()
+                    _outcomes.inc(label="exhausted")
+                    raise
+                _outcomes.inc(label="retry")
+                print(f"🔁 OpenAI {outcome} (essai {attempt}/{self.max_attempts}), nouvel essai dans {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+
+            elapsed = time.perf_counter() - started
+            self._latencies.append(elapsed)
+            _latency.observe(elapsed * 1000)
+            self.breaker.record_success()
+            _outcomes.inc(label="success")
+            return response
+
+    async def iterate(self, stream: Any) -> AsyncIterator[Any]:
+        """Chunks d un flux, en abandonnant si aucun n arrive en `stream_idle_timeout`."""
+        iterator = stream.__aiter__()
+        while True:
+            try:
+                chunk = await asyncio.wait_for(iterator.__anext__(), self.stream_idle_timeout)
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError:
+                _outcomes.inc(label="stream_stalled")
+                raise
+            yield chunk
@@ -0,0 +1,145 @@
+"""
+Métriques en mémoire du module chat (compteurs et histogrammes), exposées
+par GET /chat/metrics. Volontairement minimal : un seul process, pas de
+dépendance externe.
+"""
+import threading
+from typing import Dict, Optional, Sequence
+
+_lock = threading.Lock()
+_REGISTRY: Dict[str, object] = {}
+
+
+class Counter:
+    """Compteur monotone, éventuellement ventilé par label."""
+
+    def __init__(self, name: str, description: str = ""):
+        self.name = name
+        self.description = description
+        self._values: Dict[str, float] = {}
+
+    def inc(self, amount: float = 1, label: str = "") -> None:
+        with _lock:
+            self._values[label] = self._values.get(label, 0) + amount
+
+    def value(self, label: str = "") -> float:
+        return self._values.get(label, 0)
+
+    def snapshot(self) -> dict:
+        with _lock:
+            values = dict(self._values)
+        if list(values) == [""]:
+            return {"type": "counter", "value": values[""]}
+        return {"type": "counter", "values": values}
+
+
+class Gauge:
+    """Valeur instantanée (profondeur de file, taille de cache...)."""
+
+    def __init__(self, name: str, description: str = ""):
+        self.name = name
+        self.description = description
+        self._value = 0.0
+
+    def set(self, value: float) -> None:
+        self._value = value
+
+    def inc(self, amount: float = 1) -> None:
+        with _lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        with _lock:
+            self._value -= amount
+
+    def value(self) -> float:
+        return self._value
+
+    def snapshot(self) -> dict:
+        return {"type": "gauge", "value": self._value}
+
+
+class Histogram:
+    """Histogramme à buckets fixes (bornes supérieures inclusives)."""
+
+    def __init__(self, name: str, buckets: Sequence[float], description: str = ""):
+        self.name = name
+        self.description = description
+        self.buckets = sorted(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)  # dernier = +Inf
+        self._count = 0
+        self._sum = 0.0
+        self._max = 0.0
+
+    def observe(self, value: float) -> None:
+        with _lock:
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self._counts[i] += 1
+                    break
+            else:
+                self._counts[-1] += 1
+            self._count += 1
+            self._sum += value
+            self._max = max(self._max, value)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimation d un quantile : borne supérieure du bucket qui le contient."""
+        if self._count == 0:
+            return None
+        target = q * self._count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self._counts):
+            cumulative += count
+            if cumulative >= target:
+                return bound
+        return self._max
+
+    def snapshot(self) -> dict:
+        with _lock:
+            counts = list(self._counts)
+            count, total, maximum = self._count, self._sum, self._max
+        labels = [f"le_{b:g}" for b in self.buckets] + ["le_inf"]
+        return {
+            "type": "histogram",
+            "count": count,
+            "sum": round(total, 4),
+            "mean": round(total / count, 4) if count else None,
+            "max": round(maximum, 4),
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": dict(zip(labels, counts)),
+        }
+
+
+def _get_or_create(name: str, factory):
+    with _lock:
+        metric = _REGISTRY.get(name)
+        if metric is None:
+            metric = factory()
+            _REGISTRY[name] = metric
+        return metric
+
+
+def counter(name: str, description: str = "") -> Counter:
+    return _get_or_create(name, lambda: Counter(name, description))
+
+
+def gauge(name: str, description: str = "") -> Gauge:
+    return _get_or_create(name, lambda: Gauge(name, description))
+
+
+def histogram(name: str, buckets: Sequence[float], description: str = "") -> Histogram:
+    return _get_or_create(name, lambda: Histogram(name, buckets, description))
+
+
+def snapshot() -> dict:
+    """État de toutes les métriques enregistrées."""
+    with _lock:
+        metrics = dict(_REGISTRY)
+    return {name: metric.snapshot() for name, metric in sorted(metrics.items())}
+
+
+# Buckets usuels (millisecondes)
+LATENCY_MS_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
@@ -0,0 +1,22 @@
+from sqlalchemy import Column, String, Integer, DateTime, JSON, Text
+from sqlalchemy.sql import func
+from app.database.database import Base
+
+# Conversation côté serveur : le client n envoie que son nouveau message et
+# l identifiant de session, l historique est relu ici.
+class ChatSession(Base):
+    __tablename__ = "chat_sessions"
+
+    # Jeton opaque (secrets.token_urlsafe) : seul secret d accès à la conversation
+    id = Column(String(64), primary_key=True)
+    # Historique compact : [[rôle, contenu], ...] avec rôle "u" / "a" / "s"
+    # (JSON texte : Postgres compresse lui-même les valeurs volumineuses)
+    messages = Column(JSON, nullable=False, default=list)
+    # Nombre total de messages échangés, y compris ceux retirés de `messages`
+    message_count = Column(Integer, nullable=False, default=0)
+    # Résumé glissant des échanges les plus anciens (cf. history.py) et nombre
+    # de messages, depuis le début de la conversation, qu il couvre
+    summary = Column(Text, nullable=True)
+    summary_upto = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), index=True)
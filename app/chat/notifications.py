@@ -0,0 +1,254 @@
+"""
+File de notifications Pushover asynchrone.
+
+Les tools (record_user_details, record_unknown_question) déposent leur
+message dans une file en mémoire et rendent la main immédiatement ; un worker
+de fond envoie les notifications :
+
+    - regroupement : les messages arrivés pendant `digest_window` secondes
+      partent dans un seul message « digest » (découpé sous la limite de
+      Pushover) ;
+    - reprise : échec réseau, 429 ou 5xx → nouvel essai avec backoff
+      exponentiel (et jitter), jusqu à `max_retries` ;
+    - débordement : file pleine, essais épuisés ou arrêt de l application →
+      messages ajoutés à un fichier JSONL local, relu et renvoyé au prochain
+      démarrage du worker.
+
+Une panne de Pushover ne ralentit donc plus les réponses du chat.
+"""
+import json
+import time
+import random
+import asyncio
+from pathlib import Path
+from typing import List, Optional, Union
+
+import httpx
+
+from . import metrics
+
+# Limite de Pushover pour le champ message
+PUSHOVER_MAX_MESSAGE_CHARS = 1024
+
+_enqueued = metrics.counter("notifications_enqueued", "Notifications déposées par les tools")
+_sent = metrics.counter("notifications_sent", "Notifications livrées (messages d origine)")
+_requests = metrics.counter("notifications_requests", "Appels Pushover réussis (digests compris)")
+_retries = metrics.counter("notifications_retries", "Nouveaux essais après un échec Pushover")
+_spilled = metrics.counter("notifications_spilled", "Notifications écrites dans le fichier de débordement")
+_replayed = metrics.counter("notifications_replayed", "Notifications relues depuis le fichier de débordement")
+_dropped = metrics.counter("notifications_dropped", "Notifications rejetées définitivement par Pushover (4xx)")
+_queue_depth = metrics.gauge("notifications_queue_depth", "Notifications en attente d envoi")
+
+
+class PermanentNotificationError(Exception):
+    """Refus de Pushover qu un nouvel essai ne corrigera pas (jeton invalide...)."""
+
+
+def group_for_digests(messages: List[str], max_chars: int = PUSHOVER_MAX_MESSAGE_CHARS) -> List[List[str]]:
+    """Répartit les messages en groupes dont le digest tient sous `max_chars`."""
+    groups, size = [[]], 0
+    for message in messages:
+        line_size = min(len(message), max_chars) + 3
+        if groups[-1] and size + line_size > max_chars - 40:
+            groups.append([])
+            size = 0
+        groups[-1].append(message)
+        size += line_size
+    return groups
+
+
+def format_digest(messages: List[str], max_chars: int = PUSHOVER_MAX_MESSAGE_CHARS) -> str:
+    if len(messages) == 1:
+        return messages[0][:max_chars]
+    text = f"{len(messages)} notifications :\n" + "\n".join(f"• {m}" for m in messages)
+    return text[:max_chars]
+
+
+class NotificationQueue:
+    """File bornée + worker d envoi Pushover (démarré au premier message)."""
+
+    def __init__(self, url: str, user: Optional[str], token: Optional[str],
+                 spill_path: Union[str, Path], max_size: int = 1000, digest_window: float = 2.0,
+                 max_batch: int = 50, max_retries: int = 5, backoff_base: float = 1.0,
+                 backoff_max: float = 60.0, timeout: float = 5.0):
+        self.url = url
+        self.user = user
+        self.token = token
+        self.spill_path = Path(spill_path)
+        self.max_size = max_size
+        self.digest_window = digest_window
+        self.max_batch = max_batch
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.user and self.token)
+
+    # ── Dépôt (chemin de la requête : jamais bloquant) ─────────────────────────
+    def enqueue(self, message: str) -> None:
+        _enqueued.inc()
+        self.start()
+        try:
+            self._queue.put_nowait(message)
+        except asyncio.QueueFull:
+            print("⚠️ File de notifications pleine - message écrit sur disque")
+            self._spill([message])
+        _queue_depth.set(self._queue.qsize())
+
+    def start(self) -> None:
+        """Crée la file et lance le worker (idempotent, relancé s il s est arrêté)."""
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_size)
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self, timeout: float = 5.0) -> None:
+        """Arrêt de l application : dernier envoi borné, le reste part sur disque."""
+        if self._worker is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._worker.cancel()
+        try:
+            # Le worker écrit sur disque le lot en cours avant de s arrêter
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"⚠️ Worker de notifications arrêté sur une erreur: {e}")
+        pending = []
+        while not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+            self._queue.task_done()
+        if pending:
+            self._spill(pending)
+
+    # ── Fichier de débordement ─────────────────────────────────────────────────
+    def _spill(self, messages: List[str]) -> None:
+        try:
+            self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.spill_path, "a", encoding="utf-8") as f:
+                for message in messages:
+                    f.write(json.dumps({"at": time.time(), "message": message}, ensure_ascii=False) + "\n")
+            _spilled.inc(len(messages))
+        except OSError as e:
+            print(f"❌ Notifications perdues ({len(messages)}), écriture impossible: {e}")
+
+    def _replay_spilled(self) -> None:
+        """Remet en file les messages débordés lors d une exécution précédente."""
+        if not self.spill_path.exists():
+            return
+        # Renommé d abord : un débordement pendant la relecture repart dans un fichier neuf
+        replaying = self.spill_path.with_suffix(self.spill_path.suffix + ".replay")
+        self.spill_path.replace(replaying)
+        replayed, overflow = 0, []
+        with open(replaying, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    message = json.loads(line)["message"]
+                except (ValueError, KeyError):
+                    continue
+                try:
+                    self._queue.put_nowait(message)
+                    replayed += 1
+                except asyncio.QueueFull:
+                    overflow.append(message)
+        if overflow:
+            self._spill(overflow)
+        replaying.unlink()
+        _replayed.inc(replayed)
+        _queue_depth.set(self._queue.qsize())
+        if replayed:
+            print(f"📨 Notifications relues depuis {self.spill_path.name}: {replayed}")
+
+    # ── Worker ─────────────────────────────────────────────────────────────────
+    async def _next_batch(self) -> List[str]:
+        """Attend un message puis ramasse ceux qui arrivent pendant digest_window."""
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.digest_window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        try:
+            self._replay_spilled()
+        except OSError as e:
+            print(f"⚠️ Relecture des notifications débordées impossible: {e}")
+        async with httpx.AsyncClient(timeout=self.timeout) as client:
+            while True:
+                batch = await self._next_batch()
+                pending = list(batch)
+                try:
+                    await self._deliver(client, pending)
+                except asyncio.CancelledError:
+                    # Seuls les messages pas encore envoyés : pas de doublon à la relecture
+                    if pending:
+                        self._spill(pending)
+                    raise
+                finally:
+                    for _ in batch:
+                        self._queue.task_done()
+                    _queue_depth.set(self._queue.qsize())
+
+    async def _deliver(self, client: httpx.AsyncClient, pending: List[str]) -> None:
+        """
+        Envoie `pending` en digests ; la liste est vidée au fur et à mesure
+        (envoyés, rejetés ou écrits sur disque) : elle ne contient que le reste.
+        """
+        if not self.configured:
+            for message in pending:
+                print(f"Push (Pushover non configuré): {message}")
+            pending.clear()
+            return
+        for group in group_for_digests(pending):
+            try:
+                await self._send_with_retry(client, format_digest(group))
+            except PermanentNotificationError as e:
+                _dropped.inc(len(group))
+                print(f"❌ Notification rejetée par Pushover: {e}")
+                del pending[:len(group)]
+                continue
+            except Exception as e:
+                print(f"⚠️ Pushover indisponible après {self.max_retries} essais ({e}) - "
+                      f"{len(pending)} notification(s) écrite(s) sur disque")
+                self._spill(pending)
+                pending.clear()
+                return
+            _sent.inc(len(group))
+            print(f"Push: {len(group)} notification(s) envoyée(s)")
+            del pending[:len(group)]
+
+    async def _send_with_retry(self, client: httpx.AsyncClient, message: str) -> None:
+        payload = {"user": self.user, "token": self.token, "message": message}
+        for attempt in range(self.max_retries):
+            try:
+                response = await client.post(self.url, data=payload)
+                if response.status_code < 400:
+                    _requests.inc()
+                    return
+                if response.status_code != 429 and response.status_code < 500:
+                    raise PermanentNotificationError(f"HTTP {response.status_code}: {response.text[:200]}")
+                error: Exception = httpx.HTTPStatusError(
+                    f"HTTP {response.status_code}", request=response.request, response=response
+                )
+            except httpx.HTTPError as e:
+                error = e
+            if attempt == self.max_retries - 1:
+                raise error
+            _retries.inc()
+            delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+            await asyncio.sleep(delay * random.uniform(0.5, 1.0))
@@ -0,0 +1,244 @@
+"""
+Détection du thème d une question et des salutations / demandes de
+présentation.
+
+Les vocabulaires sont compilés une fois à l import dans un `PhraseMatcher` :
+le texte est normalisé (minuscules, sans accents, ponctuation → espaces) et
+découpé en mots, puis un trie de mots trouve en une passe toutes les
+expressions présentes, y compris imbriquées (« ex toxique » et « ex »). Les
+correspondances se font sur des mots entiers : « hi » ne correspond plus à
+« this », ni « ex » à « exemple ». Un mot terminé par `*` correspond à tous
+les mots qui commencent ainsi (« tromp* » : trompe, trompée, tromper...).
+
+Module autonome (aucun import de app.chat) : chargeable par chemin depuis les
+benchmarks et les tests.
+"""
+import re
+import unicodedata
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Hashable, Iterable, List, Sequence, Set, Tuple
+
+_NON_WORD_RE = re.compile(r"[^a-z0-9]+")
+_COMBINING_RE = re.compile("[\u0300-\u036f]+")
+# Au-delà de ce nombre de mots distincts par noeud, les transitions ne sont plus mémorisées
+_TRANSITION_CACHE_SIZE = 4096
+
+
+def normalize(text: str) -> str:
+    """Minuscules, sans accents, mots séparés par un espace."""
+    text = (text or "").casefold()
+    if not text.isascii():
+        text = _COMBINING_RE.sub("", unicodedata.normalize("NFKD", text))
+    return _NON_WORD_RE.sub(" ", text).strip()
+
+
+@lru_cache(maxsize=1024)
+def words(text: str) -> Tuple[str, ...]:
+    """Mots normalisés (mémorisé : thème et salutation analysent le même message)."""
+    normalized = normalize(text)
+    return tuple(normalized.split(" ")) if normalized else ()
+
+
+@dataclass(frozen=True)
+class PhraseMatch:
+    label: Hashable
+    phrase: str
+    start: int  # index du premier mot
+    end: int    # index après le dernier mot
+
+
+class _Node:
+    __slots__ = ("children", "prefixes", "labels", "transitions")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        # (préfixe, noeud) pour les mots terminés par *
+        self.prefixes: List[Tuple[str, "_Node"]] = []
+        self.labels: List[Tuple[Hashable, str]] = []
+        # mot → noeuds suivants (mot exact + préfixes), mémorisé au fil des appels
+        self.transitions: Dict[str, Tuple["_Node", ...]] = {}
+
+    def step(self, token: str) -> Tuple["_Node", ...]:
+        nodes = self.transitions.get(token)
+        if nodes is None:
+            child = self.children.get(token)
+            nodes = ((child,) if child is not None else ()) + tuple(
+                n for p, n in self.prefixes if token.startswith(p)
+            )
+            if len(self.transitions) < _TRANSITION_CACHE_SIZE:
+                self.transitions[token] = nodes
+        return nodes
+
+
+class PhraseMatcher:
+    """Trie de mots construit une fois ; `find_all` parcourt le texte en une passe."""
+
+    def __init__(self, vocabulary: Iterable[Tuple[str, Hashable]]):
+        self._root = _Node()
+        for phrase, label in vocabulary:
+            self.add(phrase, label)
+
+    def add(self, phrase: str, label: Hashable) -> None:
+        tokens: List[Tuple[str, bool]] = []
+        for raw in phrase.split():
+            parts = words(raw.rstrip("*"))
+            tokens.extend((part, False) for part in parts[:-1])
+            if parts:
+                tokens.append((parts[-1], raw.endswith("*")))
+        if not tokens:
+            raise ValueError(f"Expression vide pour le matcher: {phrase!r}")
+
+        node = self._root
+        for token, is_prefix in tokens:
+            if is_prefix:
+                child = next((n for p, n in node.prefixes if p == token), None)
+                if child is None:
+                    child = _Node()
+                    node.prefixes.append((token, child))
+            else:
+                child = node.children.setdefault(token, _Node())
+            node = child
+        self._clear_transitions(self._root)
+        # Variantes identiques une fois normalisées (« ça va » / « ca va ») : une seule entrée
+        if all(existing != label for existing, _ in node.labels):
+            node.labels.append((label, phrase))
+
+    def _clear_transitions(self, node: _Node) -> None:
+        node.transitions.clear()
+        for child in list(node.children.values()) + [n for _, n in node.prefixes]:
+            self._clear_transitions(child)
+
+    def find_all(self, text: str) -> List[PhraseMatch]:
+        """Toutes les expressions présentes, par position puis longueur."""
+        return self.find_in_words(words(text))
+
+    def find_in_words(self, tokens: Sequence[str]) -> List[PhraseMatch]:
+        """Comme find_all, sur un texte déjà découpé par `words`."""
+        matches = []
+        n_tokens = len(tokens)
+        for start in range(n_tokens):
+            frontier = self._root.step(tokens[start])
+            end = start + 1
+            while frontier:
+                for node in frontier:
+                    if node.labels:
+                        matches.extend(PhraseMatch(label, phrase, start, end) for label, phrase in node.labels)
+                if end == n_tokens:
+                    break
+                token = tokens[end]
+                frontier = tuple(n for node in frontier for n in node.step(token))
+                end += 1
+        return matches
+
+    def labels(self, text: str) -> Set[Hashable]:
+        return {m.label for m in self.find_all(text)}
+
+
+# ── Thèmes ─────────────────────────────────────────────────────────────────────
+# Ordre = priorité quand plusieurs thèmes correspondent
+THEMES = {
+    'infidelite': {
+        'keywords': ['infidèle*', 'infidélité*', 'tromp*', 'cocufié*',
+                    'cocu', 'cocus', 'adultère*', 'autre homme', 'autre femme', 'liaison*',
+                    'triche*', 'tricherie*', 'attraper', 'flagrant délit', 'pardon',
+                    'pardonne*', 'cheating', 'cheated', 'affair', 'affaire extraconjugale'],
+        'requires_clarification': True,
+        'clarification_question': "Juste pour être sûr : parles-tu d une situation où ta partenaire t a été infidèle ?",
+        'article_trigger': "Article à sortir concernant le pardon de l infidélité"
+    },
+    'femme_toxique': {
+        'keywords': ['toxique', 'toxiques', 'manipulatrice*', 'narcissique*', 'instable*', 'clown*',
+                    'cirque', 'dépendance*', 'codépendance*', 'manipulation*', 'victime*',
+                    'reste', 'retourne*', 'revenir'],
+        'article_trigger': "NE BLÂME PAS UN CLOWN"
+    },
+    'rupture_manipulation': {
+        'keywords': ['rupture*', 'séparation*', 'séparé*', 'quitter', 'quitté*', 'ex', 'cassé*',
+                    'victimisation', 'victimise*', 'déresponsabilisation', 'breakup', 'broke up'],
+        'article_trigger': "COMMENT CERTAINES FEMMES MANIPULENT LES RUPTURES"
+    },
+    'femme_doit_aimer_plus': {
+        'keywords': ['aimer plus', 'elle m aime', 'hypergamie', 'fidélité', 'loyauté',
+                    'engagement', 'vision', 'progression'],
+        'article_trigger': "EFFECTIVEMENT LA FEMME DOIT AIMER PLUS QUE L HOMME"
+    },
+    'femme_amortie': {
+        'keywords': ['passé', 'ex toxi*', 'choix destructeur*', 'qualité', 'mérite*',
+                    'buisson d épines', 'homme toxique', 'maturité', 'déclin'],
+        'article_trigger': "UN HOMME DE QUALITÉ NE MÉRITE PAS UNE FEMME AMORTIE"
+    }
+}
+
+_THEME_PRIORITY = {name: i for i, name in enumerate(THEMES)}
+THEME_MATCHER = PhraseMatcher(
+    (keyword, name) for name, data in THEMES.items() for keyword in data['keywords']
+)
+
+
+def detect_query_theme(user_query: str) -> dict:
+    """
+    Détecte le thème de la question pour orienter vers les bons articles.
+    Retourne un dictionnaire avec le thème détecté et des instructions spéciales.
+    """
+    found = THEME_MATCHER.labels(user_query)
+    if not found:
+        return {'theme': None, 'data': None}
+    theme = min(found, key=_THEME_PRIORITY.__getitem__)
+    return {'theme': theme, 'data': THEMES[theme]}
+
+
+# ── Salutations et demandes de présentation ───────────────────────────────────
+# Demandes de présentation / comparaison : suffisent où qu elles apparaissent
+INTRO_PHRASES = [
+    'qui es tu', 'qui es-tu', 'tu es qui', 't es qui', 'tu fais quoi', 'présente-toi', 'présente toi',
+    'présentes toi', 'what are you', 'who are you', 'introduce yourself', 'chi sei', 'quién eres',
+    'pourquoi toi', 'pourquoi je devrais', 'quelle différence', 'différence avec chatgpt',
+    'plutot qu une autre', 'plutôt qu une autre', 'pourquoi pas chatgpt', 'en quoi tu es différent',
+    'utiliser toi', 'autre ia', 'autres ia', 'chatgpt', 'chat gpt',
+    'c est quoi ce bot', 'c est quoi cette ia', 'c est quoi ralph',
+    'wer bist du', 'quem é você', 'quem es tu',
+]
+# Salutations et questions vagues : seulement si le message ne dit rien d autre
+SHORT_ONLY_PHRASES = [
+    'bonjour', 'salut', 'hello', 'hey', 'hi', 'bonsoir', 'coucou', 'yo', 'hola', 'ciao', 'buongiorno',
+    'buenos dias', 'buenas tardes', 'good morning', 'good evening', 'ça va', 'ca va', 'how are you',
+    'hallo', 'guten tag', 'guten morgen', 'olá', 'oi', 'bom dia', 'boa tarde', 'tudo bem',
+]
+# Mots qui, ensemble, signalent une demande de présentation
+INTRO_COMBINATIONS = [
+    ('pourquoi', 'utiliser'),
+    ('pourquoi', 'toi'),
+    ('quelle', 'différence'),
+    ('autre', 'ia'),
+]
+# Mots tolérés en plus des salutations (« bonjour Ralph ») : au-delà, le
+# message contient une vraie question
+GREETING_MAX_EXTRA_WORDS = 3
+
+GREETING_MATCHER = PhraseMatcher(
+    [(phrase, 'intro') for phrase in INTRO_PHRASES]
+    + [(phrase, 'short') for phrase in SHORT_ONLY_PHRASES]
+    + [(word, ('word', normalize(word))) for pair in INTRO_COMBINATIONS for word in pair]
+)
+
+
+def is_greeting_or_intro(user_query: str) -> bool:
+    """
+    Détecte si c est un message de salutation ou une demande de présentation.
+    """
+    tokens = words(user_query)
+    matches = GREETING_MATCHER.find_in_words(tokens)
+    if not matches:
+        return False
+    labels = {m.label for m in matches}
+    if 'intro' in labels:
+        return True
+
+    present = {label[1] for label in labels if isinstance(label, tuple)}
+    if any(all(normalize(word) in present for word in pair) for pair in INTRO_COMBINATIONS):
+        return True
+
+    # Message court : une fois retirées les salutations, il reste peu de mots
+    greeting_words = sum(m.end - m.start for m in matches if m.label == 'short')
+    return bool(greeting_words) and len(tokens) - greeting_words <= GREETING_MAX_EXTRA_WORDS
@@ -1,7 +1,13 @@
-from fastapi import APIRouter, HTTPException
+import json
+import secrets
+from fastapi import APIRouter, Depends, HTTPException, Header
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
-from typing import List, Dict
-from .services import chat
+from typing import List, Dict, Optional, Tuple
+from .services import chat, chat_stream, prepare_history
+from .dependencies import ADMISSION, RESPONSE_CACHE, RAG_ADMIN_TOKEN, RAG_LOADER, SESSION_STORE, refresh_rag_index
+from .admission import AdmissionRejected
+from . import metrics
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
@@ -13,58 +19,196 @@ class ChatRequest(BaseModel):
     #message: str = Field(..., description="Message de l'utilisateur")
     #history: List[Dict[str, str]] = Field(default_factory=list)
     message: str
+    # Session côté serveur : absente au premier message, renvoyée dans la réponse
+    session_id: Optional[str] = None
+    # Premier message d un client à sessions : la session est créée après la
+    # première réponse réussie (un ancien client ne la demande jamais)
+    new_session: bool = False
+    # Ancien protocole (historique renvoyé par le client), utilisé seulement sans session_id
     history: List[ChatMessage] = []
 
 class ChatResponse(BaseModel):
     assistant: str
+    session_id: Optional[str] = None
 
-def limit_conversation_history(history: List[ChatMessage], max_messages: int = 10) -> List[ChatMessage]:
+async def _resolve_history(request: ChatRequest) -> Tuple[Optional[str], List[Dict[str, str]]]:
     """
-    Limite l'historique à max_messages pour éviter de dépasser la limite de tokens.
-    Garde les derniers messages pour conserver le contexte récent.
+    (session_id, historique sous budget de tokens) : relu côté serveur pour
+    une session ; session_id None sinon (cf. _save_exchange).
     """
-    if len(history) <= max_messages:
-        return history
-    
-    # Prendre les derniers max_messages messages
-    return history[-max_messages:]
+    if request.session_id:
+        session = await SESSION_STORE.load(request.session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Session inconnue")
+        return request.session_id, prepare_history(
+            session.messages, request.session_id, session.offset, session.summary, session.summary_upto
+        )
+    if request.history:
+        # Ancien client : historique fourni, pas de session (ni résumé)
+        return None, prepare_history([{"role": msg.role, "content": msg.content} for msg in request.history])
+    return None, []
+
+async def _save_exchange(request: ChatRequest, session_id: Optional[str], response: str) -> Optional[str]:
+    """
+    Enregistre l échange dans la session ; une session demandée (new_session)
+    n est créée qu ici, après une réponse réussie : ni session orpheline pour
+    un ancien client, ni session vide quand la première réponse échoue.
+    """
+    if session_id is None and request.new_session:
+        session_id = SESSION_STORE.create()
+    if session_id:
+        await SESSION_STORE.append(session_id, [
+            {"role": "user", "content": request.message},
+            {"role": "assistant", "content": response},
+        ])
+    return session_id
+
+def require_admin_token(x_admin_token: Optional[str] = Header(None)) -> None:
+    """Routes d administration : en-tête X-Admin-Token égal à RAG_ADMIN_TOKEN."""
+    if not RAG_ADMIN_TOKEN or not x_admin_token or not secrets.compare_digest(x_admin_token, RAG_ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Accès refusé")
+
+def _rejected_response(rejection: AdmissionRejected) -> JSONResponse:
+    return JSONResponse(
+        status_code=rejection.status_code,
+        content={"detail": rejection.reason},
+        headers={"Retry-After": str(rejection.retry_after)},
+    )
+
+async def _clear_session(session_id: str) -> dict:
+    if not await SESSION_STORE.delete(session_id):
+        raise HTTPException(status_code=404, detail="Session inconnue")
+    return {"message": f"Session {session_id} cleared", "status": "success"}
 
 @router.delete("/clear")
-async def clear_conversation():
+async def clear_conversation(x_session_id: Optional[str] = Header(None)):
     """
-    Endpoint pour vider l'historique de la conversation.
+    Endpoint pour vider l'historique de la conversation (session de l en-tête X-Session-Id).
     """
-    return {"message": "Conversation cleared", "status": "success"}
+    if not x_session_id:
+        raise HTTPException(status_code=400, detail="En-tête X-Session-Id manquant")
+    return await _clear_session(x_session_id)
 
 @router.delete("/clear/{session_id}")
 async def clear_specific_session(session_id: str):
     """
     Endpoint pour vider une session spécifique.
     """
-    return {"message": f"Session {session_id} cleared", "status": "success"}
+    return await _clear_session(session_id)
+
+@router.get("/metrics")
+async def chat_metrics():
+    """
+    Métriques internes du module chat (compteurs, histogrammes de latence...).
+    """
+    return metrics.snapshot()
+
+@router.get("/cache/stats")
+async def response_cache_stats():
+    """
+    Compteurs du cache de réponses (hits exacts/sémantiques, misses, évictions).
+    """
+    return RESPONSE_CACHE.snapshot()
+
+@router.delete("/cache", dependencies=[Depends(require_admin_token)])
+async def invalidate_response_cache():
+    """
+    Vide le cache de réponses (après mise à jour de l'index RAG ou du prompt).
+    Protégé par RAG_ADMIN_TOKEN (en-tête X-Admin-Token).
+    """
+    RESPONSE_CACHE.invalidate("manuel")
+    return {"message": "Response cache cleared", "status": "success"}
+
+@router.get("/rag/shards")
+async def list_rag_shards():
+    """
+    Liste les documents indexés (un shard par document).
+    """
+    rag = RAG_LOADER.get()
+    shards = rag.shards.values() if rag is not None else []
+    return {"state": RAG_LOADER.state, "shards": [shard.describe() for shard in shards]}
+
+@router.post("/rag/refresh", dependencies=[Depends(require_admin_token)])
+async def refresh_rag(force: bool = False):
+    """
+    Resynchronise les shards RAG avec app/static/document : documents ajoutés,
+    modifiés (seuls les chunks changés sont ré-encodés) ou supprimés.
+    Protégé par RAG_ADMIN_TOKEN (en-tête X-Admin-Token).
+    """
+    return await refresh_rag_index(force=force)
 
 @router.post("/", response_model=ChatResponse)
 async def chat_endpoint(request: ChatRequest):
     """
     Endpoint pour envoyer un message au chatbot.
-    :param request: Message utilisateur + historique
-    :return: Réponse de l'assistant
+    :param request: Message utilisateur + session_id (ou historique, ancien protocole)
+    :return: Réponse de l'assistant et identifiant de session
+    (429 / 503 avec Retry-After quand le service est saturé)
     """
     try:
-        # Limiter l'historique avant de traiter
-        limited_history = limit_conversation_history(request.history, max_messages=10)
-        
-        # Convertir les ChatMessage en dict pour la fonction chat()
-        history_dict = [{"role": msg.role, "content": msg.content} for msg in limited_history]
-        
+        async with ADMISSION.slot():
+            return await _answer(request)
+    except AdmissionRejected as rejection:
+        return _rejected_response(rejection)
+
+async def _answer(request: ChatRequest) -> ChatResponse:
+    session_id, history_dict = await _resolve_history(request)
+    try:
         # Appeler la fonction chat de services.py
-        response = chat(request.message, history_dict)
-        return ChatResponse(assistant=response)
-        
+        response = await chat(request.message, history_dict)
     except Exception as e:
         print(f"Erreur dans chat_endpoint: {e}")
         # En cas d'erreur, retourner un message d'erreur mais ne pas planter
-        return ChatResponse(assistant="Désolé, je ne parviens pas à répondre pour l'instant.")
+        return ChatResponse(assistant="Désolé, je ne parviens pas à répondre pour l'instant.", session_id=session_id)
+    
+    session_id = await _save_exchange(request, session_id, response)
+    return ChatResponse(assistant=response, session_id=session_id)
+
+@router.post("/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """
+    Variante streaming de l'endpoint chat (Server-Sent Events).
+    Chaque fragment est envoyé sous la forme `data: {"delta": "..."}`,
+    puis un évènement final `event: done` portant le session_id (aussi
+    dans l en-tête X-Session-Id pour une session existante ; une session
+    demandée par new_session n existe qu après la réponse, donc dans `done`).
+    File d attente pleine : 429 immédiat. Sinon l admission est attendue dans
+    le flux, pour que la place soit toujours rendue à sa fermeture (un
+    générateur jamais démarré n exécute pas son finally) ; attente dépassée :
+    évènement `error` (avec retry_after) puis `done`.
+    """
+    try:
+        ADMISSION.check()
+    except AdmissionRejected as rejection:
+        return _rejected_response(rejection)
+    session_id, history_dict = await _resolve_history(request)
+    
+    async def event_stream():
+        nonlocal session_id
+        parts = []
+        try:
+            async with ADMISSION.slot():
+                async for delta in chat_stream(request.message, history_dict):
+                    parts.append(delta)
+                    yield f"data: {json.dumps({'delta': delta}, ensure_ascii=False)}\n\n"
+        except AdmissionRejected as rejection:
+            payload = {"detail": rejection.reason, "retry_after": rejection.retry_after}
+            yield f"event: error\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            print(f"Erreur dans chat_stream_endpoint: {e}")
+            error = "Désolé, je ne parviens pas à répondre pour l'instant."
+            yield f"data: {json.dumps({'delta': error}, ensure_ascii=False)}\n\n"
+        else:
+            session_id = await _save_exchange(request, session_id, "".join(parts))
+        yield f"event: done\ndata: {json.dumps({'session_id': session_id})}\n\n"
+    
+    headers = {
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",  # Désactive le buffering nginx
+    }
+    if session_id:
+        headers["X-Session-Id"] = session_id
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=headers)
 
 @router.get("/health")
 async def chat_health_check():
@@ -75,4 +219,15 @@ async def chat_health_check():
         "status": "healthy",
         "module": "chat",
         "service": "chat-api"
-    }
\ No newline at end of file
+    }
+
+@router.get("/ready")
+async def chat_readiness_check():
+    """
+    Readiness : 200 quand le RAG est chargé et chauffé, 503 sinon (chargement en
+    cours ou échec). /health reste un simple test de vie (liveness).
+    """
+    return JSONResponse(
+        status_code=200 if RAG_LOADER.ready else 503,
+        content={"ready": RAG_LOADER.ready, "rag": RAG_LOADER.status()},
+    )
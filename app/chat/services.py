@@ -1,36 +1,89 @@
 """
 Logique métier avec RAG : construction du prompt intelligent, appel OpenAI, gestion des tool-calls.
 """
-import json
-import requests
-from typing import List, Dict, Any
+import time
+import asyncio
+from types import SimpleNamespace
+from typing import List, Dict, Any, AsyncIterator, Optional
+import numpy as np
+from . import metrics
 from .dependencies import (
-    openai_client,
+    LLM,
     get_system_prompt,  # Maintenant prend user_query en paramètre
-    PUSHOVER_USER,
-    PUSHOVER_TOKEN,
-    PUSHOVER_URL,
+    RAG_LOADER,
+    RAG_WARMUP_WAIT_SECONDS,
+    RESPONSE_CACHE,
+    SESSION_STORE,
+    CHAT_HISTORY_MAX_TOKENS,
+    CHAT_HISTORY_MAX_MESSAGE_TOKENS,
+    CHAT_HISTORY_SUMMARY_MAX_TOKENS,
+    OFF_TOPIC_REFUSAL,
+    NOTIFICATIONS,
+    CHAT_TOOL_TIMEOUT_SECONDS,
+    CHAT_MAX_TOOL_ROUNDS,
+    CHAT_SINGLE_FLIGHT_ENABLED,
+    ADMISSION,
 )
+from .greetings import detect_language, presentation_message
+from .history import HistoryManager
+from .tools import ToolRegistry
+from .cache import normalize_message
+from .coalescing import SingleFlight
+from .admission import AdmissionRejected
+from .query_detection import is_greeting_or_intro
+from .topic_classifier import contextual_query
+
+# ── Usage OpenAI et cache de préfixe ─────────────────────────────────────────
+# Le préfixe statique du prompt système (cf. SYSTEM_PROMPT_PREFIX) est mis en
+# cache par OpenAI : `cached_tokens` indique la part du prompt servie par ce
+# cache (facturée moitié prix, plus rapide à traiter).
+_openai_requests = metrics.counter("openai_requests", "Appels chat.completions avec usage")
+_prompt_tokens = metrics.counter("openai_prompt_tokens", "Tokens de prompt facturés")
+_cached_tokens = metrics.counter("openai_cached_tokens", "Tokens de prompt servis par le cache de préfixe")
+_completion_tokens = metrics.counter("openai_completion_tokens", "Tokens générés")
+_prompt_cache_hits = metrics.counter("openai_prompt_cache_hits", "Appels avec une partie du prompt en cache")
+_prompt_cache_ratio = metrics.gauge("openai_prompt_cache_ratio", "Part cumulée des tokens de prompt en cache")
+
+def _record_usage(usage: Any, elapsed_ms: float, timing: str = "latency") -> None:
+    """
+    Enregistre l usage d un appel. `timing` : latency (réponse complète) ou
+    ttft (premier token, streaming), ventilé selon que le cache a servi ou non.
+    """
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = (getattr(details, "cached_tokens", 0) or 0) if details is not None else 0
+    
+    _openai_requests.inc()
+    _prompt_tokens.inc(prompt_tokens)
+    _cached_tokens.inc(cached_tokens)
+    _completion_tokens.inc(getattr(usage, "completion_tokens", 0) or 0)
+    if cached_tokens:
+        _prompt_cache_hits.inc()
+    if _prompt_tokens.value():
+        _prompt_cache_ratio.set(round(_cached_tokens.value() / _prompt_tokens.value(), 4))
+    outcome = "hit" if cached_tokens else "miss"
+    metrics.histogram(
+        f"openai_{timing}_ms_cache_{outcome}", metrics.LATENCY_MS_BUCKETS,
+        f"Durée des appels OpenAI ({timing}), cache de préfixe {outcome}",
+    ).observe(elapsed_ms)
+    print(f"💾 Cache de prompt OpenAI: {cached_tokens}/{prompt_tokens} tokens ({timing} {elapsed_ms:.0f} ms)")
 
 # ── Notifications Pushover ─────────────────────────────────────────────────────
-def push(message: str) -> None:
-    print(f"Push: {message}")
-    payload = {"user": PUSHOVER_USER, "token": PUSHOVER_TOKEN, "message": message}
-    requests.post(PUSHOVER_URL, data=payload, timeout=5)
+async def push(message: str) -> None:
+    """Dépose la notification (envoi, regroupement et reprises en tâche de fond)."""
+    print(f"Push (en file): {message}")
+    NOTIFICATIONS.enqueue(message)
 
 # ── Tools pour l'agent OpenAI ──────────────────────────────────────────────────
-def record_user_details(email: str, name: str = "Name not provided", notes: str = "not provided"):
-    push(f"Recording interest notes {notes}")
-    return {"recorded": "ok"}
-
-def record_unknown_question(question: str):
-    push(f"Recording {question} asked that I couldn't answer")
-    return {"recorded": "ok"}
+# Schéma et handler déclarés ensemble ; les tool-calls d un même tour
+# s exécutent en parallèle, chacun borné par CHAT_TOOL_TIMEOUT_SECONDS.
+TOOL_REGISTRY = ToolRegistry(default_timeout=CHAT_TOOL_TIMEOUT_SECONDS)
 
-record_user_details_json = {
-    "name": "record_user_details",
-    "description": "Use this tool to record that a user is interested in being in touch and provided an email address",
-    "parameters": {
+@TOOL_REGISTRY.tool(
+    description="Use this tool to record that a user is interested in being in touch and provided an email address",
+    parameters={
         "type": "object",
         "properties": {
             "email": {"type": "string", "description": "The email address of this user"},
@@ -40,67 +93,169 @@ record_user_details_json = {
         "required": ["email"],
         "additionalProperties": False,
     },
-}
+)
+async def record_user_details(email: str, name: str = "Name not provided", notes: str = "not provided"):
+    await push(f"Recording interest notes {notes}")
+    return {"recorded": "ok"}
 
-record_unknown_question_json = {
-    "name": "record_unknown_question",
-    "description": "Always use this tool to record any question that couldn't be answered",
-    "parameters": {
+@TOOL_REGISTRY.tool(
+    description="Always use this tool to record any question that couldn't be answered",
+    parameters={
         "type": "object",
         "properties": {"question": {"type": "string", "description": "Unanswered question"}},
         "required": ["question"],
         "additionalProperties": False,
     },
-}
-
-TOOLS = [
-    {"type": "function", "function": record_user_details_json},
-    {"type": "function", "function": record_unknown_question_json},
-]
-
-# ── Gestion des tool-calls (garde ton underscore !) ────────────────────────────
-def _handle_tool_calls(tool_calls: List[Any]) -> List[Dict[str, Any]]:
-    results = []
-    for call in tool_calls:
-        tool_name = call.function.name
-        arguments = json.loads(call.function.arguments)
-        fn = {
-            "record_user_details": record_user_details,
-            "record_unknown_question": record_unknown_question,
-        }.get(tool_name)
-        result = fn(**arguments) if fn else {}
-        results.append(
-            {"role": "tool", "content": json.dumps(result), "tool_call_id": call.id}
-        )
-    return results
-
-# ── Gestion des tool-calls (garde ton underscore !) ────────────────────────────
-def _handle_tool_calls(tool_calls: List[Any]) -> List[Dict[str, Any]]:
-    results = []
-    for call in tool_calls:
-        tool_name = call.function.name
-        arguments = json.loads(call.function.arguments)
-        fn = {
-            "record_user_details": record_user_details,
-            "record_unknown_question": record_unknown_question,
-        }.get(tool_name)
-        result = fn(**arguments) if fn else {}
-        results.append(
-            {"role": "tool", "content": json.dumps(result), "tool_call_id": call.id}
-        )
-    return results
+)
+async def record_unknown_question(question: str):
+    await push(f"Recording {question} asked that I couldn't answer")
+    return {"recorded": "ok"}
 
-# ── Fonction principale du chat avec RAG ───────────────────────────────────────
-def chat(user_message: str, history: List[Dict[str, str]]) -> str:
+TOOLS = TOOL_REGISTRY.schemas
+
+_tool_round_limit = metrics.counter(
+    "chat_tool_round_limit", "Requêtes ayant atteint CHAT_MAX_TOOL_ROUNDS (réponse forcée sans tools)"
+)
+
+def _tools_for_round(round_index: int) -> Dict[str, Any]:
+    """Paramètres tools du tour : au dernier tour, pas de tools, le modèle doit répondre."""
+    if round_index < CHAT_MAX_TOOL_ROUNDS:
+        return {"tools": TOOL_REGISTRY.schemas}
+    _tool_round_limit.inc()
+    print(f"⚠️ {CHAT_MAX_TOOL_ROUNDS} tours de tool-calls atteints - réponse demandée sans tools")
+    return {}
+
+FALLBACK_REPLY = "Désolé, je ne parviens pas à répondre pour l'instant. Veuillez réessayer."
+_fallback_replies = metrics.counter(
+    "chat_fallback_replies", "Réponses de repli servies, par cause (error, empty, tool_rounds)"
+)
+
+def _fallback(reason: str, detail: str) -> str:
+    _fallback_replies.inc(label=reason)
+    print(f"❌ {detail}")
+    return FALLBACK_REPLY
+
+# ── Salutations : réponse sans LLM ──────────────────────────────────────────
+_greeting_fast_path = metrics.counter(
+    "chat_greeting_fast_path", "Salutations servies sans appel LLM, par langue"
+)
+_greeting_llm_fallback = metrics.counter(
+    "chat_greeting_llm_fallback", "Salutations envoyées au LLM (langue inconnue ou ambiguë)"
+)
+
+def _presentation_reply(user_message: str) -> Optional[str]:
+    """Message de présentation précalculé si c est une salutation dans une langue connue."""
+    if not is_greeting_or_intro(user_message):
+        return None
+    presentation = presentation_message(user_message)
+    if presentation is None:
+        _greeting_llm_fallback.inc()
+        return None
+    language = detect_language(user_message)
+    _greeting_fast_path.inc(label=language)
+    print(f"👋 Salutation ({language}) - présentation servie sans appel LLM")
+    return presentation
+
+# ── Questions hors sujet : refus sans RAG ni LLM ─────────────────────────────
+_offtopic_short_circuit = metrics.counter(
+    "chat_offtopic_short_circuit", "Questions hors sujet refusées sans appel LLM"
+)
+_offtopic_borderline = metrics.counter(
+    "chat_offtopic_borderline", "Questions plutôt hors sujet mais sous le seuil, laissées au LLM"
+)
+
+async def _off_topic_reply(user_message: str, query_embedding: Optional[np.ndarray],
+                           history: List[Dict[str, str]]) -> Optional[str]:
     """
-    Fonction chat avec RAG : génère un contexte intelligent pour chaque requête.
-    :param user_message: dernier message utilisateur
-    :param history: historique au format [{"role": "user"/"assistant", "content": "..."}]
+    Phrase de refus si le classifieur local est sûr que la question est hors
+    sujet. En cours de conversation, le message est classé avec le dernier
+    échange : une relance courte n est pas refusée pour son seul contenu.
     """
-    
+    rag = RAG_LOADER.get()
+    classifier = rag.topic_classifier if rag is not None else None
+    if classifier is None or query_embedding is None:
+        return None
+    if history:
+        try:
+            query_embedding = await asyncio.wrap_future(
+                rag.query_embedder.submit(contextual_query(user_message, history))
+            )
+        except Exception as e:
+            print(f"⚠️ Erreur embedding (classifieur hors sujet): {e}")
+            return None
+    prediction = classifier.predict(query_embedding)
+    if not prediction.off_topic:
+        if prediction.confidence >= 0.5:
+            _offtopic_borderline.inc()
+        return None
+    _offtopic_short_circuit.inc()
+    print(f"🚫 Question hors sujet (confiance {prediction.confidence:.2f}) - refus servi sans appel LLM")
+    return OFF_TOPIC_REFUSAL
+
+# ── Historique : budget de tokens et résumé glissant ─────────────────────────
+SUMMARY_PROMPT = """Tu résumes une conversation entre un utilisateur et un assistant de conseil en relations homme-femme.
+Mets à jour le résumé existant avec les nouveaux échanges. Garde les faits sur la situation de l utilisateur
+(personnes, évènements, décisions), ses questions et les conseils déjà donnés. Style télégraphique, dans la
+langue de la conversation, sans commentaire."""
+
+async def summarize_history(summary: Optional[str], messages: List[Dict[str, str]]) -> str:
+    """Nouveau résumé : ancien résumé + messages sortis de la fenêtre récente."""
+    exchanges = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+    response = await LLM.create(
+        model="gpt-4o-mini",
+        messages=[
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": f"Résumé existant :\n{summary or '(aucun)'}\n\nNouveaux échanges :\n{exchanges}"},
+        ],
+        max_tokens=CHAT_HISTORY_SUMMARY_MAX_TOKENS,
+    )
+    return response.choices[0].message.content.strip()
+
+HISTORY_MANAGER = HistoryManager(
+    summarize_history,
+    SESSION_STORE.set_summary,
+    max_tokens=CHAT_HISTORY_MAX_TOKENS,
+    max_message_tokens=CHAT_HISTORY_MAX_MESSAGE_TOKENS,
+    max_messages=SESSION_STORE.max_messages,
+)
+
+def prepare_history(messages: List[Dict[str, str]], session_id: Optional[str] = None, offset: int = 0,
+                    summary: Optional[str] = None, summary_upto: int = 0) -> List[Dict[str, str]]:
+    """
+    Historique à envoyer au modèle, sous CHAT_HISTORY_MAX_TOKENS. Avec une
+    session, le résumé des messages écartés est régénéré en tâche de fond.
+    """
+    compacted = HISTORY_MANAGER.compact(messages, offset, summary, summary_upto)
+    print(f"🧾 Historique: {len(compacted.messages)} messages, {compacted.tokens} tokens "
+          f"(résumé {compacted.summary_tokens}, {compacted.dropped} écartés, {compacted.truncated} tronqués)")
+    if session_id and compacted.summarize_upto is not None:
+        HISTORY_MANAGER.schedule_summary(session_id, messages, offset, summary, summary_upto,
+                                         compacted.summarize_upto)
+    return compacted.messages
+
+# ── Construction des messages ─────────────────────────────────────────────────
+async def _embed_query(user_message: str) -> Optional[np.ndarray]:
+    """Embedding de la question, partagé entre le cache sémantique et le RAG."""
+    if not user_message or not user_message.strip():
+        return None
+    # RAG en cours de chargement : attente bornée, sinon prompt dégradé sans contexte
+    rag = await RAG_LOADER.wait(RAG_WARMUP_WAIT_SECONDS)
+    if rag is None:
+        return None
+    try:
+        # Le micro-batcher encode dans son propre thread : on attend son Future
+        # sans occuper de thread de l exécuteur RAG.
+        return await asyncio.wrap_future(rag.query_embedder.submit(user_message))
+    except Exception as e:
+        print(f"⚠️ Erreur embedding: {e}")
+        return None
+
+async def _build_messages(user_message: str, history: List[Dict[str, str]],
+                          query_embedding: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+    """Assemble prompt système dynamique + historique + dernier message utilisateur."""
     # 🎯 NOUVEAUTÉ : Le prompt système est généré dynamiquement selon la question
     messages = (
-        [{"role": "system", "content": get_system_prompt(user_message)}]
+        [{"role": "system", "content": await get_system_prompt(user_message, query_embedding)}]
         + history
         + [{"role": "user", "content": user_message}]
     )
@@ -108,29 +263,211 @@ def chat(user_message: str, history: List[Dict[str, str]]) -> str:
     # Debug: affichage de la taille totale des messages
     total_chars = sum(len(msg["content"]) for msg in messages)
     print(f"📊 Total caractères envoyés à OpenAI: {total_chars} (~{total_chars//4} tokens)")
+    return messages
+
+# ── Fonction principale du chat avec RAG ───────────────────────────────────────
+CHAT_SINGLE_FLIGHT = SingleFlight()
+
+async def chat(user_message: str, history: List[Dict[str, str]]) -> str:
+    """
+    Fonction chat avec RAG : génère un contexte intelligent pour chaque requête.
+    :param user_message: dernier message utilisateur
+    :param history: historique au format [{"role": "user"/"assistant", "content": "..."}]
+    
+    Premier message d une conversation (historique vide) : les requêtes au
+    message identique (normalisé) arrivées pendant son traitement partagent
+    la même réponse au lieu de relancer RAG et OpenAI.
+    """
+    if history or not CHAT_SINGLE_FLIGHT_ENABLED:
+        return await _chat(user_message, history)
+    return await CHAT_SINGLE_FLIGHT.run(normalize_message(user_message), lambda: _chat(user_message, []))
+
+async def _chat(user_message: str, history: List[Dict[str, str]]) -> str:
+    presentation = _presentation_reply(user_message)
+    if presentation is not None:
+        return presentation
+    
+    query_embedding = await _embed_query(user_message)
+    refusal = await _off_topic_reply(user_message, query_embedding, history)
+    if refusal is not None:
+        return refusal
+    
+    cached = RESPONSE_CACHE.get(user_message, history, query_embedding)
+    if cached is not None:
+        print("⚡ Réponse servie depuis le cache")
+        return cached
+    
+    messages = await _build_messages(user_message, history, query_embedding)
+    # Prompt sans contexte RAG (chargement en cours) : réponse non mise en cache
+    degraded = not RAG_LOADER.ready
+    used_tools = False
     
-    while True:
+    for round_index in range(CHAT_MAX_TOOL_ROUNDS + 1):
         try:
-            response = openai_client.chat.completions.create(
+            started = time.perf_counter()
+            response = await LLM.create(
                 model="gpt-4o-mini", 
                 messages=messages, 
-                tools=TOOLS
+                **_tools_for_round(round_index),
             )
+            _record_usage(getattr(response, "usage", None), (time.perf_counter() - started) * 1000)
             
             finish_reason = response.choices[0].finish_reason
             
             # L'agent souhaite appeler un tool
             if finish_reason == "tool_calls":
                 tool_calls = response.choices[0].message.tool_calls
-                results = _handle_tool_calls(tool_calls)  # Garde ton underscore !
+                results = await TOOL_REGISTRY.run_all(tool_calls)
                 messages.append(response.choices[0].message)  # message "tool_calls"
                 messages.extend(results)  # réponses des tools
+                used_tools = True
             else:
                 # Réponse finale de l'assistant
                 response_content = response.choices[0].message.content
+                if not response_content:
+                    # length / content_filter sans texte
+                    return _fallback("empty", f"Réponse OpenAI vide (finish_reason={finish_reason})")
                 print(f"✅ Réponse générée: {len(response_content)} caractères")
+                # Les réponses ayant déclenché un tool (effets de bord) ou tronquées ne sont pas mises en cache
+                if not used_tools and not degraded and finish_reason == "stop":
+                    RESPONSE_CACHE.put(user_message, history, response_content, query_embedding)
                 return response_content
                 
         except Exception as e:
-            print(f"❌ Erreur OpenAI: {e}")
-            return "Désolé, je ne parviens pas à répondre pour l'instant. Veuillez réessayer."
\ No newline at end of file
+            return _fallback("error", f"Erreur OpenAI: {e}")
+    
+    # Le modèle demande encore des tools au dernier tour
+    return _fallback("tool_rounds", f"Pas de réponse après {CHAT_MAX_TOOL_ROUNDS} tours de tool-calls")
+
+# ── Variante streaming (tokens envoyés au fil de l'eau) ────────────────────────
+async def chat_stream(user_message: str, history: List[Dict[str, str]]) -> AsyncIterator[str]:
+    """
+    Même logique que chat() mais en streaming : renvoie les fragments de texte
+    dès qu'OpenAI les produit. Les tool-calls sont reconstitués à partir des
+    deltas, exécutés, puis la génération reprend.
+    """
+    presentation = _presentation_reply(user_message)
+    if presentation is not None:
+        yield presentation
+        return
+    
+    query_embedding = await _embed_query(user_message)
+    refusal = await _off_topic_reply(user_message, query_embedding, history)
+    if refusal is not None:
+        yield refusal
+        return
+    
+    cached = RESPONSE_CACHE.get(user_message, history, query_embedding)
+    if cached is not None:
+        print("⚡ Réponse servie depuis le cache")
+        yield cached
+        return
+    
+    messages = await _build_messages(user_message, history, query_embedding)
+    # Prompt sans contexte RAG (chargement en cours) : réponse non mise en cache
+    degraded = not RAG_LOADER.ready
+    used_tools = False
+    
+    for round_index in range(CHAT_MAX_TOOL_ROUNDS + 1):
+        text_parts: List[str] = []
+        tool_calls: Dict[int, Dict[str, Any]] = {}
+        finish_reason = None
+        usage = None
+        first_token_ms = None
+        
+        try:
+            started = time.perf_counter()
+            stream = await LLM.create(
+                model="gpt-4o-mini",
+                messages=messages,
+                stream=True,
+                **_tools_for_round(round_index),
+                # Dernier chunk (sans choices) : usage, dont cached_tokens
+                stream_options={"include_usage": True},
+            )
+            
+            async for chunk in LLM.iterate(stream):
+                if getattr(chunk, "usage", None) is not None:
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                if first_token_ms is None:
+                    first_token_ms = (time.perf_counter() - started) * 1000
+                choice = chunk.choices[0]
+                delta = choice.delta
+                
+                if delta.content:
+                    text_parts.append(delta.content)
+                    yield delta.content
+                
+                # Les arguments des tool-calls arrivent en morceaux, indexés par position
+                for tc in delta.tool_calls or []:
+                    slot = tool_calls.setdefault(
+                        tc.index,
+                        {"id": "", "type": "function", "function": {"name": "", "arguments": ""}},
+                    )
+                    if tc.id:
+                        slot["id"] = tc.id
+                    if tc.function and tc.function.name:
+                        slot["function"]["name"] += tc.function.name
+                    if tc.function and tc.function.arguments:
+                        slot["function"]["arguments"] += tc.function.arguments
+                
+                if choice.finish_reason:
+                    finish_reason = choice.finish_reason
+                    
+        except Exception as e:
+            yield _fallback("error", f"Erreur OpenAI (stream): {e}")
+            return
+        
+        _record_usage(usage, first_token_ms if first_token_ms is not None else (time.perf_counter() - started) * 1000,
+                      timing="ttft")
+        
+        # L'agent souhaite appeler un tool
+        if finish_reason == "tool_calls" and tool_calls:
+            calls = [tool_calls[i] for i in sorted(tool_calls)]
+            messages.append({
+                "role": "assistant",
+                "content": "".join(text_parts) or None,
+                "tool_calls": calls,
+            })
+            results = await TOOL_REGISTRY.run_all([
+                SimpleNamespace(id=c["id"], function=SimpleNamespace(**c["function"]))
+                for c in calls
+            ])
+            messages.extend(results)
+            used_tools = True
+            continue
+        
+        response_content = "".join(text_parts)
+        if not response_content:
+            # length / content_filter sans texte, ou tool-calls vides
+            yield _fallback("empty", f"Réponse OpenAI vide (finish_reason={finish_reason})")
+            return
+        print(f"✅ Réponse streamée: {len(response_content)} caractères")
+        if not used_tools and not degraded and finish_reason == "stop":
+            RESPONSE_CACHE.put(user_message, history, response_content, query_embedding)
+        return
+    
+    # Le modèle demande encore des tools au dernier tour
+    yield _fallback("tool_rounds", f"Pas de réponse après {CHAT_MAX_TOOL_ROUNDS} tours de tool-calls")
+
+async def gradio_chat_stream(message: str, history: List[Dict[str, Any]]) -> AsyncIterator[str]:
+    """
+    Adaptateur pour gr.ChatInterface (type="messages") : Gradio attend le texte
+    cumulé à chaque yield. Service saturé : message d attente au lieu d une
+    réponse (même contrôle d admission que l API).
+    """
+    clean_history = prepare_history([
+        {"role": m["role"], "content": m["content"]}
+        for m in history
+        if isinstance(m.get("content"), str)
+    ])
+    partial = ""
+    try:
+        async with ADMISSION.slot():
+            async for delta in chat_stream(message, clean_history):
+                partial += delta
+                yield partial
+    except AdmissionRejected as rejection:
+        yield f"Le service est très sollicité, réessayez dans {rejection.retry_after} s."
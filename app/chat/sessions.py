@@ -0,0 +1,262 @@
+"""
+Sessions de conversation côté serveur : l historique est stocké dans Postgres
+(table chat_sessions, cf. model.py) sous forme compacte, devant lequel un cache
+LRU en mémoire évite une lecture SQL par tour de conversation.
+
+Le cache est en écriture directe (write-through) : chaque ajout est écrit en
+base puis dans le cache, une lecture ne va en base qu en cas d absence ou
+d expiration (TTL, qui borne aussi la divergence entre plusieurs workers).
+Si la base est indisponible, la conversation continue avec le seul cache.
+
+La base n est importée qu au premier accès : le module chat reste importable
+(benchmarks, tests) sans pilote Postgres.
+"""
+import time
+import asyncio
+import secrets
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from . import metrics
+
+_ROLE_CODES = {"user": "u", "assistant": "a", "system": "s"}
+_ROLE_NAMES = {code: role for role, code in _ROLE_CODES.items()}
+
+_cache_hits = metrics.counter("chat_session_cache_hits", "Historiques de session servis par le cache mémoire")
+_cache_misses = metrics.counter("chat_session_cache_misses", "Historiques de session relus en base")
+_db_errors = metrics.counter("chat_session_db_errors", "Accès à la table chat_sessions en échec")
+_unsummarized_dropped = metrics.counter(
+    "chat_session_unsummarized_dropped", "Messages retirés d une session avant d avoir été résumés"
+)
+_sessions_cached = metrics.gauge("chat_sessions_cached", "Sessions présentes dans le cache mémoire")
+
+
+def encode_history(history: List[Dict[str, str]]) -> List[List[str]]:
+    """[{"role": "user", "content": ...}] → [["u", ...]] (format stocké)."""
+    return [[_ROLE_CODES[m["role"]], m["content"]] for m in history]
+
+
+def decode_history(stored: List[List[str]]) -> List[Dict[str, str]]:
+    return [{"role": _ROLE_NAMES[code], "content": content} for code, content in stored]
+
+
+def new_session_id() -> str:
+    return secrets.token_urlsafe(24)
+
+
+@dataclass
+class SessionHistory:
+    messages: List[Dict[str, str]]
+    # Index, depuis le début de la conversation, de messages[0] (les plus
+    # anciens messages sont retirés au-delà de max_messages, une fois résumés)
+    offset: int
+    summary: Optional[str] = None
+    summary_upto: int = 0  # messages [0, summary_upto) couverts par le résumé
+
+
+@dataclass
+class _Entry:
+    messages: List[List[str]]
+    message_count: int
+    loaded_at: float
+    summary: Optional[str] = None
+    summary_upto: int = 0
+    # Base illisible : historique vide de secours, jamais réécrit en base
+    degraded: bool = False
+
+
+class SessionStore:
+    """Historiques par session : Postgres + cache LRU/TTL en écriture directe."""
+
+    def __init__(self, max_messages: int = 40, cache_size: int = 2000, cache_ttl_seconds: float = 600,
+                 max_unsummarized_messages: Optional[int] = None):
+        self.max_messages = max_messages
+        # Garde-fou si les résumés échouent durablement : la session reste bornée
+        self.max_unsummarized_messages = max_unsummarized_messages or 4 * max_messages
+        self.cache_size = cache_size
+        self.cache_ttl_seconds = cache_ttl_seconds
+        self._cache: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # Un tour à la fois par session : deux ajouts concurrents ne s écrasent pas
+        self._session_locks: Dict[str, asyncio.Lock] = {}
+
+    # ── Cache mémoire ──────────────────────────────────────────────────────────
+    def _cached(self, session_id: str) -> Optional[_Entry]:
+        with self._cache_lock:
+            entry = self._cache.get(session_id)
+            if entry is None:
+                return None
+            if time.monotonic() - entry.loaded_at > self.cache_ttl_seconds:
+                del self._cache[session_id]
+                return None
+            self._cache.move_to_end(session_id)
+            return entry
+
+    def _remember(self, session_id: str, entry: _Entry) -> None:
+        with self._cache_lock:
+            self._cache[session_id] = entry
+            self._cache.move_to_end(session_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            _sessions_cached.set(len(self._cache))
+
+    def _forget(self, session_id: str) -> None:
+        with self._cache_lock:
+            self._cache.pop(session_id, None)
+            _sessions_cached.set(len(self._cache))
+
+    def _lock_for(self, session_id: str) -> asyncio.Lock:
+        lock = self._session_locks.get(session_id)
+        if lock is None:
+            if len(self._session_locks) > self.cache_size:
+                # Verrous libres des sessions inactives
+                self._session_locks = {k: v for k, v in self._session_locks.items() if v.locked()}
+            lock = self._session_locks[session_id] = asyncio.Lock()
+        return lock
+
+    # ── Base de données (appels synchrones, exécutés hors boucle) ──────────────
+    @staticmethod
+    def _db_read(session_id: str) -> Optional[_Entry]:
+        from app.database.database import SessionLocal
+        from .model import ChatSession
+
+        with SessionLocal() as db:
+            row = db.get(ChatSession, session_id)
+            if row is None:
+                return None
+            return _Entry(list(row.messages or []), row.message_count or 0, time.monotonic(),
+                          row.summary, row.summary_upto or 0)
+
+    @staticmethod
+    def _db_write(session_id: str, messages: List[List[str]], message_count: int) -> None:
+        from app.database.database import SessionLocal
+        from .model import ChatSession
+
+        with SessionLocal() as db:
+            row = db.get(ChatSession, session_id)
+            if row is None:
+                db.add(ChatSession(id=session_id, messages=messages, message_count=message_count))
+            else:
+                row.messages = messages
+                row.message_count = message_count
+            db.commit()
+
+    @staticmethod
+    def _db_write_summary(session_id: str, summary: str, summary_upto: int) -> None:
+        from app.database.database import SessionLocal
+        from .model import ChatSession
+
+        with SessionLocal() as db:
+            db.query(ChatSession).filter(ChatSession.id == session_id).update(
+                {ChatSession.summary: summary, ChatSession.summary_upto: summary_upto}
+            )
+            db.commit()
+
+    @staticmethod
+    def _db_delete(session_id: str) -> bool:
+        from app.database.database import SessionLocal
+        from .model import ChatSession
+
+        with SessionLocal() as db:
+            deleted = db.query(ChatSession).filter(ChatSession.id == session_id).delete()
+            db.commit()
+            return bool(deleted)
+
+    async def _entry(self, session_id: str) -> Optional[_Entry]:
+        entry = self._cached(session_id)
+        if entry is not None:
+            _cache_hits.inc()
+            return entry
+        _cache_misses.inc()
+        try:
+            entry = await asyncio.to_thread(self._db_read, session_id)
+        except Exception as e:
+            _db_errors.inc()
+            print(f"⚠️ Lecture de la session impossible: {e}")
+            # Base indisponible : la conversation repart sans historique
+            return _Entry([], 0, time.monotonic(), degraded=True)
+        if entry is not None:
+            self._remember(session_id, entry)
+        return entry
+
+    # ── API ────────────────────────────────────────────────────────────────────
+    def create(self) -> str:
+        """Nouvelle session vide (écrite en base au premier échange)."""
+        session_id = new_session_id()
+        self._remember(session_id, _Entry([], 0, time.monotonic()))
+        return session_id
+
+    async def load(self, session_id: str) -> Optional[SessionHistory]:
+        """Historique de la session, None si elle n existe pas."""
+        entry = await self._entry(session_id)
+        if entry is None:
+            return None
+        return SessionHistory(decode_history(entry.messages), entry.message_count - len(entry.messages),
+                              entry.summary, entry.summary_upto)
+
+    def _trimmed(self, session_id: str, entry: _Entry, stored: List[List[str]],
+                 message_count: int) -> List[List[str]]:
+        """
+        Retire les plus anciens messages au-delà de `max_messages`, mais jamais
+        un message pas encore couvert par le résumé (il serait perdu) ; sauf
+        au-delà de `max_unsummarized_messages` (résumés en échec répétés).
+        """
+        offset = message_count - len(stored)
+        excess = len(stored) - self.max_messages
+        summarized = max(entry.summary_upto - offset, 0)
+        drop = max(min(excess, summarized), len(stored) - self.max_unsummarized_messages, 0)
+        if drop > summarized:
+            _unsummarized_dropped.inc(drop - summarized)
+            print(f"⚠️ Session {session_id[:8]}…: {drop - summarized} messages retirés sans avoir été résumés")
+        return stored[drop:]
+
+    async def append(self, session_id: str, messages: List[Dict[str, str]]) -> None:
+        """
+        Ajoute des messages (la session est créée au besoin) et ne garde que les
+        `max_messages` derniers, plus ceux qui attendent encore d être résumés :
+        c est le serveur qui borne l historique.
+        """
+        async with self._lock_for(session_id):
+            entry = await self._entry(session_id) or _Entry([], 0, time.monotonic())
+            if entry.degraded:
+                # Écrire ici écraserait en base l historique qu on n a pas pu relire
+                return
+            stored = self._trimmed(session_id, entry, entry.messages + encode_history(messages),
+                                   entry.message_count + len(messages))
+            updated = _Entry(stored, entry.message_count + len(messages), time.monotonic(),
+                             entry.summary, entry.summary_upto)
+            try:
+                await asyncio.to_thread(self._db_write, session_id, stored, updated.message_count)
+            except Exception as e:
+                _db_errors.inc()
+                print(f"⚠️ Écriture de la session impossible (cache mémoire seul): {e}")
+            self._remember(session_id, updated)
+
+    async def set_summary(self, session_id: str, summary: str, summary_upto: int) -> None:
+        """Enregistre un résumé couvrant les `summary_upto` premiers messages."""
+        async with self._lock_for(session_id):
+            entry = await self._entry(session_id)
+            if entry is None or entry.degraded or entry.summary_upto >= summary_upto:
+                return
+            try:
+                await asyncio.to_thread(self._db_write_summary, session_id, summary, summary_upto)
+            except Exception as e:
+                _db_errors.inc()
+                print(f"⚠️ Écriture du résumé impossible (cache mémoire seul): {e}")
+            self._remember(session_id, _Entry(entry.messages, entry.message_count, entry.loaded_at,
+                                              summary, summary_upto))
+
+    async def delete(self, session_id: str) -> bool:
+        """Supprime la session (base et cache). False si elle n existait pas."""
+        async with self._lock_for(session_id):
+            was_cached = self._cached(session_id) is not None
+            self._forget(session_id)
+            try:
+                deleted = await asyncio.to_thread(self._db_delete, session_id)
+            except Exception as e:
+                _db_errors.inc()
+                print(f"⚠️ Suppression de la session impossible: {e}")
+                return was_cached
+            return deleted or was_cached
@@ -0,0 +1,104 @@
+"""
+Registre des tools de l agent OpenAI : schéma et handler déclarés une fois
+(décorateur `ToolRegistry.tool`), exécution des tool-calls d un tour du
+modèle en parallèle, chacun borné par un timeout.
+
+Un tool inconnu, des arguments invalides, une exception ou un timeout donnent
+un résultat `{"error": ...}` renvoyé au modèle : la conversation continue.
+"""
+import json
+import time
+import asyncio
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from . import metrics
+
+_tool_calls = metrics.counter("tool_calls", "Tool-calls exécutés, par tool")
+_tool_errors = metrics.counter("tool_errors", "Tool-calls en erreur (arguments, exception, tool inconnu), par tool")
+_tool_timeouts = metrics.counter("tool_timeouts", "Tool-calls interrompus par le timeout, par tool")
+
+
+@dataclass(frozen=True)
+class Tool:
+    name: str
+    description: str
+    parameters: Dict[str, Any]
+    handler: Callable[..., Awaitable[Any]]
+    timeout: float
+
+    @property
+    def schema(self) -> Dict[str, Any]:
+        return {
+            "type": "function",
+            "function": {"name": self.name, "description": self.description, "parameters": self.parameters},
+        }
+
+
+class ToolRegistry:
+    def __init__(self, default_timeout: float = 10.0):
+        self.default_timeout = default_timeout
+        self._tools: Dict[str, Tool] = {}
+        self._schemas: List[Dict[str, Any]] = []
+
+    def tool(self, description: str, parameters: Dict[str, Any], name: Optional[str] = None,
+             timeout: Optional[float] = None):
+        """Décorateur : enregistre une coroutine comme tool (nom par défaut : celui de la fonction)."""
+        def register(handler: Callable[..., Awaitable[Any]]):
+            tool = Tool(name or handler.__name__, description, parameters, handler,
+                        timeout if timeout is not None else self.default_timeout)
+            if tool.name in self._tools:
+                raise ValueError(f"Tool déjà enregistré: {tool.name}")
+            self._tools[tool.name] = tool
+            self._schemas = [t.schema for t in self._tools.values()]
+            return handler
+        return register
+
+    @property
+    def schemas(self) -> List[Dict[str, Any]]:
+        """Paramètre `tools` de chat.completions (construit à l enregistrement)."""
+        return self._schemas
+
+    def get(self, name: str) -> Optional[Tool]:
+        return self._tools.get(name)
+
+    async def _execute(self, name: str, raw_arguments: str) -> Any:
+        tool = self._tools.get(name)
+        if tool is None:
+            _tool_errors.inc(label=name)
+            return {"error": f"unknown tool {name}"}
+        try:
+            arguments = json.loads(raw_arguments or "{}")
+        except ValueError as e:
+            _tool_errors.inc(label=name)
+            return {"error": f"invalid arguments: {e}"}
+
+        _tool_calls.inc(label=name)
+        started = time.perf_counter()
+        try:
+            return await asyncio.wait_for(tool.handler(**arguments), tool.timeout)
+        except asyncio.TimeoutError:
+            _tool_timeouts.inc(label=name)
+            print(f"⏱️ Tool {name} interrompu après {tool.timeout}s")
+            return {"error": "timeout"}
+        except Exception as e:
+            _tool_errors.inc(label=name)
+            print(f"❌ Tool {name} en erreur: {e}")
+            return {"error": str(e)}
+        finally:
+            metrics.histogram(
+                f"tool_{name}_ms", metrics.LATENCY_MS_BUCKETS, f"Durée du tool {name}"
+            ).observe((time.perf_counter() - started) * 1000)
+
+    async def run_all(self, tool_calls: List[Any]) -> List[Dict[str, Any]]:
+        """
+        Exécute en parallèle les tool-calls d un tour (objets avec `id` et
+        `function.name` / `function.arguments`) ; messages `tool` dans l ordre.
+        """
+        results = await asyncio.gather(*(
+            self._execute(call.function.name, call.function.arguments) for call in tool_calls
+        ))
+        return [
+            {"role": "tool", "content": json.dumps(result), "tool_call_id": call.id}
+            for call, result in zip(tool_calls, results)
+        ]
@@ -0,0 +1,92 @@
+"""
+Classifieur local « hors sujet » : plus proche centroïde sur les embeddings
+MiniLM déjà calculés pour le RAG.
+
+Les exemples annotés (`data/topic_examples.json` : listes `on_topic` et
+`off_topic`) sont encodés au chargement ; chaque classe est résumée par son
+centroïde normalisé. Pour une query, la confiance « hors sujet » est
+
+    p = sigmoïde(SCALE × (cos(q, centroïde_hors_sujet) − cos(q, centroïde_sujet)))
+
+Au-delà du seuil, la réponse de refus est servie sans RAG ni appel OpenAI ;
+en dessous, le LLM tranche (règle 3 du prompt).
+
+En cours de conversation, une relance courte (« oui », « et après ? »,
+réponse à une question de l assistant) n a pas de sujet propre : elle est
+classée avec le dernier échange (`contextual_query`).
+
+Module autonome (aucun import de app.chat) : l évaluation hors ligne le
+charge par chemin (benchmarks/eval_topic_classifier.py).
+"""
+import json
+import math
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Sequence, Union
+
+import numpy as np
+
+EXAMPLES_PATH = Path(__file__).resolve().parent / "data" / "topic_examples.json"
+# Pente de la sigmoïde : un écart de cosinus de 0.07 donne une confiance de 0.8
+SCALE = 20.0
+# Texte classé pour une relance : message + dernier échange, borné (MiniLM
+# tronque au-delà de 256 tokens ; le message vient en premier pour être gardé)
+CONTEXT_MAX_CHARS = 1000
+
+
+@dataclass
+class TopicPrediction:
+    off_topic: bool
+    confidence: float  # probabilité « hors sujet »
+    on_topic_similarity: float
+    off_topic_similarity: float
+
+
+class TopicClassifier:
+    def __init__(self, on_topic_centroid: np.ndarray, off_topic_centroid: np.ndarray, threshold: float = 0.8):
+        self.on_topic_centroid = _unit(on_topic_centroid)
+        self.off_topic_centroid = _unit(off_topic_centroid)
+        self.threshold = threshold
+
+    @classmethod
+    def fit(cls, on_topic: np.ndarray, off_topic: np.ndarray, threshold: float = 0.8) -> "TopicClassifier":
+        """Centroïdes des embeddings (n, dim) normalisés de chaque classe."""
+        if not len(on_topic) or not len(off_topic):
+            raise ValueError("Il faut des exemples des deux classes")
+        return cls(on_topic.mean(axis=0), off_topic.mean(axis=0), threshold)
+
+    @classmethod
+    def from_examples(cls, encode: Callable[[List[str]], np.ndarray],
+                      path: Union[str, Path] = EXAMPLES_PATH, threshold: float = 0.8) -> "TopicClassifier":
+        examples = load_examples(path)
+        return cls.fit(encode(examples["on_topic"]), encode(examples["off_topic"]), threshold)
+
+    def predict(self, query_embedding: np.ndarray) -> TopicPrediction:
+        """`query_embedding` : (dim,) ou (1, dim), normalisé L2."""
+        query = np.asarray(query_embedding, dtype="float32").reshape(-1)
+        on_sim = float(query @ self.on_topic_centroid)
+        off_sim = float(query @ self.off_topic_centroid)
+        confidence = 1.0 / (1.0 + math.exp(-SCALE * (off_sim - on_sim)))
+        return TopicPrediction(confidence >= self.threshold, confidence, on_sim, off_sim)
+
+    def confidences(self, embeddings: np.ndarray) -> np.ndarray:
+        """Probabilités « hors sujet » d un lot (n, dim)."""
+        margins = embeddings @ self.off_topic_centroid - embeddings @ self.on_topic_centroid
+        return 1.0 / (1.0 + np.exp(-SCALE * margins))
+
+
+def contextual_query(message: str, history: Sequence[Dict[str, str]], max_chars: int = CONTEXT_MAX_CHARS) -> str:
+    """Message suivi du dernier échange (user / assistant) de `history`."""
+    previous = [m["content"] for m in history[-2:] if m.get("role") in ("user", "assistant")]
+    return " ".join([message, *previous])[:max_chars]
+
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    vector = np.asarray(vector, dtype="float32").reshape(-1)
+    return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+
+def load_examples(path: Union[str, Path] = EXAMPLES_PATH) -> Dict[str, List[str]]:
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return {"on_topic": list(data["on_topic"]), "off_topic": list(data["off_topic"])}
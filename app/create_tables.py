@@ -11,6 +11,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app.database.database import create_tables, check_database_connection
 from app.auth.models import Base
+from app.chat.model import ChatSession  # noqa: F401 (table chat_sessions)
 from sqlalchemy import create_engine
 from dotenv import load_dotenv
 
@@ -34,6 +35,7 @@ def main():
         print("  - users")
         print("  - subscriptions") 
         print("  - payments")
+        print("  - chat_sessions")
         return True
     else:
         print("❌ Erreur lors de la création des tables")
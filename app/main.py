@@ -3,7 +3,8 @@ import gradio as gr
 from app.chat.router import router as chat_router
 from app.auth.router import router as auth_router
 from app.payment.router import router as payment_router
-from app.chat.services import chat as gradio_chat
+from app.chat.services import gradio_chat_stream
+from app.chat.dependencies import RAG_LOADER, NOTIFICATIONS
 from fastapi.middleware.cors import CORSMiddleware
 from app.static.pages import router as pages_router
 import uvicorn
@@ -27,6 +28,18 @@ app.include_router(auth_router, prefix="/api")
 app.include_router(payment_router, prefix="/api")
 app.include_router(pages_router)
 
+@app.on_event("startup")
+async def start_rag_loading():
+    # Chargement du RAG en arrière-plan : le serveur répond dès maintenant,
+    # /api/chat/ready passe à 200 une fois l index chargé et le modèle chauffé
+    RAG_LOADER.start()
+    # Worker Pushover : renvoie aussi les notifications restées sur disque
+    NOTIFICATIONS.start()
+
+@app.on_event("shutdown")
+async def flush_notifications():
+    await NOTIFICATIONS.close()
+
 @app.get("/")
 def read_root():
     return {
@@ -45,7 +58,7 @@ def api_health_check():
     return {"status": "ok", "message": "API running"}
 
 # Interface Gradio - MONTÉ EN DEHORS DU IF __NAME__
-demo = gr.ChatInterface(gradio_chat, type="messages")
+demo = gr.ChatInterface(gradio_chat_stream, type="messages")
 app = gr.mount_gradio_app(app, demo, path="/gradio")
 
 if __name__ == "__main__":
@@ -0,0 +1,99 @@
+"""
+Extraction et découpage de PDF en parallèle, en flux.
+
+Les pages sont réparties par plages entre les processus d un pool ; chaque
+worker renvoie directement les chunks de ses pages. Le nombre de plages en
+cours est borné : la mémoire de l extraction ne dépend pas de la taille du
+document (celle de l indexation, oui : cf. indexing.sync_shard).
+
+Ce module est volontairement hors de `app.chat` : les workers l importent
+sans charger le modèle d embedding ni l index RAG.
+"""
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Tuple
+
+from pypdf import PdfReader
+
+
+def split_words(text: str, chunk_size: int, min_chunk_chars: int) -> List[str]:
+    """Découpe un texte en chunks de `chunk_size` mots (les chunks trop courts sont ignorés)."""
+    words = text.split()
+    chunks = []
+    for i in range(0, len(words), chunk_size):
+        chunk_content = " ".join(words[i:i + chunk_size])
+        if len(chunk_content.strip()) > min_chunk_chars:  # Éviter les chunks trop petits
+            chunks.append(chunk_content)
+    return chunks
+
+
+def page_count(path: str) -> int:
+    return len(PdfReader(path).pages)
+
+
+def extract_page_range(path: str, start: int, end: int, chunk_size: int,
+                       min_chunk_chars: int) -> List[Tuple[int, List[str]]]:
+    """Worker : chunks des pages [start, end) sous la forme [(numéro de page, chunks)]."""
+    reader = PdfReader(path)
+    return [
+        (page_num + 1, split_words(reader.pages[page_num].extract_text() or "", chunk_size, min_chunk_chars))
+        for page_num in range(start, end)
+    ]
+
+
+def _pool_context():
+    """
+    Contexte des workers. Un fork au milieu des threads du serveur (torch,
+    FAISS) n est pas sûr ; "forkserver" part d un process vierge qui n importe
+    que ce module (et pas le `__main__` de l application). À défaut : "spawn".
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+def iter_pdf_chunks(path: str, chunk_size: int, min_chunk_chars: int, workers: int = 1,
+                    pages_per_task: int = 16, parallel_min_pages: int = 32) -> Iterator[Tuple[int, str]]:
+    """
+    Produit les chunks (numéro de page, texte) dans l ordre du document.
+    En dessous de `parallel_min_pages`, ou avec un seul worker, l extraction
+    reste dans le process courant (le démarrage du pool coûterait plus cher).
+    Comme pour tout pool multiprocessing, le point d entrée doit être protégé
+    par `if __name__ == "__main__":` (c est le cas de uvicorn).
+    """
+    n_pages = page_count(path)
+    ranges = [(s, min(s + pages_per_task, n_pages)) for s in range(0, n_pages, pages_per_task)]
+
+    # Jamais de pool imbriqué : un worker qui réimporte l application reste en série
+    in_worker = multiprocessing.parent_process() is not None
+    if workers <= 1 or n_pages < parallel_min_pages or in_worker:
+        for start, end in ranges:
+            for page_number, chunks in extract_page_range(path, start, end, chunk_size, min_chunk_chars):
+                for content in chunks:
+                    yield page_number, content
+        return
+
+    max_in_flight = workers * 2
+    with ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context()) as pool:
+        pending = deque()
+        next_range = iter(ranges)
+
+        def submit_next() -> bool:
+            page_range = next(next_range, None)
+            if page_range is None:
+                return False
+            pending.append(pool.submit(extract_page_range, path, *page_range, chunk_size, min_chunk_chars))
+            return True
+
+        while len(pending) < max_in_flight and submit_next():
+            pass
+        while pending:
+            # Résultats consommés dans l ordre ; une nouvelle plage part dès qu une se termine
+            pages = pending.popleft().result()
+            submit_next()
+            for page_number, chunks in pages:
+                for content in chunks:
+                    yield page_number, content
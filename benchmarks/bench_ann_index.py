@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Benchmark des types d index FAISS du RAG : recall@k par rapport à l index
+exhaustif (Flat), latence de recherche p50/p99 (une query à la fois, comme en
+production) et mémoire de l index sérialisé. Chaque type est mesuré pour
+chaque stockage demandé (float32, fp16, int8), avec et sans re-scoring
+float32 des candidats (--rescore).
+
+Deux corpus :
+  - réel : vecteurs d un index existant (ancien index unique ou shard) ;
+  - synthétique : vecteurs groupés en clusters, à l échelle de milliers de
+    transcriptions (--synthetic N).
+
+Les queries sont des vecteurs du corpus légèrement bruités (pas besoin du
+modèle d embedding). Le module ann est chargé par chemin, sans importer
+app.chat.
+
+    python benchmarks/bench_ann_index.py --real app/rag_index --synthetic 100000
+    python benchmarks/bench_ann_index.py --synthetic 200000 --nlist 1024 --nprobe 32
+    python benchmarks/bench_ann_index.py --kinds flat,hnsw --storage float32,fp16,int8 --rescore
+"""
+
+import os
+import sys
+import time
+import argparse
+import importlib.util
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ANN_PATH = os.path.join(ROOT, "app", "chat", "ann.py")
+
+
+def _load_ann():
+    spec = importlib.util.spec_from_file_location("ann", ANN_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["ann"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    x = np.ascontiguousarray(x, dtype="float32")
+    x /= np.linalg.norm(x, axis=1, keepdims=True) + 1e-12
+    return x
+
+
+def real_corpus(base: str) -> np.ndarray:
+    import faiss
+    index = faiss.read_index(f"{base}.faiss")
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def synthetic_corpus(n: int, dim: int, clusters: int, seed: int = 0) -> np.ndarray:
+    """Vecteurs groupés autour de `clusters` thèmes (plus réaliste qu un bruit uniforme)."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype("float32")
+    assignment = rng.integers(0, clusters, n)
+    out = np.empty((n, dim), dtype="float32")
+    for start in range(0, n, 50_000):
+        end = min(start + 50_000, n)
+        out[start:end] = centers[assignment[start:end]] + 0.6 * rng.standard_normal((end - start, dim))
+    return _normalize(out)
+
+
+def make_queries(corpus: np.ndarray, n: int, noise: float = 0.05, seed: int = 1) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    picks = corpus[rng.integers(0, len(corpus), n)]
+    return _normalize(picks + noise * rng.standard_normal(picks.shape).astype("float32"))
+
+
+def run(ann, name: str, corpus: np.ndarray, queries: np.ndarray, specs, k: int) -> None:
+    import faiss
+
+    print(f"\n=== Corpus {name}: {len(corpus)} vecteurs de dim {corpus.shape[1]}, {len(queries)} queries, k={k}")
+    print(f"{'type':<32}{'build (s)':>10}{'recall@k':>10}{'p50 (ms)':>10}{'p99 (ms)':>10}{'mémoire (Mo)':>14}")
+
+    truth = None
+    for spec in specs:
+        t0 = time.perf_counter()
+        builder = ann.IndexBuilder(spec)
+        for start in range(0, len(corpus), 4096):  # ajout par lots, comme sync_shard
+            builder.add(corpus[start:start + 4096])
+        index, effective = builder.finish()
+        build_s = time.perf_counter() - t0
+
+        # Re-scoring : en production les vecteurs float32 sont mmappés depuis le disque
+        vectors = corpus if spec.rescore else None
+        latencies = []
+        found = []
+        for q in queries:
+            t0 = time.perf_counter()
+            _, ids = ann.search(index, q.reshape(1, -1), k, spec, vectors)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            found.append(ids[0])
+        found = np.array(found)
+        if truth is None:  # premier spec = Flat
+            truth = found
+        recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(found, truth)])
+
+        label = effective.factory_string()
+        if spec.rescore:
+            label += f" + rescore x{spec.rescore_factor}"
+        if effective.kind != spec.kind:
+            label += " (repli)"
+        memory_mb = faiss.serialize_index(index).nbytes / 1e6
+        print(f"{label:<32}{build_s:>10.2f}{recall:>10.3f}{np.percentile(latencies, 50):>10.3f}"
+              f"{np.percentile(latencies, 99):>10.3f}{memory_mb:>14.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--real", default=os.path.join(ROOT, "app", "rag_index"),
+                        help="base d un index existant (fichier {base}.faiss), '' pour ignorer")
+    parser.add_argument("--synthetic", type=int, default=50_000, help="taille du corpus synthétique (0 = ignorer)")
+    parser.add_argument("--clusters", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("-k", type=int, default=8)
+    parser.add_argument("--nlist", type=int, default=256)
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--hnsw-m", type=int, default=32)
+    parser.add_argument("--ef-search", type=int, default=64)
+    parser.add_argument("--pq-m", type=int, default=48)
+    parser.add_argument("--kinds", default="flat,ivf_flat,hnsw,ivf_pq")
+    parser.add_argument("--storage", default="float32", help="liste parmi float32,fp16,int8")
+    parser.add_argument("--rescore", action="store_true", help="ajouter les variantes avec re-scoring float32")
+    parser.add_argument("--rescore-factor", type=int, default=4)
+    args = parser.parse_args()
+
+    import faiss
+    faiss.omp_set_num_threads(1)  # une recherche = un thread de RAG_EXECUTOR
+    ann = _load_ann()
+
+    params = dict(nlist=args.nlist, nprobe=args.nprobe, hnsw_m=args.hnsw_m,
+                  ef_search=args.ef_search, pq_m=args.pq_m)
+    # Premier spec = Flat float32 exact (vérité terrain du recall)
+    specs = [ann.IndexSpec(kind="flat", **params)]
+    for kind in args.kinds.split(","):
+        for storage in args.storage.split(","):
+            if kind == "ivf_pq" and storage != "float32":
+                continue  # déjà quantifié par PQ
+            spec = ann.IndexSpec(kind=kind, storage=storage, **params)
+            if spec != specs[0]:
+                specs.append(spec)
+            if args.rescore and spec.is_quantized:
+                specs.append(ann.IndexSpec(kind=kind, storage=storage, rescore=True,
+                                           rescore_factor=args.rescore_factor, **params))
+
+    if args.real and os.path.exists(f"{args.real}.faiss"):
+        corpus = real_corpus(args.real)
+        run(ann, f"réel ({os.path.basename(args.real)})", corpus, make_queries(corpus, args.queries), specs, args.k)
+    if args.synthetic:
+        corpus = synthetic_corpus(args.synthetic, 384, args.clusters)
+        run(ann, "synthétique", corpus, make_queries(corpus, args.queries), specs, args.k)
+
+
+if __name__ == "__main__":
+    main()
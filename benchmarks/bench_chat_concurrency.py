@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Benchmark de débit concurrent de /api/chat/ : ancien pipeline bloquant vs pipeline async.
+
+L appel OpenAI est simulé par une latence fixe (aucun appel réseau) ; le RAG,
+lui, est le vrai (embedding + FAISS dans l exécuteur borné).
+
+    python benchmarks/bench_chat_concurrency.py --requests 40 --latency 0.5
+"""
+
+import sys
+import os
+import time
+import importlib
+import asyncio
+import argparse
+import statistics
+from types import SimpleNamespace
+
+# Ajouter le répertoire parent au path pour les imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from fastapi import FastAPI
+
+# `app.chat.router` est masqué par l APIRouter réexporté dans app/chat/__init__.py
+chat_router_module = importlib.import_module("app.chat.router")
+services = importlib.import_module("app.chat.services")
+
+
+def _fake_completion():
+    message = SimpleNamespace(content="Réponse simulée.", tool_calls=None)
+    return SimpleNamespace(choices=[SimpleNamespace(finish_reason="stop", message=message)])
+
+
+class _AsyncCompletions:
+    """Remplace AsyncOpenAI : latence simulée sans bloquer la boucle."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    async def create(self, **kwargs):
+        await asyncio.sleep(self.latency)
+        return _fake_completion()
+
+
+def _blocking_chat(latency: float):
+    """Reproduit l ancien comportement : chat() synchrone appelé depuis un endpoint async."""
+    from app.chat.dependencies import RAG_LOADER
+
+    async def chat(user_message, history):
+        RAG_LOADER.get().get_context_for_query(user_message, 10000)  # bloque la boucle
+        time.sleep(latency)  # bloque la boucle comme openai_client.chat.completions.create
+        return _fake_completion().choices[0].message.content
+
+    return chat
+
+
+async def _run(n_requests: int, concurrency: int) -> dict:
+    app = FastAPI()
+    app.include_router(chat_router_module.router, prefix="/api")
+    transport = httpx.ASGITransport(app=app)
+    semaphore = asyncio.Semaphore(concurrency)
+    health_latencies = []
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+
+        async def one_chat(i: int):
+            async with semaphore:
+                await client.post("/api/chat/", json={"message": f"elle me quitte encore {i}"})
+
+        async def probe_health(stop: asyncio.Event):
+            # Le chrono démarre avant le sleep : si la boucle est bloquée, le réveil
+            # est retardé et ce retard est compté dans la latence de /health.
+            while not stop.is_set():
+                t0 = time.perf_counter()
+                await asyncio.sleep(0.05)
+                await client.get("/api/chat/health")
+                health_latencies.append(time.perf_counter() - t0 - 0.05)
+
+        stop = asyncio.Event()
+        prober = asyncio.create_task(probe_health(stop))
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one_chat(i) for i in range(n_requests)))
+        elapsed = time.perf_counter() - t0
+        stop.set()
+        await prober
+
+    return {
+        "elapsed_s": elapsed,
+        "throughput_rps": n_requests / elapsed,
+        "health_p50_ms": statistics.median(health_latencies) * 1000 if health_latencies else float("nan"),
+        "health_max_ms": max(health_latencies) * 1000 if health_latencies else float("nan"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.5, help="latence OpenAI simulée (s)")
+    args = parser.parse_args()
+
+    # RAG chargé une fois avant les mesures (sinon les requêtes partent en mode dégradé)
+    from app.chat.dependencies import RAG_LOADER
+    asyncio.run(RAG_LOADER.wait())
+
+    original_chat = chat_router_module.chat
+    services.LLM.client.chat = SimpleNamespace(completions=_AsyncCompletions(args.latency))
+
+    results = {}
+    chat_router_module.chat = _blocking_chat(args.latency)
+    results["avant (bloquant)"] = asyncio.run(_run(args.requests, args.concurrency))
+    chat_router_module.chat = original_chat
+    results["après (async)"] = asyncio.run(_run(args.requests, args.concurrency))
+
+    print(f"\n{args.requests} requêtes, concurrence {args.concurrency}, latence OpenAI {args.latency}s")
+    print(f"{'mode':<18}{'durée (s)':>12}{'req/s':>10}{'/health p50 (ms)':>18}{'/health max (ms)':>18}")
+    for mode, r in results.items():
+        print(f"{mode:<18}{r['elapsed_s']:>12.2f}{r['throughput_rps']:>10.2f}"
+              f"{r['health_p50_ms']:>18.1f}{r['health_max_ms']:>18.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Benchmark des backends d embedding : temps de chargement, mémoire, latence
+d une query seule (p50/p99, le cas d une requête chat) et débit par lots
+(construction des shards).
+
+Chaque backend tourne dans un sous-process neuf (RSS et imports isolés). Le
+module embedding_backends est chargé par chemin, sans importer app.chat.
+
+    OMP_NUM_THREADS=1 python benchmarks/bench_embedding_backends.py
+    python benchmarks/bench_embedding_backends.py --backends onnx,onnx-int8 --onnx-dir app/models/all-MiniLM-L6-v2-onnx
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import importlib.util
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKENDS_PATH = os.path.join(ROOT, "app", "chat", "embedding_backends.py")
+
+QUERIES = [
+    "Comment réagir après une rupture ?",
+    "Elle ne répond plus à mes messages depuis trois jours",
+    "Qu est-ce que l hypergamie ?",
+    "Comment poser un cadre dans la relation sans être froid",
+    "Je veux reconquérir mon ex, que faire ?",
+]
+# Chunk typique de l index : ~400 mots
+PASSAGE = " ".join(["Un homme qui pose des limites claires inspire respect et attraction."] * 40)
+
+
+def _load_backends():
+    spec = importlib.util.spec_from_file_location("embedding_backends", BACKENDS_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def _measure(kind: str, onnx_dir: str, model: str, iterations: int, batch_size: int) -> dict:
+    rss_before = _rss_mb()
+    t0 = time.perf_counter()
+    backend = _load_backends().create_backend(kind, model, onnx_dir)
+    backend.encode(["échauffement"])
+    load_s = time.perf_counter() - t0
+    rss_loaded = _rss_mb()
+
+    latencies = []
+    for i in range(iterations):
+        query = QUERIES[i % len(QUERIES)] + f" {i}"  # pas de cache possible
+        t0 = time.perf_counter()
+        backend.encode([query])
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+    batch = [f"{PASSAGE} {i}" for i in range(batch_size)]
+    t0 = time.perf_counter()
+    rounds = 3
+    for _ in range(rounds):
+        backend.encode(batch)
+    throughput = rounds * batch_size / (time.perf_counter() - t0)
+
+    return {
+        "backend": kind,
+        "load_s": load_s,
+        "rss_mb": rss_loaded,
+        "model_rss_mb": rss_loaded - rss_before,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "chunks_per_s": throughput,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default="sentence-transformers,onnx,onnx-int8")
+    parser.add_argument("--onnx-dir", default=os.path.join(ROOT, "app", "models", "all-MiniLM-L6-v2-onnx"))
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(_measure(args.child, args.onnx_dir, args.model, args.iterations, args.batch_size)))
+        return
+
+    print(f"OMP_NUM_THREADS={os.getenv('OMP_NUM_THREADS', '(non défini)')}")
+    print(f"{'backend':<24}{'chargement (s)':>15}{'RSS (Mo)':>10}{'p50 (ms)':>10}{'p99 (ms)':>10}{'chunks/s':>10}")
+    for kind in args.backends.split(","):
+        cmd = [sys.executable, __file__, "--child", kind, "--onnx-dir", args.onnx_dir, "--model", args.model,
+               "--iterations", str(args.iterations), "--batch-size", str(args.batch_size)]
+        out = subprocess.run(cmd, capture_output=True, text=True)
+        if out.returncode != 0:
+            error = (out.stderr.strip().splitlines() or ["?"])[-1]
+            print(f"{kind:<24}indisponible: {error}")
+            continue
+        r = json.loads(out.stdout.strip().splitlines()[-1])
+        print(f"{r['backend']:<24}{r['load_s']:>15.2f}{r['rss_mb']:>10.0f}{r['p50_ms']:>10.2f}"
+              f"{r['p99_ms']:>10.2f}{r['chunks_per_s']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
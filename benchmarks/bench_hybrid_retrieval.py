@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la récupération du contexte : dense seul (historique, top 8 et
+10 000 caractères) vs hybride dense + BM25 fusionné par RRF, avec ou sans
+assemblage sous budget de tokens (seuil de score, déduplication), sur un jeu
+de questions annotées avec les pages attendues (benchmarks/data/).
+
+Pour chaque mode : taux de succès (au moins une page attendue dans le
+contexte), MRR de la première page attendue, taille moyenne du contexte en
+caractères et en tokens (o200k_base, tokenizer de gpt-4o-mini).
+
+Utilise les vrais shards (construits au besoin) et le vrai modèle d embedding.
+
+    python benchmarks/bench_hybrid_retrieval.py
+    python benchmarks/bench_hybrid_retrieval.py --top-k 4,6,8 --max-tokens 1500 --verbose
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+
+# Ajouter le répertoire parent au path pour les imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_QUERIES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "rag_labelled_queries.json")
+MAX_CHARS = 10000
+
+
+def pack_chars(chunks, max_chars: int = MAX_CHARS):
+    """Assemblage historique : par caractères, arrêt au premier chunk qui ne tient pas."""
+    parts, total, kept = [], 0, []
+    for chunk, _ in chunks:
+        text = f"[{chunk.title} - Page {chunk.page_number}]\n{chunk.content}\n"
+        if total + len(text) > max_chars:
+            break
+        parts.append(text)
+        total += len(text)
+        kept.append(chunk)
+    return "\n---\n".join(parts), kept
+
+
+def pack_tokens(max_tokens: int):
+    """
+    Même assemblage que SimpleRAG.get_context_for_query en mode hybride (le
+    seuil de score est appliqué avant la fusion, cf. hybrid_search).
+    """
+    from app.chat.context_packing import pack_context
+    from app.chat.dependencies import RAG_CONTEXT_DEDUP_THRESHOLD
+
+    def pack(chunks):
+        packed = pack_context(chunks, max_tokens, 0.0, RAG_CONTEXT_DEDUP_THRESHOLD)
+        return packed.text, packed.chunks
+    return pack
+
+
+def evaluate(name, retrieve, pack, queries, count_tokens, verbose=False):
+    hits, reciprocal_ranks, chars, tokens = 0, [], [], []
+    for item in queries:
+        expected = set(item["pages"])
+        context, kept = pack(retrieve(item["query"]))
+        pages = [chunk.page_number for chunk in kept]
+        rank = next((i for i, page in enumerate(pages, start=1) if page in expected), None)
+        hits += rank is not None
+        reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+        chars.append(len(context))
+        tokens.append(count_tokens(context))
+        if verbose:
+            print(f"   {'✅' if rank else '❌'} {item['query'][:60]:<60} attendu {sorted(expected)} → {pages}")
+    return {
+        "mode": name,
+        "hit_rate": hits / len(queries),
+        "mrr": statistics.mean(reciprocal_ranks),
+        "chars": statistics.mean(chars),
+        "tokens": statistics.mean(tokens),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", default=DEFAULT_QUERIES)
+    parser.add_argument("--top-k", default="4,6,8", help="nombres de candidats testés")
+    parser.add_argument("--max-tokens", type=int, default=None, help="budget (défaut : RAG_CONTEXT_MAX_TOKENS)")
+    parser.add_argument("--verbose", action="store_true", help="détail par question")
+    args = parser.parse_args()
+
+    from app.chat.context_packing import count_tokens, encoding_name
+    from app.chat.dependencies import RAG_CONTEXT_MAX_TOKENS, RAG_CONTEXT_MIN_SCORE_RATIO, initialize_rag
+
+    with open(args.queries, encoding="utf-8") as f:
+        queries = json.load(f)["queries"]
+    rag = initialize_rag()
+    max_tokens = args.max_tokens or RAG_CONTEXT_MAX_TOKENS
+    budget = pack_tokens(max_tokens)
+
+    # Embeddings calculés une fois : seul le classement diffère entre les modes
+    embeddings = {item["query"]: rag.embed_query(item["query"]) for item in queries}
+
+    modes = [("dense top8 (historique)",
+              lambda q: rag.search_relevant_chunks(q, top_k=8, query_embedding=embeddings[q]), pack_chars)]
+    for k in (int(k) for k in args.top_k.split(",")):
+        dense = lambda q, k=k: rag.search_relevant_chunks(q, top_k=k, query_embedding=embeddings[q])
+        hybrid = lambda q, k=k: rag.hybrid_search(q, top_k=k, query_embedding=embeddings[q])
+        filtered = lambda q, k=k: rag.hybrid_search(q, top_k=k, query_embedding=embeddings[q],
+                                                    min_score_ratio=RAG_CONTEXT_MIN_SCORE_RATIO)
+        modes.append((f"dense top{k}", dense, pack_chars))
+        modes.append((f"hybride top{k}", hybrid, pack_chars))
+        modes.append((f"hybride top{k} budget", filtered, budget))
+
+    print(f"{len(queries)} questions annotées, {rag.num_chunks} chunks, "
+          f"budget {max_tokens} tokens ({encoding_name()})")
+    results = []
+    for name, retrieve, pack in modes:
+        if args.verbose:
+            print(f"── {name}")
+        results.append(evaluate(name, retrieve, pack, queries, count_tokens, args.verbose))
+
+    print(f"\n{'mode':<28}{'succès':>8}{'MRR':>8}{'caractères':>12}{'tokens':>9}")
+    for r in results:
+        print(f"{r['mode']:<28}{r['hit_rate']:>8.0%}{r['mrr']:>8.3f}{r['chars']:>12.0f}{r['tokens']:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Benchmark de chargement de l index RAG : ancien format JSON vs format binaire mmappé.
+
+Chaque mesure tourne dans un sous-process neuf pour isoler le RSS.
+Le module index_store est chargé par chemin, sans importer app.chat (qui
+chargerait le modèle d embedding).
+
+    python benchmarks/bench_index_load.py --base app/rag_index --workers 4
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import importlib.util
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INDEX_STORE_PATH = os.path.join(ROOT, "app", "chat", "index_store.py")
+
+
+def _load_index_store():
+    spec = importlib.util.spec_from_file_location("index_store", INDEX_STORE_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _memory_kb() -> dict:
+    """RSS total et part privée (hors pages de fichiers partagées) depuis /proc."""
+    values = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(("VmRSS:", "RssAnon:", "RssFile:")):
+                key, value = line.split(":")
+                values[key] = int(value.split()[0])
+    return values
+
+
+def _measure(fmt: str, base: str) -> dict:
+    import faiss
+    index_store = _load_index_store()
+
+    before = _memory_kb()
+    t0 = time.perf_counter()
+    if fmt == "json":
+        index = faiss.read_index(f"{base}.faiss")
+        chunks = index_store.load_json_chunks(index_store.json_chunks_path(base))
+    else:
+        index = index_store.read_faiss_index(f"{base}.faiss")
+        chunks = index_store.ChunkStore(index_store.bin_chunks_path(base))
+    load_s = time.perf_counter() - t0
+
+    # Accès typique d une requête : 8 chunks
+    t0 = time.perf_counter()
+    step = max(1, len(chunks) // 8)
+    _ = [chunks[i].content for i in range(0, len(chunks), step)][:8]
+    access_ms = (time.perf_counter() - t0) * 1000
+
+    after = _memory_kb()
+    return {
+        "format": fmt,
+        "chunks": len(chunks),
+        "vectors": index.ntotal,
+        "load_ms": load_s * 1000,
+        "access_8_ms": access_ms,
+        "rss_delta_kb": after["VmRSS"] - before["VmRSS"],
+        "private_delta_kb": after.get("RssAnon", 0) - before.get("RssAnon", 0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base", default=os.path.join(ROOT, "app", "rag_index"))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--child", choices=["json", "bin"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(_measure(args.child, args.base)))
+        return
+
+    index_store = _load_index_store()
+    if not index_store.bin_chunks_path(args.base).exists():
+        index_store.convert_json_to_bin(args.base)
+
+    json_size = index_store.json_chunks_path(args.base).stat().st_size
+    bin_size = index_store.bin_chunks_path(args.base).stat().st_size
+    print(f"Taille chunks : JSON {json_size / 1024:.1f} Ko, binaire {bin_size / 1024:.1f} Ko")
+    print(f"{'format':<8}{'load (ms)':>12}{'8 accès (ms)':>14}{'ΔRSS (Ko)':>12}{'Δprivé (Ko)':>13}")
+
+    for fmt in ("json", "bin"):
+        runs = []
+        for _ in range(args.repeat):
+            out = subprocess.run(
+                [sys.executable, __file__, "--child", fmt, "--base", args.base],
+                capture_output=True, text=True, check=True,
+            )
+            runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+        best = min(runs, key=lambda r: r["load_ms"])
+        print(f"{fmt:<8}{best['load_ms']:>12.2f}{best['access_8_ms']:>14.3f}"
+              f"{best['rss_delta_kb']:>12}{best['private_delta_kb']:>13}")
+
+
+if __name__ == "__main__":
+    main()
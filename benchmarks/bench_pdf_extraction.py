@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Benchmark d extraction + découpage de PDF : série (liste complète) vs flux
+série vs flux parallèle, sur un PDF synthétique de plusieurs centaines de pages.
+
+Chaque mode tourne dans un sous-process neuf ; le pic RSS inclut les workers.
+
+    python benchmarks/bench_pdf_extraction.py --pages 400 --workers 4
+    python benchmarks/bench_pdf_extraction.py --pages 400 --embed   # + embedding par lots
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import resource
+import tempfile
+import subprocess
+
+# Ajouter le répertoire parent au path pour les imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.pdf_extraction import iter_pdf_chunks  # noqa: E402  (n importe pas app.chat)
+
+CHUNK_SIZE = 400
+MIN_CHUNK_CHARS = 50
+EMBED_BATCH_SIZE = 256
+
+WORDS = (
+    "homme femme relation cadre respect valeur rupture fidélité confiance loyauté "
+    "engagement attraction discipline vision mission responsabilité limites"
+).split()
+
+
+def make_synthetic_pdf(path: str, pages: int, words_per_page: int = 600) -> None:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    rng = random.Random(42)
+    c = canvas.Canvas(path, pagesize=A4)
+    width, height = A4
+    for _ in range(pages):
+        text = c.beginText(40, height - 40)
+        text.setFont("Helvetica", 7)
+        words = [rng.choice(WORDS) for _ in range(words_per_page)]
+        for i in range(0, len(words), 20):
+            text.textLine(" ".join(words[i:i + 20]))
+        c.drawText(text)
+        c.showPage()
+    c.save()
+
+
+def _peak_rss_kb() -> int:
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return own + children
+
+
+def _run_mode(mode: str, pdf_path: str, workers: int, embed: bool) -> dict:
+    model = None
+    if embed:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer("all-MiniLM-L6-v2")
+
+    t0 = time.perf_counter()
+    n_chunks = 0
+    if mode == "liste":
+        # Ancien comportement : tous les chunks en mémoire, puis embedding global
+        chunks = [content for _, content in iter_pdf_chunks(pdf_path, CHUNK_SIZE, MIN_CHUNK_CHARS, workers=1)]
+        if model is not None:
+            model.encode(chunks)
+        n_chunks = len(chunks)
+    else:
+        batch = []
+        for _, content in iter_pdf_chunks(pdf_path, CHUNK_SIZE, MIN_CHUNK_CHARS,
+                                          workers=workers if mode == "parallèle" else 1):
+            batch.append(content)
+            n_chunks += 1
+            if len(batch) >= EMBED_BATCH_SIZE:
+                if model is not None:
+                    model.encode(batch)
+                batch = []
+        if batch and model is not None:
+            model.encode(batch)
+    elapsed = time.perf_counter() - t0
+
+    from pypdf import PdfReader
+    pages = len(PdfReader(pdf_path).pages)
+    return {
+        "mode": mode,
+        "pages": pages,
+        "chunks": n_chunks,
+        "seconds": elapsed,
+        "pages_per_s": pages / elapsed,
+        "peak_rss_mb": _peak_rss_kb() / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=400)
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument("--embed", action="store_true", help="inclure l embedding par lots (MiniLM)")
+    parser.add_argument("--pdf", help="PDF existant au lieu du PDF synthétique")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(_run_mode(args.child, args.pdf, args.workers, args.embed)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = args.pdf
+        if pdf_path is None:
+            pdf_path = os.path.join(tmp, "synthetic.pdf")
+            print(f"Génération d un PDF synthétique de {args.pages} pages...")
+            make_synthetic_pdf(pdf_path, args.pages)
+
+        print(f"{'mode':<12}{'pages':>7}{'chunks':>8}{'durée (s)':>11}{'pages/s':>10}{'pic RSS (Mo)':>14}")
+        for mode in ("liste", "série", "parallèle"):
+            cmd = [sys.executable, __file__, "--child", mode, "--pdf", pdf_path, "--workers", str(args.workers)]
+            if args.embed:
+                cmd.append("--embed")
+            out = subprocess.run(cmd, capture_output=True, text=True, check=True)
+            r = json.loads(out.stdout.strip().splitlines()[-1])
+            print(f"{r['mode']:<12}{r['pages']:>7}{r['chunks']:>8}{r['seconds']:>11.2f}"
+                  f"{r['pages_per_s']:>10.1f}{r['peak_rss_mb']:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark de la détection de thème et de salutation : ancienne
+implémentation (dictionnaire reconstruit à chaque appel, recherches de
+sous-chaînes imbriquées) vs matcher compilé (query_detection.py).
+
+Affiche le temps par message (µs) et la précision de chaque implémentation
+sur le jeu annoté benchmarks/data/query_detection_labels.json.
+
+    python benchmarks/bench_query_detection.py
+    python benchmarks/bench_query_detection.py --iterations 20000
+"""
+
+import os
+import json
+import time
+import argparse
+import importlib.util
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULE_PATH = os.path.join(ROOT, "app", "chat", "query_detection.py")
+LABELS_PATH = os.path.join(ROOT, "benchmarks", "data", "query_detection_labels.json")
+
+
+def _load_query_detection():
+    spec = importlib.util.spec_from_file_location("query_detection", MODULE_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# ── Ancienne implémentation (référence) ────────────────────────────────────────
+
+def legacy_detect_query_theme(user_query: str) -> dict:
+    query_lower = user_query.lower()
+    themes = {
+        'infidelite': {'keywords': ['infidèle', 'infidélité', 'trompé', 'trompe', 'tromper', 'cocufié',
+                                    'cocu', 'adultère', 'autre homme', 'autre femme', 'liaison',
+                                    'triche', 'tricherie', 'attraper', 'flagrant délit', 'pardon',
+                                    'pardonne', 'cheating', 'affair']},
+        'femme_toxique': {'keywords': ['toxique', 'manipulatrice', 'narcissique', 'instable', 'clown',
+                                       'cirque', 'dépendance', 'codépendance', 'manipulation', 'victime',
+                                       'reste', 'retourne', 'revenir']},
+        'rupture_manipulation': {'keywords': ['rupture', 'séparation', 'quitter', 'quitté', 'ex', 'cassé',
+                                              'victimisation', 'victimise', 'déresponsabilisation']},
+        'femme_doit_aimer_plus': {'keywords': ['aimer plus', 'elle m aime', 'hypergamie', 'fidélité', 'loyauté',
+                                               'engagement', 'vision', 'progression']},
+        'femme_amortie': {'keywords': ['passé', 'ex toxic', 'choix destructeur', 'qualité', 'mérite',
+                                       'buisson d épines', 'homme toxique', 'maturité', 'déclin']},
+    }
+    for theme_name, theme_data in themes.items():
+        for keyword in theme_data['keywords']:
+            if keyword in query_lower:
+                return {'theme': theme_name, 'data': theme_data}
+    return {'theme': None, 'data': None}
+
+
+def legacy_is_greeting_or_intro(user_query: str) -> bool:
+    query_lower = user_query.lower().strip()
+    greetings = [
+        'bonjour', 'salut', 'hello', 'hey', 'hi', 'bonsoir', 'coucou',
+        'qui es-tu', 'qui es tu', 'c est quoi', 'présente-toi', 'présente toi',
+        'tu es qui', 'tu fais quoi', 'what are you', 'who are you',
+        'pourquoi toi', 'pourquoi je devrais', 'quelle différence',
+        'différence avec chatgpt', 'plutot qu une autre', 'plutôt qu une autre',
+        'pourquoi pas chatgpt', 'en quoi tu es différent', 'utiliser toi',
+        'autre ia', 'autre IA', 'chatgpt', 'chat gpt'
+    ]
+    for greeting in greetings:
+        if greeting in query_lower:
+            return True
+    presentation_patterns = [
+        ('pourquoi' in query_lower and 'utiliser' in query_lower),
+        ('pourquoi' in query_lower and 'toi' in query_lower),
+        ('quelle' in query_lower and 'différence' in query_lower),
+        ('autre' in query_lower and ('ia' in query_lower or 'IA' in user_query)),
+        ('plutot' in query_lower or 'plutôt' in query_lower),
+    ]
+    if any(presentation_patterns):
+        return True
+    if len(query_lower) < 20 and any(word in query_lower for word in ['salut', 'hello', 'bonjour', 'hey', 'hi']):
+        return True
+    return False
+
+
+# ── Mesures ────────────────────────────────────────────────────────────────────
+
+def accuracy(detect_theme, is_greeting, cases):
+    theme_ok = sum(detect_theme(c["query"])["theme"] == c["theme"] for c in cases)
+    greeting_ok = sum(is_greeting(c["query"]) == c["greeting"] for c in cases)
+    return theme_ok / len(cases), greeting_ok / len(cases)
+
+
+def time_per_query_us(detect_theme, is_greeting, queries, iterations):
+    start = time.perf_counter()
+    for i in range(iterations):
+        # Messages tous distincts : pas d effet du cache de normalisation entre appels
+        query = f"{queries[i % len(queries)]} {i}"
+        # Même enchaînement que get_system_prompt
+        if not is_greeting(query):
+            detect_theme(query)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=50000)
+    args = parser.parse_args()
+
+    with open(LABELS_PATH, encoding="utf-8") as f:
+        cases = json.load(f)["cases"]
+    queries = [c["query"] for c in cases]
+    module = _load_query_detection()
+
+    implementations = [
+        ("ancienne (sous-chaînes)", legacy_detect_query_theme, legacy_is_greeting_or_intro),
+        ("matcher compilé", module.detect_query_theme, module.is_greeting_or_intro),
+    ]
+    print(f"{len(cases)} messages annotés, {args.iterations} appels")
+    print(f"{'implémentation':<26}{'µs/message':>12}{'thème':>8}{'salutation':>12}")
+    for name, detect_theme, is_greeting in implementations:
+        us = time_per_query_us(detect_theme, is_greeting, queries, args.iterations)
+        theme_acc, greeting_acc = accuracy(detect_theme, is_greeting, cases)
+        print(f"{name:<26}{us:>12.1f}{theme_acc:>8.0%}{greeting_acc:>12.0%}")
+
+
+if __name__ == "__main__":
+    main()
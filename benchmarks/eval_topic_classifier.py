@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Évaluation hors ligne du classifieur hors sujet (topic_classifier.py) : il est
+entraîné sur app/chat/data/topic_examples.json puis évalué sur un jeu distinct
+(benchmarks/data/topic_eval.json).
+
+Pour chaque seuil de confiance : précision et rappel de la classe « hors
+sujet » (une question légitime refusée est l erreur coûteuse : la précision
+doit rester à 100 %), exactitude globale et part des questions hors sujet
+servies sans appel OpenAI. Les erreurs au seuil courant sont listées.
+
+Les relances en cours de conversation (`follow_ups` : dernier échange +
+nouveau message) sont évaluées à part, message seul puis avec le dernier
+échange comme dans l application (`contextual_query`).
+
+Les modules sont chargés par chemin, sans importer app.chat.
+
+    python benchmarks/eval_topic_classifier.py
+    python benchmarks/eval_topic_classifier.py --thresholds 0.6,0.7,0.8,0.9 --backend onnx
+"""
+
+import os
+import json
+import argparse
+import importlib.util
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHAT_DIR = os.path.join(ROOT, "app", "chat")
+DEFAULT_EVAL = os.path.join(ROOT, "benchmarks", "data", "topic_eval.json")
+MODEL_NAME = "all-MiniLM-L6-v2"
+
+
+def _load(name):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(CHAT_DIR, f"{name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def scores_at(confidences, labels, threshold):
+    predicted = confidences >= threshold
+    true_pos = int(np.sum(predicted & labels))
+    false_pos = int(np.sum(predicted & ~labels))
+    return {
+        "precision": true_pos / max(true_pos + false_pos, 1),
+        "recall": true_pos / max(int(labels.sum()), 1),
+        "accuracy": float(np.mean(predicted == labels)),
+        "false_refusals": false_pos,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--eval", default=DEFAULT_EVAL, help="jeu d évaluation (on_topic / off_topic)")
+    parser.add_argument("--examples", default=None, help="exemples d entraînement (défaut : ceux de l app)")
+    parser.add_argument("--thresholds", default="0.5,0.6,0.7,0.8,0.9,0.95")
+    parser.add_argument("--threshold", type=float, default=float(os.getenv("RAG_OFFTOPIC_THRESHOLD", "0.8")),
+                        help="seuil dont les erreurs sont détaillées")
+    parser.add_argument("--backend", default=os.getenv("RAG_EMBEDDING_BACKEND", "sentence-transformers"))
+    parser.add_argument("--onnx-dir", default=os.path.join(ROOT, "app", "models", "all-MiniLM-L6-v2-onnx"))
+    args = parser.parse_args()
+
+    topic_classifier = _load("topic_classifier")
+    backend = _load("embedding_backends").create_backend(args.backend, MODEL_NAME, args.onnx_dir)
+    classifier = topic_classifier.TopicClassifier.from_examples(
+        backend.encode, args.examples or topic_classifier.EXAMPLES_PATH, threshold=args.threshold
+    )
+
+    evaluation = topic_classifier.load_examples(args.eval)
+    queries = evaluation["on_topic"] + evaluation["off_topic"]
+    labels = np.array([False] * len(evaluation["on_topic"]) + [True] * len(evaluation["off_topic"]))
+    confidences = classifier.confidences(backend.encode(queries))
+
+    print(f"{len(evaluation['on_topic'])} questions dans le sujet, {len(evaluation['off_topic'])} hors sujet "
+          f"(backend {backend.name})")
+    print(f"{'seuil':>6}{'précision':>11}{'rappel':>9}{'exactitude':>12}{'refus à tort':>14}")
+    for threshold in (float(t) for t in args.thresholds.split(",")):
+        s = scores_at(confidences, labels, threshold)
+        print(f"{threshold:>6.2f}{s['precision']:>11.0%}{s['recall']:>9.0%}{s['accuracy']:>12.0%}"
+              f"{s['false_refusals']:>14}")
+
+    print_errors(queries, confidences, labels, args.threshold)
+
+    with open(args.eval, encoding="utf-8") as f:
+        follow_ups = json.load(f).get("follow_ups", [])
+    if not follow_ups:
+        return
+    messages = [item["message"] for item in follow_ups]
+    contextual = [topic_classifier.contextual_query(item["message"], item["history"]) for item in follow_ups]
+    labels = np.array([item["off_topic"] for item in follow_ups])
+    print(f"\n{len(follow_ups)} relances en cours de conversation ({int(labels.sum())} hors sujet), "
+          f"seuil {args.threshold}")
+    print(f"{'texte classé':<24}{'précision':>11}{'rappel':>9}{'exactitude':>12}{'refus à tort':>14}")
+    for name, texts in (("message seul", messages), ("avec dernier échange", contextual)):
+        s = scores_at(classifier.confidences(backend.encode(texts)), labels, args.threshold)
+        print(f"{name:<24}{s['precision']:>11.0%}{s['recall']:>9.0%}{s['accuracy']:>12.0%}"
+              f"{s['false_refusals']:>14}")
+    print_errors(messages, classifier.confidences(backend.encode(contextual)), labels, args.threshold)
+
+
+def print_errors(queries, confidences, labels, threshold):
+    errors = [(q, c, l) for q, c, l in zip(queries, confidences, labels) if (c >= threshold) != l]
+    print(f"\nErreurs au seuil {threshold}: {len(errors)}")
+    for query, confidence, off_topic in errors:
+        kind = "non refusée" if off_topic else "refusée à tort"
+        print(f"   ❌ {kind:<15} {confidence:.2f}  {query}")
+
+
+if __name__ == "__main__":
+    main()
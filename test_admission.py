@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Contrôle d admission : 429 quand la file est pleine, 503 quand l attente
+dépasse le délai, tous deux avec Retry-After ; la place est rendue quand un
+flux (/chat/stream ou Gradio) est interrompu en cours de réponse.
+
+    pytest test_admission.py
+"""
+
+import os
+import sys
+import types
+import asyncio
+import importlib
+
+import pytest
+
+pytest.importorskip("faiss")
+pytest.importorskip("openai")
+pytest.importorskip("pypdf")
+pytest.importorskip("dotenv")
+pytest.importorskip("fastapi")
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+# app.chat/__init__ démarrerait tout le module chat (RAG, OpenAI) : le
+# paquet est déclaré sans l exécuter, seuls les sous-modules testés sont chargés
+if "app.chat" not in sys.modules:
+    _package = types.ModuleType("app.chat")
+    _package.__path__ = [os.path.join(ROOT, "app", "chat")]
+    sys.modules["app.chat"] = _package
+admission = importlib.import_module("app.chat.admission")
+services = importlib.import_module("app.chat.services")
+router = importlib.import_module("app.chat.router")
+
+# Durée moyenne de traitement initiale du contrôleur (2 s) : Retry-After =
+# ceil(2 * (requêtes en attente + 1) / max_concurrent)
+
+
+async def _hold(controller):
+    """Occupe une place jusqu à ce que l évènement renvoyé soit positionné."""
+    release = asyncio.Event()
+    acquired = asyncio.Event()
+
+    async def hold():
+        async with controller.slot():
+            acquired.set()
+            await release.wait()
+
+    task = asyncio.ensure_future(hold())
+    await acquired.wait()
+    return release, task
+
+
+def test_full_queue_is_rejected_with_429():
+    async def run():
+        controller = admission.AdmissionController(max_concurrent=1, max_queue=1, max_wait_seconds=10)
+        release, holder = await _hold(controller)
+        waiter = asyncio.ensure_future(controller.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(admission.AdmissionRejected) as rejected:
+            await controller.acquire()
+        assert rejected.value.status_code == 429
+        assert rejected.value.retry_after == 4  # 1 requête en attente
+        release.set()
+        await holder
+        await waiter  # la requête en file passe dès que la place se libère
+        controller.release(0)
+
+    asyncio.run(run())
+
+
+def test_chat_endpoint_returns_429_and_503_with_retry_after(monkeypatch):
+    async def run():
+        full = admission.AdmissionController(max_concurrent=1, max_queue=0, max_wait_seconds=10)
+        release_full, holder_full = await _hold(full)
+        monkeypatch.setattr(router, "ADMISSION", full)
+        response = await router.chat_endpoint(router.ChatRequest(message="Ma copine m a quitté"))
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "2"
+
+        slow = admission.AdmissionController(max_concurrent=1, max_queue=1, max_wait_seconds=0.01)
+        release_slow, holder_slow = await _hold(slow)
+        monkeypatch.setattr(router, "ADMISSION", slow)
+        response = await router.chat_endpoint(router.ChatRequest(message="Ma copine m a quitté"))
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "4"  # calculé avant de quitter la file
+        assert slow._waiting == 0
+
+        release_full.set()
+        release_slow.set()
+        await asyncio.gather(holder_full, holder_slow)
+
+    asyncio.run(run())
+
+
+def _blocking_stream(started):
+    """chat_stream factice : un premier fragment, puis plus rien (réponse en cours)."""
+    async def chat_stream(message, history):
+        yield "Un homme "
+        started.set()
+        await asyncio.Event().wait()
+    return chat_stream
+
+
+async def _consume_then_cancel(iterator, started):
+    """Lit le flux comme le ferait le serveur, puis l interrompt (client parti)."""
+    received = []
+
+    async def consume():
+        async for chunk in iterator:
+            received.append(chunk)
+
+    task = asyncio.ensure_future(consume())
+    await started.wait()
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    return received
+
+
+def test_stream_endpoint_releases_its_slot_when_cancelled(monkeypatch):
+    async def run():
+        controller = admission.AdmissionController(max_concurrent=1, max_queue=0, max_wait_seconds=0.01)
+        started = asyncio.Event()
+        monkeypatch.setattr(router, "ADMISSION", controller)
+        monkeypatch.setattr(router, "chat_stream", _blocking_stream(started))
+        response = await router.chat_stream_endpoint(router.ChatRequest(message="Ma copine m a quitté"))
+        received = await _consume_then_cancel(response.body_iterator, started)
+        assert received and "Un homme" in received[0]
+        assert controller._active == 0
+        async with controller.slot():  # place disponible tout de suite
+            pass
+
+    asyncio.run(run())
+
+
+def test_gradio_stream_releases_its_slot_when_cancelled(monkeypatch):
+    async def run():
+        controller = admission.AdmissionController(max_concurrent=1, max_queue=0, max_wait_seconds=0.01)
+        started = asyncio.Event()
+        monkeypatch.setattr(services, "ADMISSION", controller)
+        monkeypatch.setattr(services, "chat_stream", _blocking_stream(started))
+        received = await _consume_then_cancel(services.gradio_chat_stream("Ma copine m a quitté", []), started)
+        assert received == ["Un homme "]
+        assert controller._active == 0
+        async with controller.slot():
+            pass
+
+    asyncio.run(run())
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Historique de session sous budget : une longue conversation de messages
+courts (sous le budget de tokens) ne perd aucun message, les plus anciens
+sont résumés avant d être retirés de la session.
+
+    pytest test_chat_history.py
+"""
+
+import os
+import sys
+import types
+import asyncio
+import importlib
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+
+# app.chat/__init__ démarrerait tout le module chat (RAG, OpenAI) : le
+# paquet est déclaré sans l exécuter, seuls les sous-modules testés sont chargés
+if "app.chat" not in sys.modules:
+    _package = types.ModuleType("app.chat")
+    _package.__path__ = [os.path.join(ROOT, "app", "chat")]
+    sys.modules["app.chat"] = _package
+history = importlib.import_module("app.chat.history")
+sessions = importlib.import_module("app.chat.sessions")
+
+MAX_MESSAGES = 40
+
+
+def _store():
+    """SessionStore dont la table chat_sessions est un dict."""
+    store = sessions.SessionStore(max_messages=MAX_MESSAGES)
+    rows = {}
+
+    def write(session_id, messages, message_count):
+        row = rows.setdefault(session_id, {"summary": None, "summary_upto": 0})
+        row.update(messages=list(messages), message_count=message_count)
+
+    def write_summary(session_id, summary, summary_upto):
+        rows[session_id].update(summary=summary, summary_upto=summary_upto)
+
+    store._db_write = write
+    store._db_write_summary = write_summary
+    store._db_read = lambda session_id: None
+    return store
+
+
+def test_long_conversation_of_short_messages_is_summarized_not_lost():
+    async def run():
+        store = _store()
+        summarized = []
+
+        async def summarize(summary, messages):
+            summarized.extend(m["content"] for m in messages)
+            return f"{len(summarized)} messages résumés"
+
+        manager = history.HistoryManager(summarize, store.set_summary, max_tokens=2000,
+                                         max_messages=MAX_MESSAGES)
+        session_id = store.create()
+        for turn in range(60):
+            session = await store.load(session_id)
+            compacted = manager.compact(session.messages, session.offset, session.summary, session.summary_upto)
+            assert compacted.dropped == 0  # messages courts : le budget tient toujours
+            if compacted.summarize_upto is not None:
+                manager.schedule_summary(session_id, session.messages, session.offset, session.summary,
+                                         session.summary_upto, compacted.summarize_upto)
+                await asyncio.gather(*manager._tasks.values())
+            await store.append(session_id, [
+                {"role": "user", "content": f"question {turn}"},
+                {"role": "assistant", "content": f"réponse {turn}"},
+            ])
+            session = await store.load(session_id)
+            # Tout message retiré de la session est couvert par le résumé
+            assert session.offset <= session.summary_upto or session.offset == 0
+
+        session = await store.load(session_id)
+        assert session.offset > 0
+        assert len(session.messages) <= MAX_MESSAGES + MAX_MESSAGES // 2
+        kept = [m["content"] for m in session.messages[session.summary_upto - session.offset:]]
+        assert summarized + kept == [text for turn in range(60)
+                                     for text in (f"question {turn}", f"réponse {turn}")]
+
+    asyncio.run(run())
+
+
+def test_session_stays_bounded_when_summaries_keep_failing():
+    async def run():
+        store = _store()
+        session_id = store.create()
+        for turn in range(200):
+            await store.append(session_id, [{"role": "user", "content": f"question {turn}"}])
+        session = await store.load(session_id)
+        assert len(session.messages) == store.max_unsummarized_messages
+
+    asyncio.run(run())
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Coalescence des requêtes identiques (SingleFlight) : des requêtes
+simultanées de même clé ne font qu un appel, un échec parvient à toutes et
+n est pas gardé (la requête suivante relance l appel).
+
+    pytest test_coalescing.py
+"""
+
+import os
+import sys
+import types
+import asyncio
+import importlib
+
+import pytest
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+
+# app.chat/__init__ démarrerait tout le module chat (RAG, OpenAI) : le
+# paquet est déclaré sans l exécuter, seuls les sous-modules testés sont chargés
+if "app.chat" not in sys.modules:
+    _package = types.ModuleType("app.chat")
+    _package.__path__ = [os.path.join(ROOT, "app", "chat")]
+    sys.modules["app.chat"] = _package
+coalescing = importlib.import_module("app.chat.coalescing")
+
+
+class _Upstream:
+    """Appel amont compté, qui attend `release` avant de répondre (ou d échouer)."""
+
+    def __init__(self, error=None):
+        self.calls = 0
+        self.error = error
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        await self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return f"réponse {self.calls}"
+
+
+async def _start(flight, key, upstream, count):
+    """`count` requêtes simultanées, toutes en attente avant que l amont réponde."""
+    tasks = [asyncio.ensure_future(flight.run(key, upstream)) for _ in range(count)]
+    await asyncio.sleep(0)
+    return tasks
+
+
+def test_concurrent_identical_requests_make_a_single_upstream_call():
+    async def run():
+        flight = coalescing.SingleFlight()
+        upstream = _Upstream()
+        other = _Upstream()
+        tasks = await _start(flight, "bonjour", upstream, 10)
+        others = await _start(flight, "salut", other, 2)
+        upstream.release.set()
+        other.release.set()
+        assert await asyncio.gather(*tasks) == ["réponse 1"] * 10
+        assert await asyncio.gather(*others) == ["réponse 1"] * 2
+        assert upstream.calls == 1 and other.calls == 1
+
+        # Exécution terminée : la requête suivante n est pas servie par elle
+        assert await flight.run("bonjour", upstream) == "réponse 2"
+        assert upstream.calls == 2
+
+    asyncio.run(run())
+
+
+def test_failure_reaches_every_waiter_and_is_not_cached():
+    async def run():
+        flight = coalescing.SingleFlight()
+        upstream = _Upstream(error=RuntimeError("OpenAI indisponible"))
+        tasks = await _start(flight, "bonjour", upstream, 5)
+        upstream.release.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        assert upstream.calls == 1
+        assert all(isinstance(result, RuntimeError) for result in results)
+
+        upstream.error = None
+        assert await flight.run("bonjour", upstream) == "réponse 2"
+        assert upstream.calls == 2
+
+    asyncio.run(run())
+
+
+def test_cancelled_waiter_does_not_cancel_the_others():
+    async def run():
+        flight = coalescing.SingleFlight()
+        upstream = _Upstream()
+        first, second = await _start(flight, "bonjour", upstream, 2)
+        first.cancel()
+        await asyncio.sleep(0)
+        upstream.release.set()
+        assert await second == "réponse 1"
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+    asyncio.run(run())
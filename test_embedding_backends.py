@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Parité des backends d embedding ONNX avec le backend sentence-transformers
+(PyTorch) : mêmes scores cosinus, même classement des passages.
+
+Nécessite sentence-transformers, onnxruntime et un modèle exporté :
+
+    python -m app.chat.embedding_backends export app/models/all-MiniLM-L6-v2-onnx
+    pytest test_embedding_backends.py
+"""
+
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# Ajouter le répertoire parent au path pour les imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+pytest.importorskip("sentence_transformers")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("tokenizers")
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+ONNX_MODEL_DIR = Path(os.getenv(
+    "RAG_ONNX_MODEL_DIR",
+    Path(__file__).resolve().parent / "app" / "models" / "all-MiniLM-L6-v2-onnx",
+))
+
+QUERIES = [
+    "Comment réagir après une rupture ?",
+    "Elle ne répond plus à mes messages",
+    "Qu est-ce que l hypergamie ?",
+    "Comment poser un cadre dans la relation",
+    "bonjour",
+]
+PASSAGES = [
+    "Après une rupture, coupe le contact et reconstruis ta mission avant de chercher à la reconquérir.",
+    "Le silence d une femme est souvent un test : ne réagis pas dans l émotion.",
+    "L hypergamie désigne la tendance à rechercher un partenaire de statut supérieur.",
+    "Un homme qui pose des limites claires inspire respect et attraction.",
+    "La discipline quotidienne construit la confiance en soi.",
+]
+
+# Seuils de cosinus minimal entre un vecteur PyTorch et son équivalent ONNX
+MIN_COSINE = {"onnx": 0.999, "onnx-int8": 0.98}
+
+
+@pytest.fixture(scope="module")
+def reference():
+    from app.chat.embedding_backends import SentenceTransformerBackend
+    return SentenceTransformerBackend(MODEL_NAME)
+
+
+@pytest.fixture(scope="module", params=["onnx", "onnx-int8"])
+def candidate(request):
+    from app.chat.embedding_backends import create_backend
+    try:
+        return create_backend(request.param, MODEL_NAME, ONNX_MODEL_DIR)
+    except FileNotFoundError as e:
+        pytest.skip(str(e))
+
+
+def test_same_dimension(reference, candidate):
+    assert candidate.dimension == reference.dimension
+
+
+def test_embeddings_are_normalized(candidate):
+    vectors = candidate.encode(QUERIES + PASSAGES)
+    assert vectors.dtype == np.float32
+    np.testing.assert_allclose(np.linalg.norm(vectors, axis=1), 1.0, atol=1e-4)
+
+
+def test_cosine_parity(reference, candidate):
+    texts = QUERIES + PASSAGES
+    cosines = (reference.encode(texts) * candidate.encode(texts)).sum(axis=1)
+    assert cosines.min() >= MIN_COSINE[candidate.name], dict(zip(texts, cosines.round(5)))
+
+
+def test_retrieval_scores_and_ranking(reference, candidate):
+    expected = reference.encode(QUERIES) @ reference.encode(PASSAGES).T
+    actual = candidate.encode(QUERIES) @ candidate.encode(PASSAGES).T
+    tolerance = 0.01 if candidate.name == "onnx" else 0.05
+    assert np.abs(expected - actual).max() <= tolerance
+    assert (expected.argmax(axis=1) == actual.argmax(axis=1)).all()
+
+
+def test_padding_does_not_change_embeddings(candidate):
+    """Un texte encodé seul ou dans un lot avec un texte plus long donne le même vecteur."""
+    alone = candidate.encode([QUERIES[4]])
+    batched = candidate.encode([QUERIES[4], PASSAGES[0]])[:1]
+    np.testing.assert_allclose(alone, batched, atol=1e-4)
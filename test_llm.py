@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Appels OpenAI résilients (ResilientLLM) avec un faux client : le disjoncteur
+passe open → half_open → closed, le hedging annule la requête perdante et les
+reprises respectent l en-tête Retry-After.
+
+    pytest test_llm.py
+"""
+
+import os
+import sys
+import types
+import asyncio
+import importlib
+from types import SimpleNamespace
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+openai = pytest.importorskip("openai")
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+
+# app.chat/__init__ démarrerait tout le module chat (RAG, OpenAI) : le
+# paquet est déclaré sans l exécuter, seuls les sous-modules testés sont chargés
+if "app.chat" not in sys.modules:
+    _package = types.ModuleType("app.chat")
+    _package.__path__ = [os.path.join(ROOT, "app", "chat")]
+    sys.modules["app.chat"] = _package
+llm = importlib.import_module("app.chat.llm")
+
+
+def _client(create):
+    """Faux client OpenAI : seul chat.completions.create est appelé."""
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+def _error(status_code, headers=None):
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(status_code, headers=headers or {}, request=request)
+    if status_code == 429:
+        return openai.RateLimitError("rate limited", response=response, body=None)
+    return openai.InternalServerError("server error", response=response, body=None)
+
+
+def test_breaker_opens_then_lets_one_probe_through_and_closes():
+    async def run():
+        calls = []
+        fail = True
+
+        async def create(**kwargs):
+            calls.append(kwargs)
+            if fail:
+                raise _error(500)
+            return "ok"
+
+        breaker = llm.CircuitBreaker(failure_threshold=2, reset_seconds=30)
+        client = llm.ResilientLLM(_client(create), max_attempts=1, breaker=breaker)
+        for _ in range(2):
+            with pytest.raises(openai.InternalServerError):
+                await client.create(model="m")
+        assert breaker.state == "open"
+
+        # Ouvert : échec immédiat, OpenAI n est pas appelé
+        with pytest.raises(llm.CircuitOpenError):
+            await client.create(model="m")
+        assert len(calls) == 2
+
+        # Délai écoulé : une seule requête d essai à la fois
+        breaker.opened_at -= breaker.reset_seconds
+        assert breaker.allow()
+        assert breaker.state == "half_open"
+        assert not breaker.allow()
+        breaker.release_probe()
+
+        fail = False
+        assert await client.create(model="m") == "ok"
+        assert breaker.state == "closed" and breaker.failures == 0
+        assert await client.create(model="m") == "ok"
+
+    asyncio.run(run())
+
+
+def test_failed_probe_reopens_the_breaker():
+    async def run():
+        async def create(**kwargs):
+            raise _error(500)
+
+        breaker = llm.CircuitBreaker(failure_threshold=1, reset_seconds=30)
+        client = llm.ResilientLLM(_client(create), max_attempts=1, breaker=breaker)
+        with pytest.raises(openai.InternalServerError):
+            await client.create(model="m")
+        breaker.opened_at -= breaker.reset_seconds
+        with pytest.raises(openai.InternalServerError):
+            await client.create(model="m")  # requête d essai
+        assert breaker.state == "open"
+        with pytest.raises(llm.CircuitOpenError):
+            await client.create(model="m")
+
+    asyncio.run(run())
+
+
+def test_hedge_returns_the_fastest_response_and_cancels_the_other():
+    async def run():
+        cancelled = []
+        calls = 0
+
+        async def create(**kwargs):
+            nonlocal calls
+            calls += 1
+            if calls == 1:
+                try:
+                    await asyncio.sleep(60)  # requête bloquée
+                except asyncio.CancelledError:
+                    cancelled.append("primary")
+                    raise
+            return f"réponse {calls}"
+
+        client = llm.ResilientLLM(_client(create), hedge=True, hedge_min_delay=0.01)
+        assert await client.create(model="m") == "réponse 2"
+        await asyncio.sleep(0)  # laisse l annulation aboutir
+        assert calls == 2
+        assert cancelled == ["primary"]
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("headers, expected", [
+    ({"retry-after": "3"}, 3.0),
+    ({"retry-after-ms": "1500"}, 1.5),
+])
+def test_retry_waits_at_least_retry_after(monkeypatch, headers, expected):
+    async def run():
+        sleeps = []
+        attempts = 0
+
+        async def fake_sleep(delay):
+            sleeps.append(delay)
+
+        async def create(**kwargs):
+            nonlocal attempts
+            attempts += 1
+            if attempts == 1:
+                raise _error(429, headers)
+            return "ok"
+
+        monkeypatch.setattr(llm.asyncio, "sleep", fake_sleep)
+        client = llm.ResilientLLM(_client(create), backoff_base=0.01, max_attempts=3)
+        assert await client.create(model="m") == "ok"
+        assert attempts == 2
+        assert sleeps == [expected]
+
+    asyncio.run(run())
+
+
+def test_retry_after_beyond_the_budget_is_not_awaited(monkeypatch):
+    async def run():
+        sleeps = []
+
+        async def fake_sleep(delay):
+            sleeps.append(delay)
+
+        async def create(**kwargs):
+            raise _error(429, {"retry-after": "120"})
+
+        monkeypatch.setattr(llm.asyncio, "sleep", fake_sleep)
+        client = llm.ResilientLLM(_client(create), total_timeout=45, max_attempts=3)
+        with pytest.raises(openai.RateLimitError):
+            await client.create(model="m")
+        assert sleeps == []
+
+    asyncio.run(run())
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Précision de la détection de thème et de salutation sur le jeu annoté
+benchmarks/data/query_detection_labels.json, et propriétés du matcher
+(mots entiers, accents, correspondances imbriquées).
+
+    pytest test_query_detection.py
+"""
+
+import os
+import json
+import importlib.util
+
+import pytest
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+LABELS_PATH = os.path.join(ROOT, "benchmarks", "data", "query_detection_labels.json")
+
+# Chargé par chemin : importer app.chat démarrerait tout le module chat
+_spec = importlib.util.spec_from_file_location(
+    "query_detection", os.path.join(ROOT, "app", "chat", "query_detection.py")
+)
+query_detection = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(query_detection)
+
+with open(LABELS_PATH, encoding="utf-8") as f:
+    CASES = json.load(f)["cases"]
+
+
+@pytest.mark.parametrize("case", CASES, ids=[c["query"][:40] for c in CASES])
+def test_labelled_theme(case):
+    assert query_detection.detect_query_theme(case["query"])["theme"] == case["theme"]
+
+
+@pytest.mark.parametrize("case", CASES, ids=[c["query"][:40] for c in CASES])
+def test_labelled_greeting(case):
+    assert query_detection.is_greeting_or_intro(case["query"]) is case["greeting"]
+
+
+def test_matches_whole_words_only():
+    matcher = query_detection.PhraseMatcher([("hi", "hi"), ("ex", "ex")])
+    assert matcher.labels("this is an example") == set()
+    assert matcher.labels("hi, mon ex") == {"hi", "ex"}
+
+
+def test_folds_accents_case_and_punctuation():
+    matcher = query_detection.PhraseMatcher([("présente-toi", "intro"), ("séparé*", "separation")])
+    assert matcher.labels("PRESENTE TOI !") == {"intro"}
+    assert matcher.labels("on s'est séparés") == {"separation"}
+
+
+def test_returns_nested_and_overlapping_matches():
+    matcher = query_detection.PhraseMatcher([("ex", "a"), ("ex toxi*", "b"), ("toxique", "c")])
+    found = [(m.label, m.start, m.end) for m in matcher.find_all("mon ex toxique")]
+    assert found == [("a", 1, 2), ("b", 1, 3), ("c", 2, 3)]
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Chargement et resynchronisation du RAG : un document dont le texte devient
+vide n est plus interrogé, sans attendre un redémarrage ; deux documents au
+même identifiant ne s écrasent pas l un l autre ; un chargement en échec
+n est pas relancé à chaque requête.
+
+    pytest test_rag_sync.py
+"""
+
+import os
+import sys
+import types
+import asyncio
+import hashlib
+import importlib
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+pytest.importorskip("faiss")
+pytest.importorskip("openai")
+pytest.importorskip("pypdf")
+pytest.importorskip("dotenv")
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+# app.chat/__init__ démarrerait tout le module chat : seul dependencies est chargé
+if "app.chat" not in sys.modules:
+    _package = types.ModuleType("app.chat")
+    _package.__path__ = [os.path.join(ROOT, "app", "chat")]
+    sys.modules["app.chat"] = _package
+dependencies = importlib.import_module("app.chat.dependencies")
+
+DIMENSION = 16
+
+
+def _encode(texts):
+    """Vecteurs déterministes (hash du texte) : pas de modèle d embedding."""
+    vectors = np.stack([
+        np.frombuffer(hashlib.sha256(text.encode()).digest()[:DIMENSION], dtype=np.uint8).astype("float32")
+        for text in texts
+    ])
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _rag(document_dir, shards_dir):
+    rag = dependencies.SimpleRAG.__new__(dependencies.SimpleRAG)
+    rag.document_dir, rag.shards_dir, rag.shards = document_dir, shards_dir, {}
+    rag.embedding_backend = SimpleNamespace(model_id="test-hash")
+    rag.encode_documents = _encode
+    return rag
+
+
+def test_emptied_document_is_removed_from_search(tmp_path):
+    documents, shards = tmp_path / "documents", tmp_path / "shards"
+    documents.mkdir()
+    path = documents / "guide.txt"
+    path.write_text(" ".join(f"mot{i}" for i in range(300)), encoding="utf-8")
+    rag = _rag(documents, shards)
+
+    dependencies.sync_rag_index(rag)
+    assert rag.shards["guide"].size > 0
+    assert rag.search_lexical("mot42", top_k=3)
+
+    path.write_text("", encoding="utf-8")
+    result = dependencies.sync_rag_index(rag)
+    assert result["status"] == "rebuilt"
+    assert "guide" not in rag.shards
+    assert rag.search_lexical("mot42", top_k=3) == []
+
+
+def test_documents_with_the_same_id_do_not_overwrite_each_other(tmp_path):
+    documents, shards = tmp_path / "documents", tmp_path / "shards"
+    documents.mkdir()
+    (documents / "Guide Été.txt").write_text(" ".join(f"premier{i}" for i in range(300)), encoding="utf-8")
+    (documents / "guide-ete.txt").write_text(" ".join(f"second{i}" for i in range(300)), encoding="utf-8")
+    rag = _rag(documents, shards)
+
+    first = dependencies.sync_rag_index(rag)
+    errors = [r for r in first["shards"] if r["status"] == "error"]
+    assert [r["source"] for r in errors] == ["guide-ete.txt"]
+    assert list(rag.shards) == ["guide-ete"]
+    assert rag.shards["guide-ete"].source_path.endswith("Guide Été.txt")
+
+    # Pas d aller-retour : la synchronisation suivante ne réindexe rien
+    second = dependencies.sync_rag_index(rag)
+    assert [r["status"] for r in second["shards"]] == ["error", "up_to_date"]
+    assert second["status"] == "up_to_date"
+
+
+def test_failed_load_is_not_retried_on_every_request(monkeypatch):
+    loads = []
+
+    def broken_index():
+        loads.append(1)
+        raise RuntimeError("index illisible")
+
+    monkeypatch.setattr(dependencies, "initialize_rag", broken_index)
+
+    async def run():
+        loader = dependencies.RAGLoader(retry_base=60, retry_max=600)
+        assert await loader.wait() is None
+        assert loader.state == "failed"
+        # Requêtes suivantes pendant le délai : pas de nouveau chargement
+        assert await loader.wait() is None
+        assert await loader.wait() is None
+        assert len(loads) == 1
+        assert loader.status()["retry_in_seconds"] > 0
+        # Relance explicite (/rag/refresh) : immédiate, délai doublé ensuite
+        await loader.start(force=True)
+        assert len(loads) == 2
+        assert loader.status()["retry_in_seconds"] > 60
+
+    asyncio.run(run())
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Prompt système : le préfixe statique (persona, règles, exemples) doit faire au
+moins 1024 tokens à lui seul, sinon OpenAI ne le met jamais en cache.
+
+    pytest test_system_prompt.py
+"""
+
+import os
+import sys
+import types
+import importlib
+
+import pytest
+
+pytest.importorskip("faiss")
+pytest.importorskip("openai")
+pytest.importorskip("pypdf")
+pytest.importorskip("dotenv")
+tiktoken = pytest.importorskip("tiktoken")
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+# app.chat/__init__ démarrerait tout le module chat : seul dependencies est chargé
+if "app.chat" not in sys.modules:
+    _package = types.ModuleType("app.chat")
+    _package.__path__ = [os.path.join(ROOT, "app", "chat")]
+    sys.modules["app.chat"] = _package
+dependencies = importlib.import_module("app.chat.dependencies")
+context_packing = importlib.import_module("app.chat.context_packing")
+
+# Seuil à partir duquel OpenAI met en cache le préfixe d un prompt
+PROMPT_CACHE_MIN_TOKENS = 1024
+
+
+def test_static_prefix_is_long_enough_for_prompt_caching():
+    try:
+        encoding = tiktoken.get_encoding(context_packing.TOKEN_ENCODING)
+    except Exception as exc:  # encodage téléchargé au premier usage
+        pytest.skip(f"encodage {context_packing.TOKEN_ENCODING} indisponible : {exc}")
+    assert len(encoding.encode(dependencies.SYSTEM_PROMPT_PREFIX)) >= PROMPT_CACHE_MIN_TOKENS
+